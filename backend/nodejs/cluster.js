@@ -0,0 +1,217 @@
+/**
+ * 集群模式入口：启动多个 server.js 工作进程共享同一个端口
+ *
+ * 主进程只负责：
+ *   - 维护全局的Python解析进程池（所有工作进程共享，单个工作进程另有上限）
+ *   - 在工作进程之间转发任务状态、文件索引和指标
+ *   - 把Socket.IO事件只转发给客户端连接所在的工作进程
+ *   - 工作进程退出时回收其占用的解析进程并重新启动
+ *
+ * 环境变量：
+ *   CLUSTER_WORKERS      工作进程数，默认CPU核数
+ *   PARSER_POOL_SIZE     同时运行的解析进程总数，默认CPU核数
+ *   PARSER_WORKER_LIMIT  单个工作进程同时运行的解析进程数，默认等于PARSER_POOL_SIZE
+ */
+
+const cluster = require("cluster");
+const os = require("os");
+const path = require("path");
+
+const WORKER_COUNT =
+    parseInt(process.env.CLUSTER_WORKERS, 10) || os.cpus().length;
+const POOL_SIZE =
+    parseInt(process.env.PARSER_POOL_SIZE, 10) || os.cpus().length;
+const WORKER_LIMIT = parseInt(process.env.PARSER_WORKER_LIMIT, 10) || POOL_SIZE;
+
+// 解析进程池：排队中的请求（先到先得）和每个工作进程正在运行的任务
+const pending = [];
+const running = new Map();
+let runningCount = 0;
+let shuttingDown = false;
+// 负责恢复任务日志的工作进程是否已经完成恢复（发出ready）
+let recovered = false;
+// Socket.IO客户端ID -> 连接所在的工作进程ID
+const socketWorkers = new Map();
+
+function runningOf(workerId) {
+    let tasks = running.get(workerId);
+    if (!tasks) {
+        tasks = new Set();
+        running.set(workerId, tasks);
+    }
+    return tasks;
+}
+
+// 按顺序给排队的请求分配空位，跳过已达到单进程上限的工作进程
+function grantSlots() {
+    for (let i = 0; i < pending.length && runningCount < POOL_SIZE; ) {
+        const { workerId, taskId } = pending[i];
+        const tasks = runningOf(workerId);
+        if (tasks.size >= WORKER_LIMIT) {
+            i++;
+            continue;
+        }
+        pending.splice(i, 1);
+        tasks.add(taskId);
+        runningCount++;
+        const worker = cluster.workers[workerId];
+        if (worker) {
+            worker.send({ type: "pool:granted", taskId: taskId });
+        }
+    }
+}
+
+function releaseSlot(workerId, taskId) {
+    const tasks = runningOf(workerId);
+    if (tasks.delete(taskId)) {
+        runningCount--;
+        grantSlots();
+    }
+}
+
+// 取消排队中的请求；已经分配了空位时（消息交错）按释放处理
+function cancelSlot(workerId, taskId) {
+    const index = pending.findIndex(
+        (item) => item.workerId === workerId && item.taskId === taskId
+    );
+    if (index >= 0) {
+        pending.splice(index, 1);
+        return;
+    }
+    releaseSlot(workerId, taskId);
+}
+
+function forkWorker(recover) {
+    const worker = cluster.fork({
+        PARSER_POOL_SIZE: String(POOL_SIZE),
+        TASK_JOURNAL_RECOVER: recover ? "1" : "0",
+    });
+
+    worker.on("message", (msg) => {
+        switch (msg.type) {
+            case "pool:acquire":
+                pending.push({ workerId: worker.id, taskId: msg.taskId });
+                grantSlots();
+                break;
+            case "pool:release":
+                releaseSlot(worker.id, msg.taskId);
+                break;
+            case "pool:cancel":
+                cancelSlot(worker.id, msg.taskId);
+                break;
+            case "ready":
+                // 恢复完成后再启动其余进程，避免它们读到压缩中的日志；负责恢复的进程在ready之前
+                // 退出时由替换它的进程继续恢复，其余进程在那时才启动
+                if (recover && !recovered) {
+                    recovered = true;
+                    forkRemainingWorkers();
+                }
+                break;
+            case "socket:connect":
+                socketWorkers.set(msg.socketId, worker.id);
+                break;
+            case "socket:disconnect":
+                if (socketWorkers.get(msg.socketId) === worker.id) {
+                    socketWorkers.delete(msg.socketId);
+                }
+                break;
+            case "emit": {
+                // 客户端已断开时丢弃
+                const owner = cluster.workers[socketWorkers.get(msg.socketId)];
+                if (owner && owner.isConnected()) {
+                    owner.send({
+                        type: "relay",
+                        message: {
+                            kind: "emit",
+                            socketId: msg.socketId,
+                            event: msg.event,
+                            data: msg.data,
+                        },
+                    });
+                }
+                break;
+            }
+            case "relay":
+                for (const other of Object.values(cluster.workers)) {
+                    if (other && other.id !== worker.id && other.isConnected()) {
+                        other.send({ type: "relay", message: msg.message });
+                    }
+                }
+                break;
+        }
+    });
+
+    return worker;
+}
+
+function forkRemainingWorkers() {
+    for (let i = Object.keys(cluster.workers).length; i < WORKER_COUNT; i++) {
+        forkWorker(false);
+    }
+}
+
+// 工作进程退出：回收它的空位和排队请求，让其他工作进程把它的任务标记为失败
+function handleExit(worker, code, signal) {
+    const orphaned = [...runningOf(worker.id)];
+    runningCount -= orphaned.length;
+    running.delete(worker.id);
+    for (const [socketId, workerId] of socketWorkers) {
+        if (workerId === worker.id) {
+            socketWorkers.delete(socketId);
+        }
+    }
+    for (let i = pending.length - 1; i >= 0; i--) {
+        if (pending[i].workerId === worker.id) {
+            orphaned.push(pending[i].taskId);
+            pending.splice(i, 1);
+        }
+    }
+
+    if (shuttingDown) {
+        if (Object.keys(cluster.workers).length === 0) {
+            process.exit(0);
+        }
+        return;
+    }
+
+    console.log(
+        `工作进程 ${worker.process.pid} 退出 (${signal || code})，重新启动`
+    );
+    const survivor = Object.values(cluster.workers).find(
+        (other) => other && other.isConnected()
+    );
+    if (survivor && orphaned.length > 0) {
+        survivor.send({ type: "tasks:orphaned", taskIds: orphaned });
+    }
+    grantSlots();
+    // 恢复完成之前退出的只可能是负责恢复的进程，替换它的进程继续恢复
+    forkWorker(!recovered);
+}
+
+function shutdown() {
+    if (shuttingDown) {
+        return;
+    }
+    shuttingDown = true;
+    console.log("正在关闭集群...");
+    const workers = Object.values(cluster.workers);
+    if (workers.length === 0) {
+        process.exit(0);
+    }
+    // 工作进程收到SIGINT后写完任务日志再退出
+    for (const worker of workers) {
+        worker.process.kill("SIGINT");
+    }
+}
+
+cluster.setupPrimary({ exec: path.join(__dirname, "server.js") });
+cluster.on("exit", handleExit);
+process.on("SIGINT", shutdown);
+process.on("SIGTERM", shutdown);
+
+console.log(
+    `集群模式: ${WORKER_COUNT} 个工作进程，解析进程池 ${POOL_SIZE}（单进程上限 ${WORKER_LIMIT}）`
+);
+
+// 第一个工作进程负责恢复任务日志，恢复完成（ready）后再启动其余进程
+forkWorker(true);
@@ -0,0 +1,374 @@
+// 结果文件的列表分页和下载，server.js 使用，单独成文件以便测试（test/files.test.js）
+const path = require("path");
+const fs = require("fs");
+const util = require("util");
+const zlib = require("zlib");
+const { pipeline } = require("stream");
+
+// 解析结果只保存在分块存储中时，结果文件 x.md 只有清单 x.chunks.json
+const MANIFEST_SUFFIX = ".chunks.json";
+
+// 按排序字段比较，字段相同时按文件名，保证顺序唯一
+function compareFiles(key, a, b) {
+    if (a[key] !== b[key]) {
+        return a[key] < b[key] ? -1 : 1;
+    }
+    if (a.name !== b.name) {
+        return a.name < b.name ? -1 : 1;
+    }
+    return 0;
+}
+
+// 二分查找第一个不小于probe（strict为true时大于probe）的位置
+function searchFiles(list, key, probe, strict) {
+    let low = 0;
+    let high = list.length;
+    while (low < high) {
+        const mid = (low + high) >>> 1;
+        const cmp = compareFiles(key, list[mid], probe);
+        if (cmp < 0 || (strict && cmp === 0)) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    return low;
+}
+
+// 按cursor取出一页文件。list按key升序排列，order为asc或desc；
+// cursor记录上一页最后一个文件的排序值和文件名，据此二分定位下一页的起点，列表在翻页期间变化时也不会重复或遗漏。
+// 返回 { files, nextCursor }，没有更多时nextCursor为null；cursor无效时返回null
+function pageFiles(list, key, order, limit, cursor) {
+    let start = order === "asc" ? 0 : list.length - 1;
+    if (cursor) {
+        let probe;
+        try {
+            const [value, name] = JSON.parse(
+                Buffer.from(cursor, "base64url").toString("utf8")
+            );
+            probe = { [key]: value, name: name };
+        } catch (err) {
+            return null;
+        }
+        start =
+            order === "asc"
+                ? searchFiles(list, key, probe, true)
+                : searchFiles(list, key, probe, false) - 1;
+    }
+
+    const step = order === "asc" ? 1 : -1;
+    const files = [];
+    for (
+        let i = start;
+        i >= 0 && i < list.length && files.length < limit;
+        i += step
+    ) {
+        files.push(list[i]);
+    }
+    const next = start + step * files.length;
+    const last = files[files.length - 1];
+    return {
+        files: files,
+        nextCursor:
+            last && next >= 0 && next < list.length
+                ? Buffer.from(JSON.stringify([last[key], last.name])).toString(
+                      "base64url"
+                  )
+                : null,
+    };
+}
+
+// 结果文件对应的清单路径：x.md -> x.chunks.json
+function manifestPathOf(resultPath) {
+    return resultPath.replace(/\.md$/, "") + MANIFEST_SUFFIX;
+}
+
+// 读取清单，返回页面哈希和结果文件的信息：大小取清单中记录的Markdown字节数，时间取清单文件的
+async function readManifest(manifestPath) {
+    const [content, stats] = await Promise.all([
+        fs.promises.readFile(manifestPath, "utf8"),
+        fs.promises.stat(manifestPath),
+    ]);
+    const manifest = JSON.parse(content);
+    return {
+        page: manifest.page,
+        stats: {
+            size: manifest.size || 0,
+            birthtimeMs: stats.birthtimeMs,
+            mtimeMs: stats.mtimeMs,
+            mtime: stats.mtime,
+        },
+    };
+}
+
+// 结果文件的Content-Type
+const CONTENT_TYPES = {
+    ".md": "text/markdown; charset=utf-8",
+    ".folded": "text/plain; charset=utf-8",
+    ".prof": "application/octet-stream",
+};
+
+// 预压缩版本，按优先级排列
+const PRECOMPRESSED_VARIANTS = [
+    { encoding: "br", extension: ".br" },
+    { encoding: "gzip", extension: ".gz" },
+];
+
+// 小于该大小的文件不生成预压缩版本
+const PRECOMPRESS_MIN_SIZE = 1024;
+
+// 生成单个预压缩文件，先写临时文件再改名，避免读到写了一半的文件
+function compressFile(source, encoding, extension) {
+    return new Promise((resolve, reject) => {
+        const target = source + extension;
+        const tempTarget = `${target}.tmp`;
+        const compressor =
+            encoding === "br"
+                ? zlib.createBrotliCompress({
+                      params: {
+                          [zlib.constants.BROTLI_PARAM_MODE]:
+                              zlib.constants.BROTLI_MODE_TEXT,
+                      },
+                  })
+                : zlib.createGzip({ level: 9 });
+        pipeline(
+            fs.createReadStream(source),
+            compressor,
+            fs.createWriteStream(tempTarget),
+            (err) => {
+                if (err) {
+                    fs.unlink(tempTarget, () => reject(err));
+                    return;
+                }
+                fs.rename(tempTarget, target, (renameErr) =>
+                    renameErr ? reject(renameErr) : resolve(target)
+                );
+            }
+        );
+    });
+}
+
+// 解析完成后生成一次gzip/brotli预压缩版本，之后的下载直接发送压缩文件
+async function precompressFile(filePath) {
+    const stats = await fs.promises.stat(filePath);
+    if (stats.size < PRECOMPRESS_MIN_SIZE) {
+        return;
+    }
+    await Promise.all(
+        PRECOMPRESSED_VARIANTS.map(({ encoding, extension }) =>
+            compressFile(filePath, encoding, extension)
+        )
+    );
+}
+
+// 解析Range请求头，只支持单个范围，返回 { start, end }、null(无Range) 或 false(无法满足)
+function parseRange(header, size) {
+    if (!header) {
+        return null;
+    }
+    const match = /^bytes=(\d*)-(\d*)$/.exec(header.trim());
+    if (!match || (match[1] === "" && match[2] === "")) {
+        return false;
+    }
+    let start;
+    let end;
+    if (match[1] === "") {
+        // bytes=-N 表示最后N个字节
+        start = Math.max(size - parseInt(match[2], 10), 0);
+        end = size - 1;
+    } else {
+        start = parseInt(match[1], 10);
+        end = match[2] === "" ? size - 1 : Math.min(parseInt(match[2], 10), size - 1);
+    }
+    if (start > end || start >= size) {
+        return false;
+    }
+    return { start, end };
+}
+
+// 选择客户端接受的预压缩版本
+async function findPrecompressed(filePath, acceptEncoding) {
+    if (!acceptEncoding) {
+        return null;
+    }
+    for (const variant of PRECOMPRESSED_VARIANTS) {
+        if (!new RegExp(`\\b${variant.encoding}\\b`).test(acceptEncoding)) {
+            continue;
+        }
+        try {
+            const stats = await fs.promises.stat(filePath + variant.extension);
+            return { ...variant, stats };
+        } catch (err) {
+            // 该版本尚未生成
+        }
+    }
+    return null;
+}
+
+// 设置结果文件的响应头
+function setResultHeaders(res, filePath, etag, mtime) {
+    res.setHeader(
+        "Content-Type",
+        CONTENT_TYPES[path.extname(filePath)] || "application/octet-stream"
+    );
+    res.setHeader("ETag", etag);
+    res.setHeader("Last-Modified", mtime.toUTCString());
+    res.setHeader("Accept-Ranges", "bytes");
+    res.setHeader("Vary", "Accept-Encoding");
+    res.setHeader("Cache-Control", "no-cache");
+}
+
+// If-None-Match 是否与当前版本（或未压缩的版本）匹配
+function isNotModified(req, etag, baseTag) {
+    const ifNoneMatch = req.headers["if-none-match"];
+    return Boolean(
+        ifNoneMatch &&
+            ifNoneMatch.split(",").some((tag) => {
+                tag = tag.trim().replace(/^W\//, "");
+                return tag === "*" || tag === etag || tag === `"${baseTag}"`;
+            })
+    );
+}
+
+const gzipAsync = util.promisify(zlib.gzip);
+
+// 发送只有清单的结果：由readChunked(清单路径)从分块存储还原后发送。ETag取页面的哈希，校验通过时不读取分块存储；
+// 没有预压缩版本，客户端接受gzip且不是Range请求时即时压缩
+async function sendChunkedResult(req, res, filePath, readChunked) {
+    const manifestPath = manifestPathOf(filePath);
+    const { page, stats } = await readManifest(manifestPath);
+    const baseTag = page.slice(0, 32);
+    const rangeHeader = req.headers.range;
+    const gzip =
+        !rangeHeader &&
+        stats.size >= PRECOMPRESS_MIN_SIZE &&
+        /\bgzip\b/.test(req.headers["accept-encoding"] || "");
+    const etag = gzip ? `"${baseTag}-gzip"` : `"${baseTag}"`;
+
+    setResultHeaders(res, filePath, etag, stats.mtime);
+    if (isNotModified(req, etag, baseTag)) {
+        res.status(304).end();
+        return;
+    }
+
+    let body = Buffer.from(await readChunked(manifestPath), "utf8");
+    if (gzip) {
+        body = await gzipAsync(body);
+        res.setHeader("Content-Encoding", "gzip");
+        res.status(200);
+    } else {
+        const size = body.length;
+        const range = parseRange(rangeHeader, size);
+        if (range === false) {
+            res.setHeader("Content-Range", `bytes */${size}`);
+            res.status(416).end();
+            return;
+        }
+        if (range) {
+            body = body.subarray(range.start, range.end + 1);
+            res.setHeader(
+                "Content-Range",
+                `bytes ${range.start}-${range.end}/${size}`
+            );
+            res.status(206);
+        } else {
+            res.status(200);
+        }
+    }
+
+    res.setHeader("Content-Length", body.length);
+    res.end(req.method === "HEAD" ? undefined : body);
+}
+
+// 以流的方式发送结果文件，支持ETag/If-None-Match、Range和预压缩版本；
+// 结果文件不存在但有清单时由readChunked从分块存储还原
+async function sendResultFile(req, res, filePath, readChunked) {
+    let stats;
+    try {
+        stats = await fs.promises.stat(filePath);
+    } catch (err) {
+        if (err.code === "ENOENT" && readChunked && filePath.endsWith(".md")) {
+            await sendChunkedResult(req, res, filePath, readChunked);
+            return;
+        }
+        throw err;
+    }
+    if (!stats.isFile()) {
+        const err = new Error(`文件不存在: ${filePath}`);
+        err.code = "ENOENT";
+        throw err;
+    }
+
+    const baseTag = `${stats.size.toString(16)}-${Math.floor(
+        stats.mtimeMs
+    ).toString(16)}`;
+    const rangeHeader = req.headers.range;
+
+    // Range请求始终按未压缩的原始字节计算
+    const variant = rangeHeader
+        ? null
+        : await findPrecompressed(filePath, req.headers["accept-encoding"]);
+    const etag = variant ? `"${baseTag}-${variant.encoding}"` : `"${baseTag}"`;
+
+    setResultHeaders(res, filePath, etag, stats.mtime);
+    if (isNotModified(req, etag, baseTag)) {
+        res.status(304).end();
+        return;
+    }
+
+    let streamPath = filePath;
+    let streamOptions = {};
+    let length = stats.size;
+
+    if (variant) {
+        streamPath = filePath + variant.extension;
+        length = variant.stats.size;
+        res.setHeader("Content-Encoding", variant.encoding);
+        res.status(200);
+    } else {
+        const range = parseRange(rangeHeader, stats.size);
+        if (range === false) {
+            res.setHeader("Content-Range", `bytes */${stats.size}`);
+            res.status(416).end();
+            return;
+        }
+        if (range) {
+            streamOptions = range;
+            length = range.end - range.start + 1;
+            res.setHeader(
+                "Content-Range",
+                `bytes ${range.start}-${range.end}/${stats.size}`
+            );
+            res.status(206);
+        } else {
+            res.status(200);
+        }
+    }
+
+    res.setHeader("Content-Length", length);
+
+    if (req.method === "HEAD") {
+        res.end();
+        return;
+    }
+
+    pipeline(fs.createReadStream(streamPath, streamOptions), res, (err) => {
+        if (err && err.code !== "ERR_STREAM_PREMATURE_CLOSE") {
+            console.error(`[API Error] 发送文件失败: ${streamPath}`, err);
+        }
+    });
+}
+
+module.exports = {
+    CONTENT_TYPES,
+    MANIFEST_SUFFIX,
+    PRECOMPRESS_MIN_SIZE,
+    compareFiles,
+    searchFiles,
+    pageFiles,
+    manifestPathOf,
+    readManifest,
+    precompressFile,
+    parseRange,
+    sendResultFile,
+};
@@ -0,0 +1,263 @@
+/**
+ * 后端负载测试：并发提交解析任务，测量不同工作进程数下的吞吐量和延迟
+ *
+ * 用法:
+ *   node loadtest.js [--workers 1,2,4] [--requests 40] [--concurrency 8] [--url 页面URL]
+ *   node loadtest.js --target http://localhost:3000 [--requests 40] [--concurrency 8] [--url 页面URL]
+ *
+ * 不指定 --target 时，按 --workers 中的每个工作进程数启动一次 cluster.js
+ * （CLUSTER_WORKERS 和 PARSER_POOL_SIZE 都等于工作进程数），在随机端口上测试后关闭。
+ * 不指定 --url 时启动 backend/python/benchmarks/standin.py 替身服务器，解析其中的 typical 页面，
+ * 测试结果不受网络影响。每个请求都带 force: true，不会命中已有的解析结果。
+ */
+
+const http = require("http");
+const net = require("net");
+const os = require("os");
+const path = require("path");
+const readline = require("readline");
+const { spawn } = require("child_process");
+
+const PYTHON_PATH = process.env.CONDA_PYTHON_PATH || "python";
+const STANDIN_PATH = path.join(__dirname, "../python/benchmarks/standin.py");
+const POLL_INTERVAL = 100;
+
+function parseArgs(argv) {
+    const args = {
+        target: null,
+        url: null,
+        requests: 40,
+        concurrency: 8,
+        workers: [1, 2, os.cpus().length].filter(
+            (n, i, list) => list.indexOf(n) === i
+        ),
+    };
+    for (let i = 0; i < argv.length; i += 2) {
+        const value = argv[i + 1];
+        switch (argv[i]) {
+            case "--target":
+                args.target = value.replace(/\/$/, "");
+                break;
+            case "--url":
+                args.url = value;
+                break;
+            case "--requests":
+                args.requests = parseInt(value, 10);
+                break;
+            case "--concurrency":
+                args.concurrency = parseInt(value, 10);
+                break;
+            case "--workers":
+                args.workers = value.split(",").map((n) => parseInt(n, 10));
+                break;
+            default:
+                throw new Error(`未知参数: ${argv[i]}`);
+        }
+    }
+    return args;
+}
+
+// 发送请求并解析JSON响应
+function request(method, url, body) {
+    return new Promise((resolve, reject) => {
+        const payload = body ? JSON.stringify(body) : null;
+        const req = http.request(
+            url,
+            {
+                method: method,
+                headers: payload
+                    ? {
+                          "Content-Type": "application/json",
+                          "Content-Length": Buffer.byteLength(payload),
+                      }
+                    : {},
+            },
+            (res) => {
+                let data = "";
+                res.setEncoding("utf8");
+                res.on("data", (chunk) => (data += chunk));
+                res.on("end", () => {
+                    try {
+                        resolve({ status: res.statusCode, body: JSON.parse(data) });
+                    } catch (err) {
+                        resolve({ status: res.statusCode, body: null });
+                    }
+                });
+            }
+        );
+        req.on("error", reject);
+        if (payload) {
+            req.write(payload);
+        }
+        req.end();
+    });
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// 提交一个解析任务并轮询直到结束，返回 { ok, latency }
+async function runTask(target, url) {
+    const start = Date.now();
+    const { body } = await request("POST", `${target}/api/parse`, {
+        url: url,
+        force: true,
+    });
+    if (!body || !body.taskId) {
+        return { ok: false, latency: Date.now() - start };
+    }
+    for (;;) {
+        await sleep(POLL_INTERVAL);
+        const { status, body: task } = await request(
+            "GET",
+            `${target}/api/task/${body.taskId}`
+        );
+        if (status === 200 && task.status !== "running") {
+            return { ok: task.status === "completed", latency: Date.now() - start };
+        }
+    }
+}
+
+// 以固定并发数运行全部请求
+async function runLoad(target, url, requests, concurrency) {
+    const results = [];
+    let next = 0;
+    const start = Date.now();
+    const runners = Array.from({ length: concurrency }, async () => {
+        while (next < requests) {
+            next++;
+            results.push(await runTask(target, url));
+        }
+    });
+    await Promise.all(runners);
+    const elapsed = (Date.now() - start) / 1000;
+    const latencies = results.map((r) => r.latency).sort((a, b) => a - b);
+    const percentile = (p) =>
+        latencies[Math.min(latencies.length - 1, Math.floor(latencies.length * p))];
+    return {
+        ok: results.filter((r) => r.ok).length,
+        failed: results.filter((r) => !r.ok).length,
+        throughput: results.length / elapsed,
+        p50: percentile(0.5),
+        p95: percentile(0.95),
+    };
+}
+
+function freePort() {
+    return new Promise((resolve, reject) => {
+        const probe = net.createServer();
+        probe.unref();
+        probe.on("error", reject);
+        probe.listen(0, "127.0.0.1", () => {
+            const { port } = probe.address();
+            probe.close(() => resolve(port));
+        });
+    });
+}
+
+// 启动替身服务器，返回 { child, url }
+function startStandin() {
+    return new Promise((resolve, reject) => {
+        const child = spawn(
+            PYTHON_PATH,
+            [STANDIN_PATH, "--pages", "typical"],
+            { cwd: path.dirname(STANDIN_PATH), stdio: ["ignore", "pipe", "inherit"] }
+        );
+        child.on("error", reject);
+        readline.createInterface({ input: child.stdout }).once("line", (line) => {
+            resolve({ child: child, url: `${line.trim()}/typical` });
+        });
+    });
+}
+
+// 启动指定工作进程数的集群，等待其开始接受请求
+async function startCluster(workers) {
+    const port = await freePort();
+    const child = spawn(process.execPath, [path.join(__dirname, "cluster.js")], {
+        env: {
+            ...process.env,
+            PORT: String(port),
+            CLUSTER_WORKERS: String(workers),
+            PARSER_POOL_SIZE: String(workers),
+        },
+        stdio: "ignore",
+    });
+    const target = `http://127.0.0.1:${port}`;
+    for (let i = 0; i < 300; i++) {
+        try {
+            await request("GET", `${target}/api/files?limit=1`);
+            // 等其余工作进程也启动完
+            await sleep(500);
+            return { child: child, target: target };
+        } catch (err) {
+            await sleep(100);
+        }
+    }
+    child.kill("SIGINT");
+    throw new Error("集群启动超时");
+}
+
+function stopChild(child) {
+    return new Promise((resolve) => {
+        if (child.exitCode !== null) {
+            resolve();
+            return;
+        }
+        child.once("exit", resolve);
+        child.kill("SIGINT");
+        setTimeout(() => child.kill("SIGKILL"), 5000).unref();
+    });
+}
+
+function report(label, result) {
+    console.log(
+        `${label.padEnd(12)} ${result.throughput.toFixed(2).padStart(8)} ` +
+            `${String(result.p50).padStart(8)} ${String(result.p95).padStart(8)} ` +
+            `${String(result.ok).padStart(6)} ${String(result.failed).padStart(6)}`
+    );
+}
+
+async function main() {
+    const args = parseArgs(process.argv.slice(2));
+
+    let standin = null;
+    let url = args.url;
+    if (!url) {
+        standin = await startStandin();
+        url = standin.url;
+    }
+
+    console.log(
+        `页面: ${url}，请求数: ${args.requests}，并发: ${args.concurrency}，CPU核数: ${os.cpus().length}`
+    );
+    console.log(
+        `${"配置".padEnd(12)} ${"任务/秒".padStart(8)} ${"p50(ms)".padStart(8)} ` +
+            `${"p95(ms)".padStart(8)} ${"成功".padStart(6)} ${"失败".padStart(6)}`
+    );
+
+    try {
+        if (args.target) {
+            report(args.target, await runLoad(args.target, url, args.requests, args.concurrency));
+            return;
+        }
+        for (const workers of args.workers) {
+            const { child, target } = await startCluster(workers);
+            try {
+                report(
+                    `${workers} 进程`,
+                    await runLoad(target, url, args.requests, args.concurrency)
+                );
+            } finally {
+                await stopChild(child);
+            }
+        }
+    } finally {
+        if (standin) {
+            standin.child.kill();
+        }
+    }
+}
+
+main().catch((err) => {
+    console.error("负载测试失败:", err.message);
+    process.exit(1);
+});
@@ -9,6 +9,19 @@ const { Server } = require("socket.io");
 const fs = require("fs");
 const crypto = require("crypto");
 const util = require("util");
+const cluster = require("cluster");
+const os = require("os");
+const readline = require("readline");
+const {
+    MANIFEST_SUFFIX,
+    compareFiles,
+    searchFiles,
+    pageFiles,
+    manifestPathOf,
+    readManifest,
+    precompressFile,
+    sendResultFile,
+} = require("./files");
 
 const app = express();
 const server = http.createServer(app);
@@ -18,6 +31,8 @@ const io = new Server(server, {
         methods: ["GET", "POST"],
         credentials: true,
     },
+    // 集群模式下没有粘性会话，长轮询的多个请求可能落到不同的工作进程，只使用WebSocket
+    ...(cluster.isWorker ? { transports: ["websocket"] } : {}),
 });
 
 // 中间件
@@ -26,8 +41,8 @@ app.use(bodyParser.json());
 app.use(bodyParser.urlencoded({ extended: true }));
 app.use(express.static(path.join(__dirname, "../../frontend/dist")));
 
-// 解析器路径
-const PARSER_PATH = path.join(__dirname, "../python/parse_deepwiki.py");
+// 解析器路径（使用轻量入口，解析器模块可以使用缓存的字节码，缩短每个请求的进程启动时间）
+const PARSER_PATH = path.join(__dirname, "../python/deepwiki_cli.py");
 const PYTHON_PATH = process.env.CONDA_PYTHON_PATH || "python";
 const TEMP_DIR = path.join(__dirname, "../../temp");
 
@@ -39,33 +54,832 @@ if (!fs.existsSync(TEMP_DIR)) {
 // 活跃的解析任务
 const activeTasks = new Map();
 
+// 任务日志：只追加的JSONL文件，记录任务的创建和状态变化，服务器重启后据此恢复任务
+const TASK_JOURNAL_PATH = path.join(TEMP_DIR, ".tasks.jsonl");
+// 写入日志的任务字段（进程对象、socketId、指标等运行时信息不保存）
+const JOURNAL_FIELDS = [
+    "url",
+    "status",
+    "stage",
+    "progress",
+    "message",
+    "startTime",
+    "endTime",
+    "outputPath",
+    "error",
+    "profile",
+    "profilePath",
+    "profileFile",
+    "crawl",
+    "checkpointPath",
+];
+
+// 已完成任务的索引：completedTaskKey() -> 任务ID，相同URL和选项可以直接返回已有结果
+const completedByUrl = new Map();
+
+// 等待写入日志的记录，写入过程中到达的记录合并到下一次批量写入
+const journalQueue = [];
+let journalFlushing = null;
+
+// 规范化URL，使同一仓库的不同写法对应同一条记录
+function normalizeTaskUrl(url) {
+    return url
+        .trim()
+        .replace(/[?#].*$/, "")
+        .replace(/\/+$/, "")
+        .replace(/^http:\/\//i, "https://")
+        .replace(/^https:\/\/(www\.)?github\.com\//i, "https://deepwiki.com/")
+        .toLowerCase();
+}
+
+// 已完成任务的索引键：多页抓取和单页解析、开启性能剖析的结果各不相同，不能互相复用
+function completedTaskKey(url, task) {
+    return [
+        normalizeTaskUrl(url),
+        task.crawl ? "crawl" : "page",
+        task.profile || "",
+    ].join(" ");
+}
+
+// 任务在日志中的一行记录
+function journalRecord(taskId, task) {
+    const record = { taskId };
+    for (const field of JOURNAL_FIELDS) {
+        if (task[field] !== undefined) {
+            record[field] = task[field];
+        }
+    }
+    return JSON.stringify(record);
+}
+
+// 把任务的当前状态追加到日志（异步批量写入，不阻塞事件循环）
+function journalTask(taskId, task) {
+    journalQueue.push(journalRecord(taskId, task));
+    if (!journalFlushing) {
+        journalFlushing = flushJournal();
+    }
+    return journalFlushing;
+}
+
+async function flushJournal() {
+    while (journalQueue.length > 0) {
+        const batch = journalQueue.splice(0);
+        try {
+            await fs.promises.appendFile(
+                TASK_JOURNAL_PATH,
+                batch.join("\n") + "\n",
+                "utf8"
+            );
+        } catch (err) {
+            console.error("[Journal] 写入任务日志失败:", err);
+        }
+    }
+    journalFlushing = null;
+}
+
+// 集群模式（由 cluster.js 启动多个工作进程，共享同一个端口）：任务状态、文件索引、
+// 解析器指标和Socket.IO事件通过主进程转发给其他工作进程，每个工作进程都有完整的视图
+const IN_CLUSTER = cluster.isWorker;
+
+// 同步给其他工作进程的任务字段
+const SHARED_TASK_FIELDS = [...JOURNAL_FIELDS, "socketId", "metrics"];
+
+// 通过主进程把消息转发给其他所有工作进程
+function relay(message) {
+    if (IN_CLUSTER) {
+        process.send({ type: "relay", message: message });
+    }
+}
+
+// 任务状态变化时把任务的当前字段同步给其他工作进程；进度和指标只在本进程更新，
+// 每行输出都转发的话，消息数随所有工作进程的任务数增长
+function shareTask(taskId, task) {
+    if (!IN_CLUSTER || task.sharedStatus === task.status) {
+        return;
+    }
+    task.sharedStatus = task.status;
+    const fields = {};
+    for (const field of SHARED_TASK_FIELDS) {
+        if (task[field] !== undefined) {
+            fields[field] = task[field];
+        }
+    }
+    relay({ kind: "task", taskId: taskId, fields: fields });
+}
+
+// 向客户端发送事件，客户端连接在其他工作进程上时由主进程只转发给那个进程
+function emitToSocket(socketId, event, data) {
+    if (IN_CLUSTER && !io.sockets.sockets.has(socketId)) {
+        process.send({
+            type: "emit",
+            socketId: socketId,
+            event: event,
+            data: data,
+        });
+        return;
+    }
+    io.to(socketId).emit(event, data);
+}
+
+// 解析进程池：限制同时运行的Python解析进程数，超出的任务排队等待
+// 集群模式下由主进程在所有工作进程之间统一分配（见 cluster.js）
+const PARSER_POOL_SIZE =
+    parseInt(process.env.PARSER_POOL_SIZE, 10) || os.cpus().length;
+let parserSlotsUsed = 0;
+// 排队中的任务：任务ID -> resolve，Map按插入顺序遍历，先到先得
+const parserSlotWaiters = new Map();
+
+// 等待空闲的解析进程，结果为false表示排队期间任务被取消
+function acquireParserSlot(taskId) {
+    return new Promise((resolve) => {
+        if (IN_CLUSTER) {
+            parserSlotWaiters.set(taskId, resolve);
+            process.send({ type: "pool:acquire", taskId: taskId });
+        } else if (parserSlotsUsed < PARSER_POOL_SIZE) {
+            parserSlotsUsed++;
+            resolve(true);
+        } else {
+            parserSlotWaiters.set(taskId, resolve);
+        }
+    });
+}
+
+// 解析进程结束，把空位交给下一个排队的任务
+function releaseParserSlot(taskId) {
+    if (IN_CLUSTER) {
+        process.send({ type: "pool:release", taskId: taskId });
+        return;
+    }
+    const next = parserSlotWaiters.entries().next();
+    if (next.done) {
+        parserSlotsUsed--;
+        return;
+    }
+    const [nextTaskId, resolve] = next.value;
+    parserSlotWaiters.delete(nextTaskId);
+    resolve(true);
+}
+
+// 取消排队中的任务，返回该任务是否在本进程中排队
+function cancelParserSlot(taskId) {
+    const resolve = parserSlotWaiters.get(taskId);
+    if (!resolve) {
+        return false;
+    }
+    parserSlotWaiters.delete(taskId);
+    if (IN_CLUSTER) {
+        process.send({ type: "pool:cancel", taskId: taskId });
+    }
+    resolve(false);
+    return true;
+}
+
+// 更新任务并写入日志
+function updateTask(taskId, fields) {
+    const task = activeTasks.get(taskId);
+    if (!task) {
+        return;
+    }
+    Object.assign(task, fields);
+    if (task.status === "completed") {
+        completedByUrl.set(completedTaskKey(task.url, task), taskId);
+    }
+    journalTask(taskId, task);
+    shareTask(taskId, task);
+}
+
+// 查找同一URL和选项（options.crawl、options.profile）已完成且结果文件仍然存在的任务
+async function findCompletedTask(url, options) {
+    const key = completedTaskKey(url, options);
+    const taskId = completedByUrl.get(key);
+    if (!taskId) {
+        return null;
+    }
+    const outputPath = activeTasks.get(taskId).outputPath;
+    try {
+        // 结果文件或只有分块清单
+        await fs.promises
+            .access(outputPath)
+            .catch(() => fs.promises.access(manifestPathOf(outputPath)));
+        return taskId;
+    } catch (err) {
+        // 结果文件已被删除，需要重新解析
+        completedByUrl.delete(key);
+        return null;
+    }
+}
+
+// 启动时回放任务日志恢复任务，重启前仍在运行的任务标记为失败
+async function loadTaskJournal() {
+    let content;
+    try {
+        content = await fs.promises.readFile(TASK_JOURNAL_PATH, "utf8");
+    } catch (err) {
+        if (err.code !== "ENOENT") {
+            console.error("[Journal] 读取任务日志失败:", err);
+        }
+        return;
+    }
+
+    // 集群模式下只有主进程指定的工作进程负责恢复和压缩日志（第一个工作进程，它在恢复完成前退出时
+    // 由替换它的进程接手）；其余工作进程只读取日志，其中运行中的任务属于其他工作进程
+    const recover = !IN_CLUSTER || process.env.TASK_JOURNAL_RECOVER === "1";
+
+    let records = 0;
+    for (const line of content.split("\n")) {
+        if (!line) {
+            continue;
+        }
+        let record;
+        try {
+            record = JSON.parse(line);
+        } catch (err) {
+            // 进程崩溃时最后一行可能不完整
+            continue;
+        }
+        records++;
+        const { taskId, ...fields } = record;
+        activeTasks.set(taskId, { ...activeTasks.get(taskId), ...fields });
+    }
+
+    let interrupted = 0;
+    for (const [taskId, task] of activeTasks.entries()) {
+        task.process = null;
+        task.socketId = null;
+        if (recover && task.status === "running") {
+            task.status = "failed";
+            task.error = "服务器重启，任务中断";
+            task.endTime = task.endTime || Date.now();
+            interrupted++;
+        }
+        if (task.status === "completed") {
+            completedByUrl.set(completedTaskKey(task.url, task), taskId);
+        }
+    }
+    console.log(
+        `[Journal] 恢复 ${activeTasks.size} 个任务，其中 ${interrupted} 个因重启中断`
+    );
+
+    // 同一任务在日志中有多条记录，恢复后重写为每个任务一条，避免日志无限增长
+    if (recover && (records > activeTasks.size || interrupted > 0)) {
+        const tmpPath = `${TASK_JOURNAL_PATH}.tmp`;
+        const lines = [];
+        for (const [taskId, task] of activeTasks.entries()) {
+            lines.push(journalRecord(taskId, task));
+        }
+        await fs.promises.writeFile(tmpPath, lines.join("\n") + "\n", "utf8");
+        await fs.promises.rename(tmpPath, TASK_JOURNAL_PATH);
+    }
+}
+
+// 结果文件索引，写入结果时更新，文件列表请求不再扫描目录
+const FILE_SORT_KEYS = ["modified", "name", "size"];
+const FILE_PAGE_SIZE = 50;
+const FILE_PAGE_MAX = 500;
+// 文件名 -> { name, size, created, modified, url, taskId, repo }
+const fileIndex = new Map();
+// 仓库(owner/repo，"" 表示所有文件) -> 每种排序方式下按升序排列的文件列表
+const fileListings = new Map();
+
+// 文件列表中显示的文件（不含预压缩版本、临时文件、分块清单和任务日志等隐藏文件）。
+// 只有清单 x.chunks.json 的结果在列表中显示为 x.md
+function isListedFile(name) {
+    return (
+        !/\.(br|gz|tmp)$/.test(name) &&
+        !name.endsWith(MANIFEST_SUFFIX) &&
+        !name.startsWith(".")
+    );
+}
+
+// 从URL中取出仓库名(owner/repo)
+function repoOfUrl(url) {
+    if (!url) {
+        return null;
+    }
+    const match = normalizeTaskUrl(url).match(
+        /^https?:\/\/[^/]+\/([^/]+\/[^/]+)/
+    );
+    return match ? match[1] : null;
+}
+
+// 根据文件信息和所属任务生成索引条目
+function fileEntry(name, stats, taskId) {
+    const task = taskId ? activeTasks.get(taskId) : null;
+    return {
+        name: name,
+        size: stats.size,
+        created: stats.birthtimeMs,
+        modified: stats.mtimeMs,
+        url: task ? task.url : null,
+        taskId: taskId || null,
+    };
+}
+
+// 添加或更新索引条目
+function indexFile(entry) {
+    unindexFile(entry.name);
+    entry.repo = repoOfUrl(entry.url);
+    fileIndex.set(entry.name, entry);
+    for (const repo of entry.repo ? ["", entry.repo] : [""]) {
+        let listing = fileListings.get(repo);
+        if (!listing) {
+            listing = { modified: [], name: [], size: [] };
+            fileListings.set(repo, listing);
+        }
+        for (const key of FILE_SORT_KEYS) {
+            const list = listing[key];
+            list.splice(searchFiles(list, key, entry, false), 0, entry);
+        }
+    }
+}
+
+// 删除索引条目
+function unindexFile(name) {
+    const entry = fileIndex.get(name);
+    if (!entry) {
+        return;
+    }
+    fileIndex.delete(name);
+    for (const repo of entry.repo ? ["", entry.repo] : [""]) {
+        const listing = fileListings.get(repo);
+        for (const key of FILE_SORT_KEYS) {
+            const list = listing[key];
+            list.splice(searchFiles(list, key, entry, false), 1);
+        }
+        if (repo && listing.name.length === 0) {
+            fileListings.delete(repo);
+        }
+    }
+}
+
+// 写入结果文件后更新索引，并同步给其他工作进程
+function indexWrittenFile(entry) {
+    indexFile(entry);
+    relay({ kind: "file", entry: entry });
+}
+
+// 启动时扫描一次结果目录建立索引，来源URL从任务日志中补全
+async function buildFileIndex() {
+    // 文件名 -> 任务ID
+    const owners = new Map();
+    for (const [taskId, task] of activeTasks.entries()) {
+        if (task.outputPath) {
+            owners.set(path.basename(task.outputPath), taskId);
+        }
+        if (task.profilePath) {
+            owners.set(path.basename(task.profilePath), taskId);
+        }
+    }
+
+    const names = (await fs.promises.readdir(TEMP_DIR)).filter(
+        (name) => isListedFile(name) || name.endsWith(MANIFEST_SUFFIX)
+    );
+    const present = new Set(names);
+    // 分批并发stat，避免同时打开过多文件
+    for (let i = 0; i < names.length; i += 64) {
+        await Promise.all(
+            names.slice(i, i + 64).map(async (name) => {
+                try {
+                    let stats;
+                    if (name.endsWith(MANIFEST_SUFFIX)) {
+                        // 分块清单按对应的结果文件建立条目，同名的结果文件已存在时以结果文件为准
+                        const manifestPath = path.join(TEMP_DIR, name);
+                        name = path.basename(manifestPath, MANIFEST_SUFFIX) + ".md";
+                        if (present.has(name)) {
+                            return;
+                        }
+                        stats = (await readManifest(manifestPath)).stats;
+                        stats.isFile = () => true;
+                    } else {
+                        stats = await fs.promises.stat(path.join(TEMP_DIR, name));
+                    }
+                    if (stats.isFile()) {
+                        const entry = fileEntry(name, stats, owners.get(name));
+                        entry.repo = repoOfUrl(entry.url);
+                        fileIndex.set(name, entry);
+                    }
+                } catch (err) {
+                    // 扫描期间被删除的文件忽略
+                }
+            })
+        );
+    }
+
+    // 全部收集后每个列表只排序一次，比逐个插入快得多
+    fileListings.clear();
+    fileListings.set("", { modified: [], name: [], size: [] });
+    for (const entry of fileIndex.values()) {
+        for (const repo of entry.repo ? ["", entry.repo] : [""]) {
+            let listing = fileListings.get(repo);
+            if (!listing) {
+                listing = { modified: [], name: [], size: [] };
+                fileListings.set(repo, listing);
+            }
+            for (const key of FILE_SORT_KEYS) {
+                listing[key].push(entry);
+            }
+        }
+    }
+    for (const listing of fileListings.values()) {
+        for (const key of FILE_SORT_KEYS) {
+            listing[key].sort((a, b) => compareFiles(key, a, b));
+        }
+    }
+    console.log(`[Files] 已索引 ${fileIndex.size} 个文件`);
+}
+
+// 各主机的抓取状态：令牌桶、并发上限、Retry-After暂停时间、各进程正在进行的请求数和最近的请求耗时。
+// 每个任务是一个新的解析进程，同时运行的进程通过这个文件（加文件锁）共同遵守每个主机的限速，
+// 新进程也从已有的耗时样本开始自适应超时和对冲
+const FETCH_STATE_PATH = path.join(TEMP_DIR, ".fetch_state.json");
+
+// 常驻的Python进程，从标准输入逐行读取JSON请求，每个请求输出一行带相同id的JSON响应。
+// 第一次请求时启动，进程退出后下一次请求时重新启动
+function residentPython(name, args) {
+    let child = null;
+    let nextId = 0;
+    // 请求ID -> { resolve, reject }
+    const pending = new Map();
+
+    function start() {
+        const current = spawn(PYTHON_PATH, args, {
+            stdio: ["pipe", "pipe", "inherit"],
+        });
+        const stop = (err) => {
+            if (child !== current) {
+                return;
+            }
+            child = null;
+            for (const request of pending.values()) {
+                request.reject(err);
+            }
+            pending.clear();
+        };
+        current.on("error", stop);
+        current.on("exit", (code) =>
+            stop(new Error(`${name}进程已退出，退出码: ${code}`))
+        );
+        current.stdin.on("error", () => {});
+        readline.createInterface({ input: current.stdout }).on("line", (line) => {
+            let response;
+            try {
+                response = JSON.parse(line);
+            } catch (err) {
+                return;
+            }
+            const request = pending.get(response.id);
+            if (!request) {
+                return;
+            }
+            pending.delete(response.id);
+            if (response.error) {
+                request.reject(new Error(response.error));
+            } else {
+                request.resolve(response);
+            }
+        });
+        child = current;
+        return current;
+    }
+
+    return {
+        // 发送请求，返回响应
+        request(op, params) {
+            return new Promise((resolve, reject) => {
+                const id = ++nextId;
+                pending.set(id, { resolve: resolve, reject: reject });
+                (child || start()).stdin.write(
+                    JSON.stringify({ id: id, op: op, ...params }) + "\n"
+                );
+            });
+        },
+        // 关闭标准输入，进程处理完已收到的请求后退出
+        close() {
+            if (child) {
+                child.stdin.end();
+            }
+        },
+    };
+}
+
+// 解析结果的分块存储（backend/python/chunk_store.py）：解析进程把结果按章节和代码块去重保存，
+// x.md 只写一个清单 x.chunks.json，下载时由常驻的Python进程还原。存储同时缓存各片段的转换结果，
+// 其他任务中源码相同的章节不再转换
+const CHUNK_STORE_PATH = path.join(TEMP_DIR, ".chunks.db");
+const CHUNK_SCRIPT_PATH = path.join(__dirname, "../python/chunk_store.py");
+const chunkService = residentPython("分块存储", [
+    CHUNK_SCRIPT_PATH,
+    "serve",
+    CHUNK_STORE_PATH,
+]);
+
+// 从分块存储还原只有清单的结果
+function readChunkedResult(manifestPath) {
+    return chunkService
+        .request("read", { manifest: manifestPath })
+        .then((response) => response.markdown);
+}
+
+// 全文搜索索引，由常驻的Python进程维护（backend/python/search_index.py serve），
+// 结果写入时增量索引，搜索时不读取结果文件；只有清单的结果从分块存储读取
+const SEARCH_INDEX_PATH = path.join(TEMP_DIR, ".search.db");
+const SEARCH_SCRIPT_PATH = path.join(__dirname, "../python/search_index.py");
+const SEARCH_ARGS = [
+    SEARCH_SCRIPT_PATH,
+    "serve",
+    SEARCH_INDEX_PATH,
+    "--chunk-store",
+    CHUNK_STORE_PATH,
+];
+const searchService = residentPython("搜索", SEARCH_ARGS);
+
+// 向搜索进程发送请求，返回响应
+function searchRequest(op, params) {
+    return searchService.request(op, params);
+}
+
+// 把写入的结果文件加入搜索索引
+function indexSearchDocument(filePath, url) {
+    searchRequest("index", {
+        path: filePath,
+        name: path.basename(filePath),
+        url: url,
+        repo: repoOfUrl(url),
+    }).catch((err) => {
+        console.error(`[Search] 索引 ${path.basename(filePath)} 失败:`, err.message);
+    });
+}
+
+// 启动时让搜索索引与结果目录一致：补上索引中没有或已修改的文件，删除已不存在的文件。
+// 在单独的进程中进行，大量文件需要索引时不阻塞搜索请求
+function syncSearchIndex() {
+    const files = [];
+    for (const entry of fileIndex.values()) {
+        if (entry.name.endsWith(".md")) {
+            files.push({ name: entry.name, url: entry.url, repo: entry.repo });
+        }
+    }
+    return new Promise((resolve, reject) => {
+        const child = spawn(
+            PYTHON_PATH,
+            SEARCH_ARGS,
+            { stdio: ["pipe", "pipe", "inherit"] }
+        );
+        let output = "";
+        child.stdout.setEncoding("utf8");
+        child.stdout.on("data", (data) => (output += data));
+        child.on("error", reject);
+        child.on("close", () => {
+            try {
+                const response = JSON.parse(output);
+                if (response.error) {
+                    throw new Error(response.error);
+                }
+                resolve(response);
+            } catch (err) {
+                reject(err);
+            }
+        });
+        child.stdin.end(
+            JSON.stringify({ id: 1, op: "sync", dir: TEMP_DIR, files: files }) + "\n"
+        );
+    }).then(({ added, removed }) => {
+        console.log(`[Search] 索引 ${added} 个新文件，删除 ${removed} 个`);
+    });
+}
+
+// 支持的性能剖析方式及对应的结果文件扩展名
+const PROFILE_EXTENSIONS = {
+    cprofile: ".prof",
+    sample: ".folded",
+};
+
+// 解析器插桩，设置 PARSER_METRICS=0 可关闭（关闭后解析器不做任何记录）
+const PARSER_METRICS_ENABLED = process.env.PARSER_METRICS !== "0";
+
+// 所有任务汇总的解析器指标，通过 /metrics 以Prometheus文本格式输出
+const parserMetrics = {
+    spans: new Map(), // span名 -> { bounds, buckets, sum, count }
+    histograms: new Map(), // 直方图名 -> { bounds, buckets, sum, count }
+    counters: new Map(), // 计数器名 -> 值
+    tasks: new Map(), // 任务状态 -> 数量
+};
+
+// 合并单个直方图（Python端的buckets为各桶独立计数，最后一个桶为+Inf）
+function mergeHistogram(target, name, histogram) {
+    let entry = target.get(name);
+    if (!entry) {
+        entry = {
+            bounds: histogram.bounds,
+            buckets: new Array(histogram.buckets.length).fill(0),
+            sum: 0,
+            count: 0,
+        };
+        target.set(name, entry);
+    }
+    histogram.buckets.forEach((value, i) => {
+        entry.buckets[i] += value;
+    });
+    entry.sum += histogram.sum;
+    entry.count += histogram.count;
+}
+
+// 汇总一次解析任务输出的指标，relayed为true表示来自其他工作进程
+function recordParserMetrics(metrics, relayed = false) {
+    for (const [name, histogram] of Object.entries(metrics.spans || {})) {
+        mergeHistogram(parserMetrics.spans, name, histogram);
+    }
+    for (const [name, histogram] of Object.entries(metrics.histograms || {})) {
+        mergeHistogram(parserMetrics.histograms, name, histogram);
+    }
+    for (const [name, value] of Object.entries(metrics.counters || {})) {
+        parserMetrics.counters.set(
+            name,
+            (parserMetrics.counters.get(name) || 0) + value
+        );
+    }
+    if (!relayed) {
+        relay({ kind: "metrics", metrics: metrics });
+    }
+}
+
+// 记录任务结束状态，relayed为true表示来自其他工作进程
+function recordTaskStatus(status, relayed = false) {
+    parserMetrics.tasks.set(status, (parserMetrics.tasks.get(status) || 0) + 1);
+    if (!relayed) {
+        relay({ kind: "taskStatus", status: status });
+    }
+}
+
+// Prometheus标签值转义
+function promLabel(value) {
+    return String(value)
+        .replace(/\\/g, "\\\\")
+        .replace(/"/g, '\\"')
+        .replace(/\n/g, "\\n");
+}
+
+// 输出一组直方图
+function renderHistograms(lines, metricName, help, label, histograms) {
+    lines.push(`# HELP ${metricName} ${help}`);
+    lines.push(`# TYPE ${metricName} histogram`);
+    for (const [name, entry] of histograms) {
+        const labelValue = `${label}="${promLabel(name)}"`;
+        let cumulative = 0;
+        entry.buckets.forEach((value, i) => {
+            cumulative += value;
+            const le = i < entry.bounds.length ? entry.bounds[i] : "+Inf";
+            lines.push(
+                `${metricName}_bucket{${labelValue},le="${le}"} ${cumulative}`
+            );
+        });
+        lines.push(`${metricName}_sum{${labelValue}} ${entry.sum}`);
+        lines.push(`${metricName}_count{${labelValue}} ${entry.count}`);
+    }
+}
+
+// 生成Prometheus文本格式的指标
+function renderMetrics() {
+    const lines = [];
+
+    lines.push("# HELP deepwiki_tasks_total 已结束的解析任务数");
+    lines.push("# TYPE deepwiki_tasks_total counter");
+    for (const [status, value] of parserMetrics.tasks) {
+        lines.push(`deepwiki_tasks_total{status="${promLabel(status)}"} ${value}`);
+    }
+
+    let running = 0;
+    for (const task of activeTasks.values()) {
+        if (task.status === "running") running++;
+    }
+    lines.push("# HELP deepwiki_running_tasks 正在运行的解析任务数");
+    lines.push("# TYPE deepwiki_running_tasks gauge");
+    lines.push(`deepwiki_running_tasks ${running}`);
+
+    renderHistograms(
+        lines,
+        "deepwiki_parser_span_seconds",
+        "解析器各阶段(fetch/soup/extract/convert/parse)和各标签处理(tag.*)的耗时",
+        "span",
+        parserMetrics.spans
+    );
+    renderHistograms(
+        lines,
+        "deepwiki_parser_size",
+        "解析器记录的分布(页面和代码块大小、抓取并发上限和速率等)",
+        "name",
+        parserMetrics.histograms
+    );
+
+    lines.push("# HELP deepwiki_parser_events_total 解析器计数器");
+    lines.push("# TYPE deepwiki_parser_events_total counter");
+    for (const [name, value] of parserMetrics.counters) {
+        lines.push(`deepwiki_parser_events_total{name="${promLabel(name)}"} ${value}`);
+    }
+
+    return lines.join("\n") + "\n";
+}
+
 // 生成唯一的任务ID
 function generateTaskId() {
     return crypto.randomBytes(16).toString("hex");
 }
 
+// 解析进程的stderr中还有所有INFO日志，失败任务只保存末尾的错误信息（字符数），
+// 任务日志和集群中转发的任务对象都使用截断后的内容
+const ERROR_TAIL_LENGTH = 4096;
+// 内存中最多保留的stderr（字符数）
+const ERROR_BUFFER_LENGTH = 65536;
+
+// 去掉stderr中的INFO/DEBUG日志行，返回末尾最多 ERROR_TAIL_LENGTH 个字符
+function errorTail(output) {
+    const tail = output
+        .split("\n")
+        .filter((line) => line.trim() && !/ - (INFO|DEBUG) - /.test(line))
+        .join("\n");
+    return tail.length > ERROR_TAIL_LENGTH
+        ? "..." + tail.slice(-ERROR_TAIL_LENGTH)
+        : tail;
+}
+
 // 解析DeepWiki并返回Markdown
-async function parseDeepWiki(url, taskId, socketId) {
+// options.profile: 可选的性能剖析方式（cprofile/sample），结果保存在输出文件旁边
+async function parseDeepWiki(url, taskId, socketId, options = {}) {
+    // 创建输出文件路径
+    const outputPath = path.join(TEMP_DIR, `${taskId}.md`);
+    // 解析进程把结果保存到分块存储并写入清单，不再写完整的结果文件
+    const manifestPath = manifestPathOf(outputPath);
+    const profilePath = options.profile
+        ? path.join(TEMP_DIR, `${taskId}${PROFILE_EXTENSIONS[options.profile]}`)
+        : null;
+    // 抓取仓库Wiki所有页面时的检查点目录，同一任务恢复时继续使用
+    const checkpointPath = options.crawl
+        ? path.join(TEMP_DIR, `${taskId}.crawl`)
+        : null;
+
+    activeTasks.set(taskId, {
+        process: null,
+        status: "running",
+        url: url,
+        socketId: socketId,
+        stage: "排队",
+        progress: 0,
+        message: "等待空闲的解析进程",
+        startTime: Date.now(),
+        outputPath: outputPath,
+        profile: options.profile || null,
+        profilePath: profilePath,
+        crawl: !!options.crawl,
+        checkpointPath: checkpointPath,
+    });
+    journalTask(taskId, activeTasks.get(taskId));
+    shareTask(taskId, activeTasks.get(taskId));
+
+    // 等待解析进程池中的空位
+    if (!(await acquireParserSlot(taskId))) {
+        throw new Error("任务已取消");
+    }
+    // 同一任务恢复时删除上次留下的清单，成功后是否有清单决定结果的保存方式
+    await fs.promises.rm(manifestPath, { force: true }).catch(() => {});
+
     return new Promise((resolve, reject) => {
         console.log(`[Task: ${taskId}] 开始解析: ${url}`);
 
-        // 创建输出文件路径
-        const outputPath = path.join(TEMP_DIR, `${taskId}.md`);
-
         // 启动Python解析器进程
-        const pythonProcess = spawn(PYTHON_PATH, [PARSER_PATH, url]);
+        // 按章节输出，每完成一个章节就转发给前端
+        const parserArgs = [PARSER_PATH, url, "--stream-sections"];
+        if (PARSER_METRICS_ENABLED) {
+            parserArgs.push("--metrics");
+        }
+        if (options.profile) {
+            parserArgs.push(
+                "--profile",
+                options.profile,
+                "--profile-output",
+                profilePath
+            );
+        }
+        if (checkpointPath) {
+            parserArgs.push("--checkpoint", checkpointPath);
+        }
+        parserArgs.push(
+            "--chunk-store",
+            CHUNK_STORE_PATH,
+            "--manifest",
+            manifestPath
+        );
+        const pythonProcess = spawn(PYTHON_PATH, parserArgs, {
+            env: {
+                ...process.env,
+                FETCH_STATE: process.env.FETCH_STATE || FETCH_STATE_PATH,
+            },
+        });
 
         // 保存进程引用以便可以终止
-        activeTasks.set(taskId, {
-            process: pythonProcess,
-            status: "running",
-            url: url,
-            socketId: socketId,
-            stage: "启动",
-            progress: 0,
-            startTime: Date.now(),
-            outputPath: outputPath,
-        });
+        const startedTask = activeTasks.get(taskId);
+        startedTask.process = pythonProcess;
+        startedTask.stage = "启动";
+        startedTask.message = "启动解析进程";
 
         let markdown = "";
         let errorOutput = "";
@@ -74,7 +888,11 @@ async function parseDeepWiki(url, taskId, socketId) {
         let isCollectingMarkdown = false;
         let stdoutBuffer = "";
         let markdownLines = [];
+        // 按章节输出时收到的章节，按顺序拼接即为完整的Markdown
+        const markdownSections = [];
 
+        // 按UTF-8解码，避免多字节字符被拆分到两个数据块中
+        pythonProcess.stdout.setEncoding("utf8");
         pythonProcess.stdout.on("data", (data) => {
             // 添加到缓冲区
             stdoutBuffer += data.toString();
@@ -111,6 +929,51 @@ async function parseDeepWiki(url, taskId, socketId) {
                         continue;
                     }
 
+                    // 完成的章节，立即转发给前端
+                    if (line.startsWith("[section] ")) {
+                        const section = JSON.parse(line.slice("[section] ".length));
+                        markdownSections[section.index] = section.markdown;
+                        emitToSocket(socketId, `task:${taskId}:chunk`, {
+                            index: section.index,
+                            markdown: section.markdown,
+                        });
+                        continue;
+                    }
+
+                    // 解析器指标
+                    if (line.startsWith("[metrics] ")) {
+                        const metrics = JSON.parse(line.slice("[metrics] ".length));
+                        const task = activeTasks.get(taskId);
+                        if (task) {
+                            task.metrics = metrics;
+                        }
+                        recordParserMetrics(metrics);
+                        continue;
+                    }
+
+                    // 性能剖析结果已保存
+                    if (line.startsWith("[profile] ")) {
+                        const task = activeTasks.get(taskId);
+                        if (task) {
+                            task.profileFile = path.basename(task.profilePath);
+                            fs.promises
+                                .stat(task.profilePath)
+                                .then((stats) => {
+                                    indexWrittenFile(
+                                        fileEntry(task.profileFile, stats, taskId)
+                                    );
+                                })
+                                .catch((err) => {
+                                    console.error(
+                                        `[Task: ${taskId}] 读取性能剖析结果失败:`,
+                                        err
+                                    );
+                                });
+                        }
+                        console.log(`[Task: ${taskId}] 性能剖析结果: ${line.slice(10)}`);
+                        continue;
+                    }
+
                     console.log(`[Python] ${line}`);
 
                     // 检查是否是 [stage] percentage%: message 格式的进度信息
@@ -130,7 +993,7 @@ async function parseDeepWiki(url, taskId, socketId) {
                             task.message = message;
 
                             // 通过Socket.IO发送进度更新
-                            io.to(socketId).emit(`task:${taskId}:progress`, {
+                            emitToSocket(socketId, `task:${taskId}:progress`, {
                                 stage: stage,
                                 progress: progress,
                                 message: message,
@@ -146,65 +1009,121 @@ async function parseDeepWiki(url, taskId, socketId) {
         // 处理标准错误
         pythonProcess.stderr.on("data", (data) => {
             errorOutput += data.toString();
+            if (errorOutput.length > ERROR_BUFFER_LENGTH) {
+                errorOutput = errorOutput.slice(-ERROR_BUFFER_LENGTH);
+            }
             console.error(`[Python Error] ${data.toString()}`);
         });
 
         // 处理进程结束
-        pythonProcess.on("close", (code) => {
+        pythonProcess.on("close", async (code) => {
+            releaseParserSlot(taskId);
             const task = activeTasks.get(taskId);
-            if (task) {
-                task.status = code === 0 ? "completed" : "failed";
-                task.endTime = Date.now();
-                task.error = code !== 0 ? errorOutput : null;
+
+            // 已取消的任务保留取消状态
+            if (task && task.status === "cancelled") {
+                recordTaskStatus("cancelled");
+                reject(new Error("任务已取消"));
+                return;
             }
 
+            // 结束任务并记录最终状态
+            const finish = (status, error) => {
+                updateTask(taskId, {
+                    status: status,
+                    endTime: Date.now(),
+                    error: error,
+                });
+                recordTaskStatus(status);
+            };
+
             if (code === 0) {
                 // 解析成功
                 console.log(`[Task: ${taskId}] 解析成功`);
 
+                if (markdownSections.length > 0) {
+                    markdown = markdownSections.join("");
+                    console.log(
+                        `[Task: ${taskId}] 共收到 ${markdownSections.length} 个章节，${markdown.length} 字符`
+                    );
+                }
+
                 // 检查markdown内容是否有效
                 if (!markdown || markdown.trim() === "") {
                     console.error(
                         `[Task: ${taskId}] 警告：收集到的Markdown内容为空!`
                     );
-                    task.error = "解析成功，但Markdown内容为空";
-                    io.to(socketId).emit(`task:${taskId}:failed`, {
+                    finish("failed", "解析成功，但Markdown内容为空");
+                    emitToSocket(socketId, `task:${taskId}:failed`, {
                         error: "解析成功，但Markdown内容为空，请重试",
                     });
                     reject(new Error("解析成功，但Markdown内容为空"));
                     return;
                 }
 
-                console.log(
-                    `[Task: ${taskId}] 写入Markdown到文件，内容长度: ${markdown.length}`
-                );
-
                 try {
-                    // 保存Markdown到文件
-                    fs.writeFileSync(outputPath, markdown, {
-                        encoding: "utf8",
-                    });
-
-                    // 检查文件是否成功写入并有内容
-                    const fileStats = fs.statSync(outputPath);
-                    console.log(
-                        `[Task: ${taskId}] 文件写入完成，大小: ${fileStats.size} 字节`
+                    // 解析进程已把结果保存到分块存储时只有清单；保存失败时没有清单，写入完整的结果文件
+                    const manifest = await readManifest(manifestPath).catch(
+                        () => null
                     );
+                    let fileStats;
+                    if (manifest) {
+                        fileStats = manifest.stats;
+                        console.log(
+                            `[Task: ${taskId}] 结果已保存到分块存储，大小: ${fileStats.size} 字节`
+                        );
+                    } else {
+                        console.log(
+                            `[Task: ${taskId}] 写入Markdown到文件，内容长度: ${markdown.length}`
+                        );
+                        // 异步保存Markdown到文件，写入大文件时不阻塞其他连接
+                        await fs.promises.writeFile(outputPath, markdown, {
+                            encoding: "utf8",
+                        });
+
+                        // 检查文件是否成功写入并有内容
+                        fileStats = await fs.promises.stat(outputPath);
+                        console.log(
+                            `[Task: ${taskId}] 文件写入完成，大小: ${fileStats.size} 字节`
+                        );
+                    }
 
                     if (fileStats.size === 0) {
                         throw new Error("文件写入失败，文件大小为0");
                     }
 
+                    finish("completed", null);
+                    indexWrittenFile(
+                        fileEntry(path.basename(outputPath), fileStats, taskId)
+                    );
+                    indexSearchDocument(outputPath, url);
+
+                    // 所有页面已写入结果文件，不再需要检查点
+                    if (checkpointPath) {
+                        fs.promises
+                            .rm(checkpointPath, { recursive: true, force: true })
+                            .catch((err) => {
+                                console.error(`[Task: ${taskId}] 删除检查点失败:`, err);
+                            });
+                    }
+
                     // 通知前端解析完成
-                    io.to(socketId).emit(`task:${taskId}:completed`, {
+                    emitToSocket(socketId, `task:${taskId}:completed`, {
                         message: "解析成功",
                     });
 
+                    // 后台生成预压缩版本，不阻塞当前请求（只有清单的结果下载时即时压缩）
+                    if (!manifest) {
+                        precompressFile(outputPath).catch((err) => {
+                            console.error(`[Task: ${taskId}] 生成预压缩文件失败:`, err);
+                        });
+                    }
+
                     resolve(markdown);
                 } catch (err) {
                     console.error(`[Task: ${taskId}] 文件写入错误:`, err);
-                    task.error = `文件写入错误: ${err.message}`;
-                    io.to(socketId).emit(`task:${taskId}:failed`, {
+                    finish("failed", `文件写入错误: ${err.message}`);
+                    emitToSocket(socketId, `task:${taskId}:failed`, {
                         error: `文件写入错误: ${err.message}`,
                     });
                     reject(err);
@@ -212,14 +1131,16 @@ async function parseDeepWiki(url, taskId, socketId) {
             } else {
                 // 解析失败
                 console.error(`[Task: ${taskId}] 解析失败，错误码: ${code}`);
-                console.error(errorOutput);
+                const error = errorTail(errorOutput);
+                console.error(error);
+                finish("failed", error);
 
                 // 通知前端解析失败
-                io.to(socketId).emit(`task:${taskId}:failed`, {
-                    error: `解析失败: ${errorOutput || "未知错误"}`,
+                emitToSocket(socketId, `task:${taskId}:failed`, {
+                    error: `解析失败: ${error || "未知错误"}`,
                 });
 
-                reject(new Error(`解析失败: ${errorOutput || "未知错误"}`));
+                reject(new Error(`解析失败: ${error || "未知错误"}`));
             }
         });
     });
@@ -228,7 +1149,7 @@ async function parseDeepWiki(url, taskId, socketId) {
 // API 路由
 app.post("/api/parse", async (req, res) => {
     try {
-        const { url } = req.body;
+        const { url, profile, force, crawl } = req.body;
 
         if (!url) {
             return res.status(400).json({
@@ -236,6 +1157,30 @@ app.post("/api/parse", async (req, res) => {
             });
         }
 
+        if (profile && !PROFILE_EXTENSIONS[profile]) {
+            return res.status(400).json({
+                error: `不支持的性能剖析方式: ${profile}，可选: ${Object.keys(
+                    PROFILE_EXTENSIONS
+                ).join(", ")}`,
+            });
+        }
+
+        // 同一URL已有解析结果时直接返回，不再重新解析（开启性能剖析、抓取所有页面或指定force时总是重新解析）
+        if (!profile && !crawl && !force) {
+            const completedTaskId = await findCompletedTask(url, {});
+            if (completedTaskId) {
+                console.log(
+                    `[API] ${url} 已有解析结果，任务ID: ${completedTaskId}`
+                );
+                return res.json({
+                    taskId: completedTaskId,
+                    status: "completed",
+                    cached: true,
+                    message: "已有解析结果",
+                });
+            }
+        }
+
         // 获取Socket.io客户端ID
         const socketId = req.headers["x-socket-id"] || "unknown";
 
@@ -245,7 +1190,7 @@ app.post("/api/parse", async (req, res) => {
         console.log(`[API] 收到解析请求: ${url}, 任务ID: ${taskId}`);
 
         // 异步启动解析任务
-        parseDeepWiki(url, taskId, socketId).catch((err) => {
+        parseDeepWiki(url, taskId, socketId, { profile, crawl }).catch((err) => {
             console.error(`[Task: ${taskId}] 解析出错:`, err);
         });
 
@@ -262,6 +1207,47 @@ app.post("/api/parse", async (req, res) => {
     }
 });
 
+// 恢复失败或已取消的多页抓取任务，已完成的页面从检查点读取，只抓取缺失的页面
+app.post("/api/task/:taskId/resume", (req, res) => {
+    const { taskId } = req.params;
+
+    const task = activeTasks.get(taskId);
+
+    if (!task) {
+        return res.status(404).json({
+            error: "找不到指定的任务",
+        });
+    }
+
+    if (!task.crawl) {
+        return res.status(400).json({
+            error: "只有抓取所有页面的任务可以恢复",
+        });
+    }
+
+    if (task.status === "running" || task.status === "completed") {
+        return res.status(409).json({
+            error: `任务状态为 ${task.status}，无需恢复`,
+        });
+    }
+
+    const socketId = req.headers["x-socket-id"] || "unknown";
+
+    console.log(`[API] 恢复任务: ${taskId}`);
+
+    parseDeepWiki(task.url, taskId, socketId, {
+        profile: task.profile,
+        crawl: true,
+    }).catch((err) => {
+        console.error(`[Task: ${taskId}] 解析出错:`, err);
+    });
+
+    res.json({
+        taskId: taskId,
+        message: "任务已恢复",
+    });
+});
+
 // 获取任务状态
 app.get("/api/task/:taskId", (req, res) => {
     const { taskId } = req.params;
@@ -280,7 +1266,7 @@ app.get("/api/task/:taskId", (req, res) => {
 });
 
 // 获取解析后的Markdown
-app.get("/api/markdown/:taskId", (req, res) => {
+app.get("/api/markdown/:taskId", async (req, res) => {
     const { taskId } = req.params;
 
     console.log(`[API] 收到获取Markdown请求，任务ID: ${taskId}`);
@@ -302,43 +1288,19 @@ app.get("/api/markdown/:taskId", (req, res) => {
         });
     }
 
-    // 读取保存的Markdown文件
+    // 以流的方式发送保存的Markdown文件
     try {
-        console.log(`[API] 读取Markdown文件: ${task.outputPath}`);
-
-        // 检查文件是否存在
-        if (!fs.existsSync(task.outputPath)) {
-            throw new Error(`文件不存在: ${task.outputPath}`);
-        }
-
-        // 检查文件大小
-        const fileStats = fs.statSync(task.outputPath);
-        console.log(`[API] Markdown文件大小: ${fileStats.size} 字节`);
-
-        if (fileStats.size === 0) {
-            throw new Error("Markdown文件为空");
-        }
-
-        const markdown = fs.readFileSync(task.outputPath, "utf-8");
-        console.log(`[API] 成功读取Markdown内容，长度: ${markdown.length}`);
-
-        if (!markdown || markdown.trim() === "") {
-            throw new Error("读取的Markdown内容为空");
-        }
-
-        res.json({
-            markdown: markdown,
-        });
+        await sendResultFile(req, res, task.outputPath, readChunkedResult);
     } catch (err) {
         console.error(`[API Error] 读取Markdown文件失败: ${err.message}`);
-        res.status(500).json({
+        res.status(err.code === "ENOENT" ? 404 : 500).json({
             error: `读取Markdown内容失败: ${err.message}`,
         });
     }
 });
 
-// 取消任务
-app.delete("/api/task/:taskId", (req, res) => {
+// 下载任务的性能剖析结果
+app.get("/api/profile/:taskId", (req, res) => {
     const { taskId } = req.params;
 
     const task = activeTasks.get(taskId);
@@ -349,17 +1311,63 @@ app.delete("/api/task/:taskId", (req, res) => {
         });
     }
 
-    // 终止进程
+    if (!task.profileFile) {
+        return res.status(404).json({
+            error: task.profile ? "性能剖析结果尚未生成" : "该任务未开启性能剖析",
+        });
+    }
+
+    res.download(task.profilePath, task.profileFile);
+});
+
+// 取消本进程中运行或排队的任务，返回是否找到
+function cancelLocalTask(taskId) {
+    const task = activeTasks.get(taskId);
+    if (!task) {
+        return false;
+    }
+
     if (task.process && !task.process.killed) {
+        // 终止进程
+        updateTask(taskId, { status: "cancelled", endTime: Date.now() });
         task.process.kill();
-        task.status = "cancelled";
+    } else if (cancelParserSlot(taskId)) {
+        // 还在排队，没有启动进程
+        updateTask(taskId, { status: "cancelled", endTime: Date.now() });
+        recordTaskStatus("cancelled");
+    } else {
+        return false;
+    }
+
+    // 通知前端任务已取消
+    emitToSocket(task.socketId, `task:${taskId}:failed`, {
+        error: "任务已取消",
+    });
+    return true;
+}
+
+// 取消任务（任务在其他工作进程上时转发给那个进程）
+function cancelTask(taskId) {
+    const task = activeTasks.get(taskId);
+    if (!cancelLocalTask(taskId) && task && task.status === "running") {
+        relay({ kind: "cancel", taskId: taskId });
+    }
+}
+
+// 取消任务
+app.delete("/api/task/:taskId", (req, res) => {
+    const { taskId } = req.params;
 
-        // 通知前端任务已取消
-        io.to(task.socketId).emit(`task:${taskId}:failed`, {
-            error: "任务已取消",
+    const task = activeTasks.get(taskId);
+
+    if (!task) {
+        return res.status(404).json({
+            error: "找不到指定的任务",
         });
     }
 
+    cancelTask(taskId);
+
     res.json({
         message: "任务已取消",
     });
@@ -368,6 +1376,10 @@ app.delete("/api/task/:taskId", (req, res) => {
 // Socket.io 连接处理
 io.on("connection", (socket) => {
     console.log(`客户端连接: ${socket.id}`);
+    // 主进程记录每个客户端连接在哪个工作进程上，其他进程发给它的事件只转发给这个进程
+    if (IN_CLUSTER) {
+        process.send({ type: "socket:connect", socketId: socket.id });
+    }
 
     // 保存socketId，以便后续API请求可以使用
     socket.on("register", (data) => {
@@ -377,20 +1389,97 @@ io.on("connection", (socket) => {
 
     socket.on("disconnect", () => {
         console.log(`客户端断开连接: ${socket.id}`);
+        if (IN_CLUSTER) {
+            process.send({ type: "socket:disconnect", socketId: socket.id });
+        }
         // 清理该socket的任务
         for (const [taskId, task] of activeTasks.entries()) {
             if (task.socketId === socket.id && task.status === "running") {
                 // 终止相关进程
-                if (task.process && !task.process.killed) {
-                    task.process.kill();
-                    task.status = "cancelled";
-                }
+                cancelTask(taskId);
                 console.log(`清理任务: ${taskId}`);
             }
         }
     });
 });
 
+// 处理其他工作进程转发来的消息
+function handleRelayed(message) {
+    switch (message.kind) {
+        case "emit":
+            if (io.sockets.sockets.has(message.socketId)) {
+                io.to(message.socketId).emit(message.event, message.data);
+            }
+            break;
+        case "task": {
+            // 本进程运行的任务以本进程的状态为准
+            const task = activeTasks.get(message.taskId);
+            if (task && task.process) {
+                break;
+            }
+            activeTasks.set(message.taskId, {
+                ...task,
+                ...message.fields,
+                process: null,
+            });
+            if (message.fields.status === "completed") {
+                completedByUrl.set(
+                    completedTaskKey(message.fields.url, message.fields),
+                    message.taskId
+                );
+            }
+            break;
+        }
+        case "file":
+            indexFile(message.entry);
+            break;
+        case "metrics":
+            recordParserMetrics(message.metrics, true);
+            break;
+        case "taskStatus":
+            recordTaskStatus(message.status, true);
+            break;
+        case "cancel":
+            cancelLocalTask(message.taskId);
+            break;
+    }
+}
+
+if (IN_CLUSTER) {
+    process.on("message", (msg) => {
+        switch (msg.type) {
+            case "pool:granted": {
+                const resolve = parserSlotWaiters.get(msg.taskId);
+                if (resolve) {
+                    parserSlotWaiters.delete(msg.taskId);
+                    resolve(true);
+                }
+                break;
+            }
+            case "tasks:orphaned":
+                // 其他工作进程退出，它运行和排队的任务不会再有结果
+                for (const taskId of msg.taskIds) {
+                    const task = activeTasks.get(taskId);
+                    if (task && task.status === "running") {
+                        updateTask(taskId, {
+                            status: "failed",
+                            endTime: Date.now(),
+                            error: "工作进程退出，任务中断",
+                        });
+                        recordTaskStatus("failed");
+                        emitToSocket(task.socketId, `task:${taskId}:failed`, {
+                            error: "工作进程退出，任务中断",
+                        });
+                    }
+                }
+                break;
+            case "relay":
+                handleRelayed(msg.message);
+                break;
+        }
+    });
+}
+
 // 调试终端点 - 直接解析测试URL
 app.get("/api/test-parse", async (req, res) => {
     try {
@@ -454,52 +1543,121 @@ app.get("/api/test-parse", async (req, res) => {
 });
 
 // 文件查看和管理API
+// 参数: sort(modified/name/size) order(asc/desc) limit repo(owner/repo或仓库URL) cursor(上一页返回的nextCursor)
 app.get("/api/files", (req, res) => {
-    try {
-        // 获取temp目录下所有文件
-        const files = fs.readdirSync(TEMP_DIR);
-
-        // 收集文件信息
-        const fileInfos = files.map((filename) => {
-            const filePath = path.join(TEMP_DIR, filename);
-            const stats = fs.statSync(filePath);
-            return {
-                name: filename,
-                size: stats.size,
-                created: stats.birthtime,
-                modified: stats.mtime,
-            };
+    const sort = req.query.sort || "modified";
+    if (!FILE_SORT_KEYS.includes(sort)) {
+        return res.status(400).json({
+            error: `不支持的排序方式: ${sort}，可选: ${FILE_SORT_KEYS.join(", ")}`,
+        });
+    }
+    const order = req.query.order || (sort === "name" ? "asc" : "desc");
+    if (order !== "asc" && order !== "desc") {
+        return res.status(400).json({
+            error: `不支持的排序顺序: ${order}，可选: asc, desc`,
         });
+    }
+    const limit = Math.min(
+        parseInt(req.query.limit, 10) || FILE_PAGE_SIZE,
+        FILE_PAGE_MAX
+    );
+
+    let repo = "";
+    if (req.query.repo) {
+        repo = req.query.repo.includes("://")
+            ? repoOfUrl(req.query.repo) || ""
+            : req.query.repo.replace(/^\/+|\/+$/g, "").toLowerCase();
+    }
+    const listing = fileListings.get(repo);
+    const list = listing ? listing[sort] : [];
+
+    const page = pageFiles(list, sort, order, limit, req.query.cursor);
+    if (!page) {
+        return res.status(400).json({
+            error: "无效的cursor",
+        });
+    }
 
+    res.json({
+        files: page.files.map((file) => ({
+            name: file.name,
+            size: file.size,
+            created: new Date(file.created),
+            modified: new Date(file.modified),
+            url: file.url,
+            taskId: file.taskId,
+        })),
+        total: list.length,
+        nextCursor: page.nextCursor,
+    });
+});
+
+// 全文搜索所有解析结果，返回按相关度排序的章节
+// 参数: q(查询词) repo(owner/repo或仓库URL) limit
+app.get("/api/search", async (req, res) => {
+    const query = (req.query.q || "").trim();
+    if (!query) {
+        return res.status(400).json({
+            error: "请提供查询参数q",
+        });
+    }
+    let repo = null;
+    if (req.query.repo) {
+        repo = req.query.repo.includes("://")
+            ? repoOfUrl(req.query.repo)
+            : req.query.repo.replace(/^\/+|\/+$/g, "").toLowerCase();
+    }
+
+    try {
+        const { hits, took } = await searchRequest("search", {
+            query: query,
+            repo: repo,
+            limit: parseInt(req.query.limit, 10) || undefined,
+        });
         res.json({
-            files: fileInfos,
+            query: query,
+            hits: hits.map((hit) => {
+                const entry = fileIndex.get(hit.name);
+                return {
+                    file: hit.name,
+                    taskId: entry ? entry.taskId : null,
+                    url: hit.url,
+                    repo: hit.repo,
+                    section: hit.position,
+                    heading: hit.heading,
+                    snippet: hit.snippet,
+                    score: hit.score,
+                };
+            }),
+            took: took,
         });
     } catch (err) {
-        console.error("[API Error] 获取文件列表失败:", err);
+        console.error("[API Error] 搜索失败:", err);
         res.status(500).json({
-            error: `获取文件列表失败: ${err.message}`,
+            error: `搜索失败: ${err.message}`,
         });
     }
 });
 
-app.get("/api/file/:filename", (req, res) => {
+app.get("/api/file/:filename", async (req, res) => {
     try {
         const { filename } = req.params;
-        const filePath = path.join(TEMP_DIR, filename);
-
-        if (!fs.existsSync(filePath)) {
+        const name = path.basename(filename);
+        // 只允许访问TEMP_DIR下文件列表中的文件；任务日志、搜索索引等内部状态以"."开头，不对外提供
+        if (!isListedFile(name)) {
             return res.status(404).json({
                 error: "文件不存在",
             });
         }
+        const filePath = path.join(TEMP_DIR, name);
 
-        const content = fs.readFileSync(filePath, "utf-8");
-        res.json({
-            filename,
-            content,
-            size: content.length,
-        });
+        await sendResultFile(req, res, filePath, readChunkedResult);
     } catch (err) {
+        if (err.code === "ENOENT") {
+            return res.status(404).json({
+                error: "文件不存在",
+            });
+        }
         console.error("[API Error] 读取文件失败:", err);
         res.status(500).json({
             error: `读取文件失败: ${err.message}`,
@@ -507,6 +1665,12 @@ app.get("/api/file/:filename", (req, res) => {
     }
 });
 
+// Prometheus指标
+app.get("/metrics", (req, res) => {
+    res.set("Content-Type", "text/plain; version=0.0.4; charset=utf-8");
+    res.send(renderMetrics());
+});
+
 // 处理前端路由 - 确保这是最后一个路由处理器
 app.get("/*", (req, res) => {
     res.sendFile(path.join(__dirname, "../../frontend/dist/index.html"));
@@ -514,9 +1678,29 @@ app.get("/*", (req, res) => {
 
 // 启动服务器
 const PORT = process.env.PORT || 3000;
-server.listen(PORT, () => {
-    console.log(`服务器运行在端口 ${PORT}`);
-});
+// 先从任务日志恢复任务并建立文件索引，再开始接受请求
+loadTaskJournal()
+    .catch((err) => {
+        console.error("[Journal] 恢复任务失败:", err);
+    })
+    .then(buildFileIndex)
+    .catch((err) => {
+        console.error("[Files] 建立文件索引失败:", err);
+    })
+    .then(() => {
+        // 集群模式下只由负责恢复任务的工作进程同步搜索索引，在后台进行，不推迟启动
+        if (!IN_CLUSTER || process.env.TASK_JOURNAL_RECOVER === "1") {
+            syncSearchIndex().catch((err) => {
+                console.error("[Search] 同步搜索索引失败:", err.message);
+            });
+        }
+        server.listen(PORT, () => {
+            console.log(`服务器运行在端口 ${PORT}`);
+            if (IN_CLUSTER) {
+                process.send({ type: "ready" });
+            }
+        });
+    });
 
 // 优雅退出：清理所有活跃任务
 process.on("SIGINT", () => {
@@ -530,8 +1714,14 @@ process.on("SIGINT", () => {
         }
     }
 
+    // 搜索和分块存储进程读到输入结束后关闭数据库并退出
+    searchService.close();
+    chunkService.close();
+
     // 关闭服务器
-    server.close(() => {
+    server.close(async () => {
+        // 等待任务日志写完
+        await journalFlushing;
         console.log("服务器已关闭");
         process.exit(0);
     });
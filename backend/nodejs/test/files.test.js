@@ -0,0 +1,275 @@
+// 结果文件列表分页和下载的测试，运行: npm test（node --test）
+const test = require("node:test");
+const assert = require("node:assert");
+const fs = require("fs");
+const http = require("http");
+const os = require("os");
+const path = require("path");
+const zlib = require("zlib");
+
+const {
+    compareFiles,
+    searchFiles,
+    pageFiles,
+    parseRange,
+    sendResultFile,
+} = require("../files");
+
+// 按key升序排列的文件列表，排序值有重复
+function makeList(key, count) {
+    const list = [];
+    for (let i = 0; i < count; i++) {
+        list.push({ name: `f${String(i).padStart(2, "0")}.md`, size: i % 4 });
+    }
+    return list.sort((a, b) => compareFiles(key, a, b));
+}
+
+// 按cursor逐页取完整个列表
+function pageAll(list, key, order, limit) {
+    const names = [];
+    let cursor = null;
+    for (let pages = 0; pages <= list.length; pages++) {
+        const page = pageFiles(list, key, order, limit, cursor);
+        names.push(...page.files.map((file) => file.name));
+        cursor = page.nextCursor;
+        if (!cursor) {
+            return names;
+        }
+    }
+    throw new Error("分页没有结束");
+}
+
+test("searchFiles 返回第一个不小于（strict时大于）probe的位置", () => {
+    const list = makeList("size", 8);
+    const probe = { size: 1, name: list[2].name };
+    assert.strictEqual(searchFiles(list, "size", probe, false), 2);
+    assert.strictEqual(searchFiles(list, "size", probe, true), 3);
+    assert.strictEqual(searchFiles(list, "size", { size: -1, name: "" }, false), 0);
+    assert.strictEqual(searchFiles(list, "size", { size: 9, name: "" }, false), 8);
+});
+
+test("按cursor翻页不重复也不遗漏", () => {
+    const list = makeList("size", 23);
+    const names = list.map((file) => file.name);
+    for (const limit of [1, 3, 5, 23, 50]) {
+        assert.deepStrictEqual(pageAll(list, "size", "asc", limit), names);
+        assert.deepStrictEqual(
+            pageAll(list, "size", "desc", limit),
+            [...names].reverse()
+        );
+    }
+});
+
+test("翻页期间列表变化时从cursor处继续", () => {
+    const list = makeList("size", 10);
+    const first = pageFiles(list, "size", "asc", 4, null);
+    const lastSeen = first.files[first.files.length - 1];
+    // 在已返回的位置之前插入和删除文件，不影响下一页的起点
+    list.splice(0, 1);
+    list.splice(searchFiles(list, "size", { size: 0, name: "a.md" }, false), 0, {
+        name: "a.md",
+        size: 0,
+    });
+    const second = pageFiles(list, "size", "asc", 4, first.nextCursor);
+    assert.ok(compareFiles("size", second.files[0], lastSeen) > 0);
+    assert.strictEqual(
+        second.files[0],
+        list[searchFiles(list, "size", lastSeen, true)]
+    );
+});
+
+test("最后一页和空列表的nextCursor为null，无效cursor返回null", () => {
+    const list = makeList("name", 3);
+    assert.strictEqual(pageFiles(list, "name", "asc", 3, null).nextCursor, null);
+    assert.deepStrictEqual(pageFiles([], "name", "desc", 10, null), {
+        files: [],
+        nextCursor: null,
+    });
+    assert.strictEqual(pageFiles(list, "name", "asc", 3, "not-json"), null);
+});
+
+test("parseRange", () => {
+    assert.strictEqual(parseRange(undefined, 10), null);
+    assert.deepStrictEqual(parseRange("bytes=0-4", 10), { start: 0, end: 4 });
+    assert.deepStrictEqual(parseRange("bytes=5-", 10), { start: 5, end: 9 });
+    assert.deepStrictEqual(parseRange("bytes=-3", 10), { start: 7, end: 9 });
+    assert.deepStrictEqual(parseRange("bytes=-30", 10), { start: 0, end: 9 });
+    assert.deepStrictEqual(parseRange("bytes=8-100", 10), { start: 8, end: 9 });
+    assert.strictEqual(parseRange("bytes=10-", 10), false);
+    assert.strictEqual(parseRange("bytes=5-2", 10), false);
+    assert.strictEqual(parseRange("bytes=-", 10), false);
+    assert.strictEqual(parseRange("bytes=0-1,3-4", 10), false);
+    assert.strictEqual(parseRange("items=0-1", 10), false);
+});
+
+// 用http服务器调用sendResultFile，server.js中ENOENT对应404
+async function withServer(dir, readChunked, run) {
+    const server = http.createServer((req, res) => {
+        res.status = (code) => {
+            res.statusCode = code;
+            return res;
+        };
+        sendResultFile(req, res, path.join(dir, req.url.slice(1)), readChunked).catch(
+            (err) => {
+                res.statusCode = err.code === "ENOENT" ? 404 : 500;
+                res.end();
+            }
+        );
+    });
+    await new Promise((resolve) => server.listen(0, "127.0.0.1", resolve));
+    try {
+        await run(server.address().port);
+    } finally {
+        server.close();
+    }
+}
+
+// 发送请求，不自动解压，返回 { status, headers, body }
+function request(port, name, headers = {}, method = "GET") {
+    return new Promise((resolve, reject) => {
+        const req = http.request(
+            { port: port, path: "/" + name, headers: headers, method: method },
+            (res) => {
+                const chunks = [];
+                res.on("data", (chunk) => chunks.push(chunk));
+                res.on("end", () =>
+                    resolve({
+                        status: res.statusCode,
+                        headers: res.headers,
+                        body: Buffer.concat(chunks),
+                    })
+                );
+            }
+        );
+        req.on("error", reject);
+        req.end();
+    });
+}
+
+function tempDir() {
+    return fs.mkdtempSync(path.join(os.tmpdir(), "files-test-"));
+}
+
+test("结果文件：ETag、If-None-Match、Range、预压缩版本和HEAD", async () => {
+    const dir = tempDir();
+    const content = Buffer.from("# 标题\n" + "正文 ".repeat(400));
+    fs.writeFileSync(path.join(dir, "a.md"), content);
+    fs.writeFileSync(path.join(dir, "a.md.gz"), zlib.gzipSync(content));
+    try {
+        await withServer(dir, null, async (port) => {
+            const full = await request(port, "a.md");
+            assert.strictEqual(full.status, 200);
+            assert.ok(full.body.equals(content));
+            assert.strictEqual(full.headers["content-type"], "text/markdown; charset=utf-8");
+            assert.strictEqual(full.headers["accept-ranges"], "bytes");
+            const etag = full.headers.etag;
+
+            assert.strictEqual(
+                (await request(port, "a.md", { "if-none-match": etag })).status,
+                304
+            );
+            assert.strictEqual(
+                (await request(port, "a.md", { "if-none-match": `"x", W/${etag}` })).status,
+                304
+            );
+            assert.strictEqual(
+                (await request(port, "a.md", { "if-none-match": '"other"' })).status,
+                200
+            );
+
+            const range = await request(port, "a.md", { range: "bytes=2-9" });
+            assert.strictEqual(range.status, 206);
+            assert.strictEqual(range.headers["content-range"], `bytes 2-9/${content.length}`);
+            assert.ok(range.body.equals(content.subarray(2, 10)));
+
+            const unsatisfiable = await request(port, "a.md", {
+                range: `bytes=${content.length}-`,
+            });
+            assert.strictEqual(unsatisfiable.status, 416);
+            assert.strictEqual(
+                unsatisfiable.headers["content-range"],
+                `bytes */${content.length}`
+            );
+
+            const gzip = await request(port, "a.md", { "accept-encoding": "gzip, deflate" });
+            assert.strictEqual(gzip.headers["content-encoding"], "gzip");
+            assert.strictEqual(gzip.headers.etag, etag.replace(/"$/, '-gzip"'));
+            assert.ok(zlib.gunzipSync(gzip.body).equals(content));
+            // 压缩版本的ETag不同，但未压缩版本的ETag也视为未修改
+            assert.strictEqual(
+                (await request(port, "a.md", { "accept-encoding": "gzip", "if-none-match": etag }))
+                    .status,
+                304
+            );
+            // 没有生成的版本不使用；Range请求不使用压缩版本
+            assert.strictEqual(
+                (await request(port, "a.md", { "accept-encoding": "br" })).headers[
+                    "content-encoding"
+                ],
+                undefined
+            );
+            const rangeGzip = await request(port, "a.md", {
+                "accept-encoding": "gzip",
+                range: "bytes=0-1",
+            });
+            assert.strictEqual(rangeGzip.status, 206);
+            assert.strictEqual(rangeGzip.headers["content-encoding"], undefined);
+
+            const head = await request(port, "a.md", {}, "HEAD");
+            assert.strictEqual(head.status, 200);
+            assert.strictEqual(head.headers["content-length"], String(content.length));
+            assert.strictEqual(head.body.length, 0);
+
+            assert.strictEqual((await request(port, "missing.md")).status, 404);
+        });
+    } finally {
+        fs.rmSync(dir, { recursive: true, force: true });
+    }
+});
+
+test("只有清单的结果从分块存储还原", async () => {
+    const dir = tempDir();
+    const markdown = "# 分块\n" + "内容 ".repeat(500);
+    const size = Buffer.byteLength(markdown);
+    fs.writeFileSync(
+        path.join(dir, "b.chunks.json"),
+        JSON.stringify({ version: 1, page: "ab".repeat(32), size: size })
+    );
+    const reads = [];
+    const readChunked = async (manifestPath) => {
+        reads.push(manifestPath);
+        return markdown;
+    };
+    try {
+        await withServer(dir, readChunked, async (port) => {
+            const full = await request(port, "b.md");
+            assert.strictEqual(full.status, 200);
+            assert.strictEqual(full.body.toString("utf8"), markdown);
+            assert.strictEqual(full.headers["content-length"], String(size));
+            assert.strictEqual(full.headers.etag, `"${"ab".repeat(16)}"`);
+            assert.deepStrictEqual(reads, [path.join(dir, "b.chunks.json")]);
+
+            // ETag匹配时不读取分块存储
+            const cached = await request(port, "b.md", { "if-none-match": full.headers.etag });
+            assert.strictEqual(cached.status, 304);
+            assert.strictEqual(reads.length, 1);
+
+            const range = await request(port, "b.md", { range: "bytes=-6" });
+            assert.strictEqual(range.status, 206);
+            assert.strictEqual(range.headers["content-range"], `bytes ${size - 6}-${size - 1}/${size}`);
+            assert.ok(range.body.equals(Buffer.from(markdown).subarray(size - 6)));
+
+            const gzip = await request(port, "b.md", { "accept-encoding": "gzip" });
+            assert.strictEqual(gzip.headers["content-encoding"], "gzip");
+            assert.strictEqual(zlib.gunzipSync(gzip.body).toString("utf8"), markdown);
+
+            assert.strictEqual((await request(port, "c.md")).status, 404);
+        });
+        // 没有分块存储时只发送已有的文件
+        await withServer(dir, null, async (port) => {
+            assert.strictEqual((await request(port, "b.md")).status, 404);
+        });
+    } finally {
+        fs.rmSync(dir, { recursive: true, force: true });
+    }
+});
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+内存基准测试 - 测量不同大小页面解析时的内存峰值
+用法: python bench_memory.py [--sizes 1,5,10] [--parser <parse_deepwiki.py路径>]
+
+每个页面大小在独立的子进程中运行，分别记录tracemalloc统计的Python堆峰值和进程的峰值RSS。
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from corpus import make_page
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PARSER = os.path.join(BENCH_DIR, "..", "parse_deepwiki.py")
+
+
+def run_one(parser_path, size_mb):
+    """在当前进程中解析一个页面并输出测量结果（由子进程调用）"""
+    import logging
+    import resource
+    import time
+    import tracemalloc
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(parser_path)))
+    from parse_deepwiki import DeepWikiParser
+    logging.disable(logging.CRITICAL)
+
+    html = make_page(size_mb)
+    parser = DeepWikiParser()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    markdown = parser.parse_html_to_markdown(html)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({
+        "size_mb": size_mb,
+        "html_bytes": len(html),
+        "markdown_chars": len(markdown or ""),
+        "seconds": round(elapsed, 3),
+        "tracemalloc_peak_mb": round(peak / 1024 / 1024, 1),
+        # Linux上ru_maxrss单位为KB
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    """命令行入口点"""
+    arg_parser = argparse.ArgumentParser(description="DeepWiki解析器内存基准测试")
+    arg_parser.add_argument("--sizes", default="1,5,10", help="页面大小列表(MB)，逗号分隔")
+    arg_parser.add_argument("--parser", default=DEFAULT_PARSER, help="被测试的parse_deepwiki.py路径")
+    arg_parser.add_argument("--one", type=float, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.one is not None:
+        run_one(args.parser, args.one)
+        return 0
+
+    print(f"{'大小(MB)':>8} {'耗时(s)':>8} {'tracemalloc峰值(MB)':>20} {'峰值RSS(MB)':>12}")
+    for size in [float(s) for s in args.sizes.split(",")]:
+        output = subprocess.run(
+            [sys.executable, __file__, "--parser", args.parser, "--one", str(size)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{size:>8g} {result['seconds']:>8} {result['tracemalloc_peak_mb']:>20} {result['max_rss_mb']:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
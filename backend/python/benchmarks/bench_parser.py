@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+解析器基准测试 - 分阶段测量语料页面的抓取、解析和转换耗时
+用法: python bench_parser.py [--pages small,typical] [--repeat 3] [--update] [--tolerance 1.25]
+
+阶段:
+    fetch    从本地替身服务器抓取页面 (fetch_deepwiki_content)
+    parse    完整的HTML到Markdown流程 (parse_html_to_markdown)
+    extract  代码块提取，包含构建文档树 (extract_code_blocks_from_html)
+    convert  只测量文档树到Markdown的转换 (_convert_to_markdown)
+
+每个阶段取多次运行中的最短耗时，另外单独运行一次 parse 阶段统计tracemalloc峰值内存。
+结果与 baselines/parser.json 比较，任一阶段耗时或峰值内存超出容差时以非零状态退出。
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+from corpus import CORPUS, load_corpus
+from standin import start_standin_server
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCH_DIR, "..")))
+
+from parse_deepwiki import DeepWikiParser  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "parser.json")
+STAGES = ("fetch", "parse", "extract", "convert")
+# 耗时超出基线不到该值(秒)时不算回归：本地回环抓取等毫秒级的耗时波动远大于相对容差
+TIME_FLOOR = 0.002
+
+
+def _best_of(repeat, func):
+    """运行repeat次，返回最短耗时(s)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_page(name, html, base_url, repeat):
+    """测量单个页面的各阶段耗时和峰值内存"""
+    parser = DeepWikiParser()
+    result = {"bytes": len(html)}
+
+    result["fetch"] = _best_of(repeat, lambda: parser.fetch_deepwiki_content(f"{base_url}/{name}"))
+    result["parse"] = _best_of(repeat, lambda: parser.parse_html_to_markdown(html))
+    result["extract"] = _best_of(repeat, lambda: parser.extract_code_blocks_from_html(html))
+
+    soup = parser._make_soup(html)
+    main_content = soup.select_one(".prose-custom-md")
+    result["convert"] = _best_of(repeat, lambda: parser._convert_to_markdown(main_content))
+    soup.decompose()
+
+    tracemalloc.start()
+    parser.parse_html_to_markdown(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["peak_mb"] = peak / 1024 / 1024
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """与基线比较，返回回归描述列表"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in STAGES + ("peak_mb",):
+            floor = TIME_FLOOR if key in STAGES else 0
+            if key in base and result[key] > base[key] * tolerance and result[key] - base[key] > floor:
+                regressions.append(
+                    f"{name}.{key}: {result[key]:.4f} > 基线 {base[key]:.4f} x {tolerance}"
+                )
+    return regressions
+
+
+def main():
+    """命令行入口点"""
+    arg_parser = argparse.ArgumentParser(description="DeepWiki解析器分阶段基准测试")
+    arg_parser.add_argument("--pages", help="只测试指定页面，逗号分隔，默认全部: " + ",".join(CORPUS))
+    arg_parser.add_argument("--repeat", type=int, default=3, help="每个阶段的运行次数")
+    arg_parser.add_argument("--tolerance", type=float, default=1.25, help="相对基线允许的增长比例")
+    arg_parser.add_argument("--update", action="store_true", help="把本次结果写入基线文件")
+    args = arg_parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    pages = load_corpus(args.pages.split(",") if args.pages else None)
+    server, base_url = start_standin_server(pages)
+
+    results = {}
+    try:
+        print(f"{'页面':<14} {'大小(KB)':>9} " + " ".join(f"{s + '(ms)':>12}" for s in STAGES)
+              + f" {'MB/s':>7} {'峰值(MB)':>9}")
+        for name, html in pages.items():
+            result = bench_page(name, html, base_url, args.repeat)
+            results[name] = result
+            print(f"{name:<14} {result['bytes'] / 1024:>9.1f} "
+                  + " ".join(f"{result[s] * 1000:>12.1f}" for s in STAGES)
+                  + f" {result['bytes'] / 1024 / 1024 / result['parse']:>7.2f} {result['peak_mb']:>9.1f}")
+    finally:
+        server.shutdown()
+
+    total_bytes = sum(r["bytes"] for r in results.values())
+    total_parse = sum(r["parse"] for r in results.values())
+    print(f"\n合计: {len(results)} 个页面, parse 吞吐 {total_bytes / 1024 / 1024 / total_parse:.2f} MB/s, "
+          f"{len(results) / total_parse:.2f} pages/s")
+
+    if args.update:
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update({
+            name: {key: round(value, 4) for key, value in result.items()}
+            for name, result in results.items()
+        })
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"基线已更新: {BASELINE_PATH}")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print("没有基线文件，使用 --update 生成")
+        return 0
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n性能回归:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("与基线相比没有回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
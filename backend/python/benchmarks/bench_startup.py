@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+启动时间基准测试 - 测量parse_deepwiki.py的导入耗时和命令行入口的启动耗时
+用法: python bench_startup.py [--runs 10] [--update]
+
+server.js 每个请求都会启动一个解析器进程，所以启动耗时直接计入请求延迟。
+结果与 baselines/startup.json 比较，超出预算时以非零状态退出。
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSER_DIR = os.path.normpath(os.path.join(BENCH_DIR, ".."))
+PARSER_PATH = os.path.join(PARSER_DIR, "parse_deepwiki.py")
+CLI_PATH = os.path.join(PARSER_DIR, "deepwiki_cli.py")
+TEST_URL = "https://github.com/Arshtyi/LaTeX-Templates"
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "startup.json")
+
+# 命令行入口只做URL转换时的启动预算，包含解释器本身的启动时间
+STARTUP_BUDGET_MS = 100
+# 相对于基线允许的导入耗时增长比例（导入耗时按解释器启动耗时归一化后比较）
+IMPORT_TOLERANCE = 1.5
+
+
+def _bytecode_env():
+    """允许写入字节码缓存，与正式部署一致"""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def measure_wall(cmd, runs):
+    """多次运行命令，返回耗时中位数(ms)，第一次运行只用于生成字节码缓存"""
+    env = _bytecode_env()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def measure_importtime(runs):
+    """使用 -X importtime 测量导入parse_deepwiki模块的耗时(us)，返回中位数和最慢的依赖"""
+    totals = []
+    modules = {}
+    for _ in range(runs):
+        stderr = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import parse_deepwiki"],
+            cwd=PARSER_DIR, check=True, capture_output=True, text=True, env=_bytecode_env(),
+        ).stderr
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            parts = line[len("import time:"):].split("|")
+            try:
+                cumulative = int(parts[1])
+            except ValueError:
+                continue  # 表头
+            name = parts[2].strip()
+            modules[name] = cumulative
+            if name == "parse_deepwiki":
+                totals.append(cumulative)
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:5]
+    return statistics.median(totals), slowest
+
+
+def main():
+    """命令行入口点"""
+    arg_parser = argparse.ArgumentParser(description="DeepWiki解析器启动时间基准测试")
+    arg_parser.add_argument("--runs", type=int, default=10, help="每项测量的运行次数")
+    arg_parser.add_argument("--update", action="store_true", help="把本次结果写入基线文件")
+    args = arg_parser.parse_args()
+
+    interpreter_ms = measure_wall([sys.executable, "-c", "pass"], args.runs)
+    convert_url_ms = measure_wall([sys.executable, CLI_PATH, "--convert-url", TEST_URL], args.runs)
+    script_ms = measure_wall([sys.executable, PARSER_PATH, "--convert-url", TEST_URL], args.runs)
+    import_us, slowest = measure_importtime(args.runs)
+
+    result = {
+        "interpreter_ms": round(interpreter_ms, 1),
+        "convert_url_ms": round(convert_url_ms, 1),
+        "convert_url_script_ms": round(script_ms, 1),
+        "import_parse_deepwiki_us": int(import_us),
+    }
+    print(json.dumps(result, indent=2))
+    print("导入耗时最多的模块(us):")
+    for name, cumulative in slowest:
+        print(f"  {cumulative:>8}  {name}")
+
+    if args.update:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"基线已更新: {BASELINE_PATH}")
+        return 0
+
+    failed = False
+    if convert_url_ms > STARTUP_BUDGET_MS:
+        print(f"失败: 命令行入口启动耗时 {convert_url_ms:.1f}ms 超出预算 {STARTUP_BUDGET_MS}ms")
+        failed = True
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+        # 除以同一次运行的解释器启动耗时，机器整体变快或变慢时比值基本不变
+        ratio = import_us / 1000 / interpreter_ms
+        baseline_ratio = baseline["import_parse_deepwiki_us"] / 1000 / baseline["interpreter_ms"]
+        print(f"导入耗时/解释器启动耗时: {ratio:.3f}（基线 {baseline_ratio:.3f}）")
+        if ratio > baseline_ratio * IMPORT_TOLERANCE:
+            print(f"失败: 模块导入耗时与解释器启动耗时之比 {ratio:.3f} 超出基线 {baseline_ratio:.3f} 的 "
+                  f"{IMPORT_TOLERANCE} 倍")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
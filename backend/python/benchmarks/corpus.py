@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+基准测试页面语料
+
+页面按固定规则生成，结构与DeepWiki页面一致（.prose-custom-md 主要内容区域、
+标题、段落、列表、代码块、表格、mermaid图表、$!/$ 占位标记和内嵌脚本），
+每次生成的内容完全相同，测量结果可以直接与基线比较。
+保存下来的真实DeepWiki页面可以直接放进 corpus/ 目录，文件名(去掉.html)即页面名。
+"""
+
+import os
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+# 页面名 -> (页面类型, 目标大小MB)
+CORPUS = {
+    "small": ("typical", 0.02),
+    "typical": ("typical", 0.3),
+    "huge": ("typical", 4),
+    "diagram-heavy": ("diagrams", 0.5),
+    "table-heavy": ("tables", 0.5),
+    "code-heavy": ("code", 0.5),
+}
+
+_TYPICAL_SECTION = (
+    '<h2>Section {i} <button>copy</button></h2>'
+    '<p>Paragraph <strong>bold {i}</strong> with <a href="/r/{i}">link</a> and <code>inline()</code>.</p>'
+    '<ul><li>item a</li><li>item <b>b</b></li></ul>'
+    '<ol><li>first</li><li>second <em>step</em></li></ol>'
+    '<pre class="language-python"><code class="language-python">def f_{i}(x):\n'
+    '    if x &lt; 3:\n        <span class="hljs-keyword">return</span> &quot;a&amp;b&quot;\n'
+    '    return x\n</code></pre>'
+    '<blockquote><p>Note {i}</p></blockquote>'
+    '<table><thead><tr><th>A</th><th>B</th></tr></thead>'
+    '<tbody><tr><td>1</td><td><code>x</code></td></tr></tbody></table>'
+    '<pre><code>graph TD\n  A{i}--&gt;B{i}\n</code></pre>'
+)
+
+_DIAGRAM_SECTION = (
+    '<h3>Diagram {i}</h3>'
+    '<p>The flowchart below shows component {i}.</p>'
+    '<pre><code class="language-mermaid">flowchart LR\n'
+    '  A{i}[Client] --&gt; B{i}[Server]\n  B{i} --&gt; C{i}[(Database)]\n'
+    '  B{i} --&gt; D{i}[Cache]\n</code></pre>'
+    '<div class="diagram" data-chart="sequenceDiagram participant A{i}"><pre>$!/$</pre></div>'
+    '<pre><code>sequenceDiagram\n  participant U{i}\n  U{i}-&gt;&gt;S: request\n  S--&gt;&gt;U{i}: response\n</code></pre>'
+    '<div><p>classDiagram placeholder {i}</p></div>'
+)
+
+_TABLE_SECTION = (
+    '<h3>Table {i}</h3>'
+    '<table><thead><tr><th>Name</th><th>Type</th><th>Default</th><th>Description</th></tr></thead><tbody>'
+    + ''.join(
+        '<tr><td><code>opt_{i}_%d</code></td><td>string</td><td><em>none</em></td>'
+        '<td>Option %d of table {i} with <a href="/opt/%d">details</a></td></tr>' % (r, r, r)
+        for r in range(12)
+    )
+    + '</tbody></table>'
+)
+
+# 高亮后的代码块：每个token包在span中，含HTML实体和缩进
+_CODE_SECTION = (
+    '<h3>Module {i}</h3>'
+    '<p>Source of <code>module_{i}.py</code>:</p>'
+    '<pre class="language-python"><code class="language-python hljs">'
+    + ''.join(
+        '<span class="hljs-keyword">def</span> <span class="hljs-title function_">handler_{i}_%d</span>'
+        '(<span class="hljs-params">request, *args</span>):\n'
+        '    <span class="hljs-comment"># check &quot;%d&quot; &amp; dispatch</span>\n'
+        '    <span class="hljs-keyword">if</span> request.size &lt; <span class="hljs-number">%d</span> '
+        '<span class="hljs-keyword">and</span> args:\n'
+        '        <span class="hljs-keyword">return</span> <span class="hljs-string">&#x27;&lt;ok&gt;&#x27;</span>\n'
+        '    <span class="hljs-keyword">return</span> <span class="hljs-literal">None</span>\n\n' % (r, r, r)
+        for r in range(8)
+    )
+    + '</code></pre>'
+    '<pre><code class="language-bash">$ python -m module_{i} --verbose\n  done\n</code></pre>'
+)
+
+_SECTIONS = {
+    "typical": _TYPICAL_SECTION,
+    "diagrams": _DIAGRAM_SECTION,
+    "tables": _TABLE_SECTION,
+    "code": _CODE_SECTION,
+}
+
+
+def make_page(target_mb, kind="typical"):
+    """生成指定类型、大小约为target_mb MB的页面"""
+    section = _SECTIONS[kind]
+    target = int(target_mb * 1024 * 1024)
+    parts = []
+    size = 0
+    i = 0
+    while size < target:
+        chunk = section.format(i=i)
+        parts.append(chunk)
+        size += len(chunk)
+        i += 1
+    return (
+        '<html><head><script>var d = "flowchart LR";</script><style>p{}</style></head><body>'
+        '<nav><p>Navigation</p></nav>'
+        '<div class="prose-custom-md"><h1>Title</h1>' + ''.join(parts) + '</div>'
+        '<script type="application/json">{"chart": "graph TD\\n  A--&gt;B"}</script>'
+        '</body></html>'
+    ).encode("utf-8")
+
+
+def load_corpus(names=None):
+    """返回 {页面名: HTML字节}，corpus/ 目录下的页面优先，其余按规则生成"""
+    pages = {}
+    if os.path.isdir(CORPUS_DIR):
+        for filename in sorted(os.listdir(CORPUS_DIR)):
+            if filename.endswith(".html"):
+                with open(os.path.join(CORPUS_DIR, filename), "rb") as f:
+                    pages[filename[:-len(".html")]] = f.read()
+    for name, (kind, size_mb) in CORPUS.items():
+        if name not in pages:
+            pages[name] = make_page(size_mb, kind)
+    if names:
+        pages = {name: pages[name] for name in names}
+    return pages
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+本地DeepWiki替身服务器，基准测试中代替真实的DeepWiki站点提供页面
+也可以单独运行，供后端负载测试使用（启动后在第一行输出服务器地址）:
+    python standin.py [--pages small,typical] [--port 0] [--slow-rate 0.05 --slow-delay 5]
+
+--slow-rate 按比例随机让响应在发送响应体前停顿 --slow-delay 秒，模拟上游的长尾延迟。
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    """按路径返回语料页面，路径为 /<页面名>"""
+
+    def do_GET(self):
+        name = self.path.lstrip("/").split("?", 1)[0]
+        content = self.server.pages.get(name)
+        if content is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.server.slow_rate and random.random() < self.server.slow_rate:
+            time.sleep(self.server.slow_delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        try:
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消了请求（对冲请求中较慢的一个）
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_standin_server(pages, port=0, slow_rate=0.0, slow_delay=0.0):
+    """
+    在后台线程中启动替身服务器
+
+    Args:
+        pages: {页面名: HTML字节}
+        port: 监听端口，0表示随机选择空闲端口
+        slow_rate: 随机变慢的响应所占比例
+        slow_delay: 变慢的响应停顿的秒数
+
+    Returns:
+        (server, base_url)，用完后调用 server.shutdown()
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _PageHandler)
+    server.daemon_threads = True
+    server.pages = pages
+    server.slow_rate = slow_rate
+    server.slow_delay = slow_delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    """命令行入口点"""
+    from corpus import CORPUS, load_corpus
+
+    arg_parser = argparse.ArgumentParser(description="本地DeepWiki替身服务器")
+    arg_parser.add_argument("--pages", help="提供的页面，逗号分隔，默认全部: " + ",".join(CORPUS))
+    arg_parser.add_argument("--port", type=int, default=0, help="监听端口，默认随机")
+    arg_parser.add_argument("--slow-rate", type=float, default=0.0, help="随机变慢的响应所占比例，默认0")
+    arg_parser.add_argument("--slow-delay", type=float, default=5.0, help="变慢的响应停顿的秒数，默认5")
+    args = arg_parser.parse_args()
+
+    server, base_url = start_standin_server(
+        load_corpus(args.pages.split(",") if args.pages else None), args.port, args.slow_rate, args.slow_delay)
+    print(base_url, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
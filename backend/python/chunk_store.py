@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""
+按内容寻址的Markdown分块存储，整个语料中重复的章节和代码块只保存、只转换一次
+
+用法:
+    store = ChunkStore("/path/chunks.db")
+    digest = store.put_page(content_digest(markdown), markdown)
+    store.write_manifest("out/page.chunks.json", digest, size)
+    markdown = store.read_manifest("out/page.chunks.json")
+
+    python chunk_store.py cat STORE MANIFEST...    # 还原文档，输出到标准输出
+    python chunk_store.py stats STORE              # 分块数、页面数和占用的字节数
+    python chunk_store.py serve STORE              # 从标准输入逐行读取JSON请求，供server.js还原结果文件
+
+转换结果在标题和代码块边界处切分为分块（章节、代码块），分块按SHA-256去重后保存在SQLite中，
+页面只记录按顺序排列的分块编号，拼接后与原文完全相同；很短的分块直接写在页面记录中。
+输出目录中每个页面只写一个指向页面记录的清单 (*.chunks.json)。存储使用WAL模式，多个进程可以同时写入。
+
+存储同时是转换缓存：解析器按标题把主要内容分为片段，以片段的HTML源码哈希为键保存转换结果（fragments表），
+其他页面中相同的片段直接取出，不再转换；所有片段都已缓存时也不再提取代码块。
+
+server.js 的在线任务（temp/.chunks.db）和离线重放 (replay.py --chunk-store) 都使用分块存储。
+在线任务的结果 x.md 只写清单 x.chunks.json，下载时由 serve 进程还原。
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+
+MANIFEST_SUFFIX = ".chunks.json"
+MANIFEST_VERSION = 1
+# 小于该字节数的分块直接写在页面记录中，单独保存时哈希和索引占用的空间比内容本身还大
+MIN_CHUNK_SIZE = 64
+
+_HEADING = re.compile(r"#{1,6}\s")
+_FENCE = re.compile(r"\s*(```|~~~)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    digest BLOB NOT NULL UNIQUE,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    digest BLOB NOT NULL UNIQUE,
+    chunks TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fragments (
+    digest BLOB PRIMARY KEY,
+    chunks TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+# 一次查询的片段数，不超过SQLite的参数个数上限
+_QUERY_BATCH = 500
+
+
+def split_chunks(markdown):
+    """在标题之前、代码块前后切分Markdown，各分块按顺序拼接即为原文"""
+    chunks = []
+    current = []
+    fence = None
+    for line in markdown.splitlines(keepends=True):
+        match = _FENCE.match(line)
+        if fence:
+            current.append(line)
+            if match and match.group(1) == fence:
+                # 代码块结束，整个代码块为一个分块
+                chunks.append("".join(current))
+                current = []
+                fence = None
+            continue
+        if match or _HEADING.match(line):
+            if current:
+                chunks.append("".join(current))
+                current = []
+            fence = match.group(1) if match else None
+        current.append(line)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def content_digest(content):
+    """内容的SHA-256，字符串按UTF-8编码"""
+    return hashlib.sha256(content if isinstance(content, bytes) else content.encode("utf-8")).digest()
+
+
+def result_manifest_path(result_path):
+    """结果文件 x.md 对应的清单 x.chunks.json"""
+    return os.path.splitext(result_path)[0] + MANIFEST_SUFFIX
+
+
+class ChunkStore:
+    """按内容寻址的分块存储"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def has_page(self, digest):
+        return self.db.execute("SELECT 1 FROM pages WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def put_page(self, digest, markdown, instrumentation=None):
+        """
+        切分并保存一个页面的转换结果，已有的分块不再重复保存
+
+        Args:
+            digest: 页面的键，离线重放时为原始HTML的 content_digest，在线任务为Markdown的 content_digest
+            instrumentation: 记录新写入和复用的分块数、字节数
+
+        Returns:
+            digest
+        """
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("INSERT OR REPLACE INTO pages(digest, chunks) VALUES(?, ?)",
+                            (digest, self._put_chunks(markdown, instrumentation)))
+        return digest
+
+    def get_page(self, digest):
+        """按页面记录还原Markdown，没有记录时返回None"""
+        row = self.db.execute("SELECT chunks FROM pages WHERE digest = ?", (digest,)).fetchone()
+        return None if row is None else self._join_chunks(row[0])
+
+    def put_fragments(self, fragments, instrumentation=None):
+        """在一个事务中保存多个片段的转换结果 [(片段键, Markdown)]"""
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            for digest, markdown in fragments:
+                self.db.execute("INSERT OR REPLACE INTO fragments(digest, chunks) VALUES(?, ?)",
+                                (digest, self._put_chunks(markdown, instrumentation)))
+
+    def get_fragments(self, digests):
+        """查找已缓存的片段转换结果，返回 {片段键: Markdown}"""
+        rows = []
+        for i in range(0, len(digests), _QUERY_BATCH):
+            batch = digests[i:i + _QUERY_BATCH]
+            rows += self.db.execute(
+                f"SELECT digest, chunks FROM fragments WHERE digest IN ({','.join('?' * len(batch))})", batch)
+        return {digest: self._join_chunks(chunks) for digest, chunks in rows}
+
+    def _put_chunks(self, markdown, instrumentation=None):
+        """
+        切分并保存Markdown的分块，返回按顺序排列的分块列表(JSON)，调用方需在事务中
+
+        列表中的每一项为分块编号，或直接写入的短分块 {"text": ...}
+        """
+        entries = []
+        for chunk in split_chunks(markdown):
+            size = len(chunk.encode("utf-8"))
+            if size < MIN_CHUNK_SIZE:
+                entries.append({"text": chunk})
+                continue
+            chunk_digest = content_digest(chunk)
+            row = self.db.execute("SELECT id FROM chunks WHERE digest = ?", (chunk_digest,)).fetchone()
+            if row is None:
+                entries.append(self.db.execute("INSERT INTO chunks(digest, content) VALUES(?, ?)",
+                                               (chunk_digest, chunk)).lastrowid)
+            else:
+                entries.append(row[0])
+            if instrumentation:
+                instrumentation.count("dedup.chunks.new" if row is None else "dedup.chunks.reused")
+                instrumentation.count("dedup.bytes.new" if row is None else "dedup.bytes.reused", size)
+        return json.dumps(entries, ensure_ascii=False, separators=(",", ":"))
+
+    def _join_chunks(self, entries):
+        """按分块列表(JSON)拼接出Markdown"""
+        parts = []
+        for entry in json.loads(entries):
+            if isinstance(entry, dict):
+                parts.append(entry["text"])
+            else:
+                parts.append(self.db.execute("SELECT content FROM chunks WHERE id = ?", (entry,)).fetchone()[0])
+        return "".join(parts)
+
+    def write_manifest(self, manifest_path, digest, size=None):
+        """在输出目录中写入指向页面记录的清单，size为Markdown的字节数（文件列表中显示）"""
+        manifest = {"version": MANIFEST_VERSION, "page": digest.hex()}
+        if size is not None:
+            manifest["size"] = size
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+
+    def read_manifest(self, manifest_path):
+        """按清单还原完整的Markdown"""
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        markdown = self.get_page(bytes.fromhex(manifest["page"]))
+        if markdown is None:
+            raise KeyError(f"分块存储中没有清单引用的页面: {manifest_path}")
+        return markdown
+
+    def stats(self):
+        """分块数、分块内容的字节数、页面数和数据库文件（含WAL）大小"""
+        chunks, size = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) FROM chunks").fetchone()
+        pages = self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        fragments = self.db.execute("SELECT COUNT(*) FROM fragments").fetchone()[0]
+        file_size = sum(os.path.getsize(path) for path in (self.path, self.path + "-wal") if os.path.exists(path))
+        return {"chunks": chunks, "chunk_bytes": size, "pages": pages, "fragments": fragments, "file_bytes": file_size}
+
+
+def serve(store, input=sys.stdin, output=sys.stdout):
+    """
+    逐行处理JSON请求，每个请求输出一行JSON响应（带相同的id）:
+        {"id", "op": "read", "manifest"} -> {"id", "markdown"}
+    出错时响应为 {"id", "error"}
+    """
+    for line in input:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            op = request.get("op")
+            if op == "read":
+                response = {"markdown": store.read_manifest(request["manifest"])}
+            else:
+                raise ValueError(f"未知操作: {op}")
+        except Exception as e:
+            response = {"error": str(e) or type(e).__name__}
+        response["id"] = request_id
+        output.write(json.dumps(response, ensure_ascii=False) + "\n")
+        output.flush()
+
+
+def main():
+    """命令行入口点"""
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="按内容寻址的Markdown分块存储")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    cat_command = commands.add_parser("cat", help="按清单还原文档")
+    cat_command.add_argument("store", help="分块存储文件")
+    cat_command.add_argument("manifests", nargs="+", help="文档清单 (*.chunks.json)")
+    stats_command = commands.add_parser("stats", help="输出存储的统计信息")
+    stats_command.add_argument("store", help="分块存储文件")
+    serve_command = commands.add_parser("serve", help="从标准输入逐行读取JSON请求")
+    serve_command.add_argument("store", help="分块存储文件")
+    args = arg_parser.parse_args()
+
+    store = ChunkStore(args.store)
+    try:
+        if args.command == "cat":
+            for path in args.manifests:
+                sys.stdout.write(store.read_manifest(path))
+        elif args.command == "serve":
+            serve(store)
+        else:
+            print(json.dumps(store.stats(), ensure_ascii=False))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
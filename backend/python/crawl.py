@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+可恢复的多页Wiki抓取
+
+用法:
+    crawl = WikiCrawl(parser, "/path/task.crawl")
+    markdown, failed = crawl.run("https://deepwiki.com/owner/repo")
+
+从仓库Wiki首页找出同一仓库的其他页面，逐页抓取并转换。每完成一页就把Markdown和
+检查点清单 (manifest.json) 写入检查点目录；失败的页面按指数退避重试。用同一个目录
+再次运行时，已完成的页面直接从检查点读取，只抓取之前失败的页面。
+
+后面的页面在后台线程中提前抓取（经过解析器的抓取调度器限速），与当前页面的转换重叠。
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("DeepWikiParser")
+
+MANIFEST_NAME = "manifest.json"
+# 页面之间的分隔，完整的Markdown为各页面按顺序以此拼接
+PAGE_SEPARATOR = "\n\n"
+# 这些状态码重试也不会成功，首页以外的页面返回这些状态码时记为缺失页面并跳过
+PERMANENT_STATUS = (400, 401, 403, 404, 410)
+# 带文件扩展名的路径是图片等资源，不是Wiki页面（页面路径如 2.1-core-components 不会以此结尾）
+_FILE_EXTENSION = re.compile(r"\.[A-Za-z][A-Za-z0-9]{0,4}$")
+
+
+def discover_wiki_pages(html_content, url):
+    """
+    从Wiki首页中找出同一仓库的其他页面
+
+    导航链接和Next.js页面数据中都会出现页面路径，直接在HTML原文中查找
+    "/owner/repo/页面" 形式的路径，按第一次出现的顺序去重。只接受相对路径和Wiki所在域名的链接
+    （GitHub源码链接 github.com/owner/repo/blob 等路径形式相同，但不是Wiki页面），跳过带文件扩展名的资源。
+    """
+    parts = urlsplit(url)
+    prefix = parts.path.rstrip("/") + "/"
+    pattern = re.compile(
+        rb'["\'](?:https?://([^/"\'\s]+))?(' + re.escape(prefix.encode()) + rb'[^"\'/?#\s\\<>]+)'
+    )
+    pages = []
+    seen = set()
+    for match in pattern.finditer(html_content):
+        host = match.group(1)
+        if host is not None and host.decode("utf-8", "replace").lower() != parts.netloc.lower():
+            continue
+        path = match.group(2).decode("utf-8", "replace")
+        if _FILE_EXTENSION.search(path):
+            continue
+        if path not in seen:
+            seen.add(path)
+            pages.append(f"{parts.scheme}://{parts.netloc}{path}")
+    return pages
+
+
+class WikiCrawl:
+    """把仓库的多页Wiki作为可恢复的任务抓取，每完成一页保存检查点"""
+
+    def __init__(self, parser, checkpoint_dir, max_attempts=3, backoff=1.0, max_backoff=30.0,
+                 sleep=time.sleep, prefetch=4):
+        """
+        Args:
+            parser: DeepWikiParser 实例，用于抓取和转换单个页面；设置了section_callback时
+                每完成一页以该页为一个章节发出（章节序号为已输出页面的序号，缺失和失败的页面不占序号）
+            checkpoint_dir: 检查点目录，不存在时创建
+            max_attempts: 每次运行中单个页面最多尝试的次数
+            backoff: 第一次重试前等待的秒数，之后每次翻倍，并加入随机抖动
+            max_backoff: 单次等待的上限(秒)
+            sleep: 等待函数
+            prefetch: 最多提前抓取的页面数，为0时逐页抓取；实际并发由抓取调度器按主机控制
+        """
+        self.parser = parser
+        self.instrumentation = parser.instrumentation
+        self.checkpoint_dir = checkpoint_dir
+        self.manifest_path = os.path.join(checkpoint_dir, MANIFEST_NAME)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+        self.prefetch = prefetch
+
+    def run(self, url):
+        """
+        抓取url及同一仓库的所有页面
+
+        Returns:
+            (markdown, failed)：failed为失败页面的URL列表；全部页面成功时markdown为完整内容，
+            否则为None，已完成的页面保留在检查点中，重新运行时继续
+        """
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        manifest = self._load_manifest(url)
+        pages = manifest["pages"]
+        section_callback = self.parser.section_callback
+        # 单个页面在全部重试结束之前不发出章节，避免失败的尝试留下不完整的内容
+        self.parser.section_callback = None
+
+        outputs = []
+        failed = []
+        # 提前抓取的页面：页面序号 -> Future，结果为 (内容, 状态码)
+        prefetched = {}
+        executor = None
+        if self.prefetch:
+            # 在启动后台线程之前创建调度器，避免多个线程同时创建
+            self.parser.fetcher
+            executor = ThreadPoolExecutor(self.prefetch)
+        try:
+            index = 0
+            while index < len(pages):
+                page = pages[index]
+                if page["status"] == "missing":
+                    index += 1
+                    continue
+                if executor:
+                    self._schedule_prefetch(executor, prefetched, pages, index)
+                self.parser._report_progress(
+                    "crawl", index * 100 // len(pages), f"第 {index + 1}/{len(pages)} 页: {page['url']}")
+
+                markdown = self._load_page(index) if page["status"] == "done" else None
+                if markdown is not None:
+                    self.instrumentation.count("crawl.pages.resumed")
+                else:
+                    future = prefetched.pop(index, None)
+                    html_content, markdown, status = self._crawl_page(page, future and future.result())
+                    if index == 0 and html_content and not manifest["discovered"]:
+                        for page_url in discover_wiki_pages(html_content, page["url"]):
+                            pages.append({"url": page_url, "status": "pending", "attempts": 0, "error": None})
+                        manifest["discovered"] = True
+                        self.instrumentation.observe("crawl.pages", len(pages))
+                    if markdown:
+                        self._save_page(index, markdown)
+                        page["status"] = "done"
+                        page["error"] = None
+                        self.instrumentation.count("crawl.pages.done")
+                    elif index and status in PERMANENT_STATUS:
+                        page["status"] = "missing"
+                        self.instrumentation.count("crawl.pages.missing")
+                    else:
+                        page["status"] = "failed"
+                        self.instrumentation.count("crawl.pages.failed")
+                    self._save_manifest(manifest)
+
+                if markdown:
+                    if section_callback:
+                        # 前端按序号连续拼接章节，缺失或失败的页面不能留下空缺
+                        section_callback(len(outputs), (PAGE_SEPARATOR if outputs else "") + markdown)
+                    outputs.append(markdown)
+                elif page["status"] == "failed":
+                    failed.append(page["url"])
+                index += 1
+        finally:
+            self.parser.section_callback = section_callback
+            if executor:
+                for future in prefetched.values():
+                    future.cancel()
+                executor.shutdown()
+
+        missing = sum(1 for page in pages if page["status"] == "missing")
+        self.parser._report_progress(
+            "crawl", 100, f"完成 {len(outputs)}/{len(pages)} 页"
+            + (f"，{missing} 页不存在" if missing else "") + (f"，{len(failed)} 页失败" if failed else ""))
+        return (None if failed else PAGE_SEPARATOR.join(outputs)), failed
+
+    def _schedule_prefetch(self, executor, prefetched, pages, index):
+        """在后台提前抓取当前页面之后最多prefetch个待抓取的页面"""
+        # 首页由当前线程抓取，从中找出其余页面
+        for ahead in range(max(index, 1), min(len(pages), index + self.prefetch + 1)):
+            if ahead not in prefetched and pages[ahead]["status"] in ("pending", "failed"):
+                prefetched[ahead] = executor.submit(self._fetch, pages[ahead]["url"])
+
+    def _fetch(self, url):
+        """抓取一个页面，返回 (内容, 状态码)，请求出错时为 (None, None)"""
+        try:
+            return self.parser.fetch_page(url)
+        except Exception as e:
+            logger.error(f"获取页面失败: {url}: {str(e)}")
+            return None, None
+
+    def _crawl_page(self, page, prefetched=None):
+        """
+        抓取并转换一个页面，失败时等待后重试
+
+        Args:
+            prefetched: 提前抓取的结果 (内容, 状态码)，作为第一次尝试
+
+        Returns:
+            (最后一次抓取的HTML, Markdown或None, 最后一次抓取的状态码)
+        """
+        html_content = None
+        status = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+                self.instrumentation.count("crawl.retries")
+                self.parser._report_progress("crawl", 0, f"{delay:.1f} 秒后重试: {page['url']}")
+                self.sleep(delay)
+            page["attempts"] += 1
+
+            if attempt == 0 and prefetched is not None:
+                content, status = prefetched
+            else:
+                content, status = self._fetch(page["url"])
+            if content is None:
+                page["error"] = f"获取页面失败，状态码: {status}" if status else "获取页面失败"
+                if status in PERMANENT_STATUS:
+                    break
+                continue
+            html_content = content
+
+            markdown = self.parser.parse_html_to_markdown(html_content)
+            if markdown:
+                return html_content, markdown, status
+            page["error"] = "未能提取到有效内容"
+        return html_content, None, status
+
+    def _load_manifest(self, url):
+        """读取检查点清单，不存在或已损坏时从首页重新开始"""
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = None
+        except ValueError:
+            logger.warning(f"检查点清单已损坏，重新开始: {self.manifest_path}")
+            manifest = None
+
+        if manifest is None:
+            return {
+                "url": url,
+                "discovered": False,
+                "pages": [{"url": url, "status": "pending", "attempts": 0, "error": None}],
+            }
+        if manifest["url"] != url:
+            raise ValueError(f"检查点目录属于另一个URL: {manifest['url']}")
+        return manifest
+
+    def _save_manifest(self, manifest):
+        self._write(self.manifest_path, json.dumps(manifest, ensure_ascii=False, indent=1))
+
+    def _page_path(self, index):
+        return os.path.join(self.checkpoint_dir, f"{index:04d}.md")
+
+    def _load_page(self, index):
+        """读取已完成页面的Markdown，文件丢失时返回None（重新抓取）"""
+        try:
+            with open(self._page_path(index), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _save_page(self, index, markdown):
+        self._write(self._page_path(index), markdown)
+
+    def _write(self, path, content):
+        """先写临时文件再改名，中途退出时不会留下写了一半的检查点"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
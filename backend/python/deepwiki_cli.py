@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+DeepWiki Parser 命令行入口
+用法: python deepwiki_cli.py [--convert-url] [--metrics] [--profile cprofile|sample] [--stream-sections]
+                            [--checkpoint DIR [--max-attempts N]] [--chunk-store FILE [--manifest FILE]]
+                            <github_url|deepwiki_url>
+      python deepwiki_cli.py --replay SOURCE --output DIR [--jobs N] [--chunk-store FILE] [--metrics]
+
+直接运行 parse_deepwiki.py 时整个文件每次都要重新编译，
+通过这个入口导入时可以使用缓存的字节码，server.js 每个请求都会启动解析器进程，启动越快越好。
+"""
+
+import sys
+
+from parse_deepwiki import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,632 @@
+# -*- coding: utf-8 -*-
+
+"""
+按主机限速的抓取调度器
+
+用法:
+    scheduler = FetchScheduler(session, instrumentation=instrumentation)
+    response = scheduler.get(url, headers=headers, timeout=30)   # 可在多个线程中并发调用
+
+每个主机有独立的令牌桶（限制请求速率）和并发上限，两者都按AIMD调整：
+请求成功且耗时正常时增加（第一次减小之前每次加1，之后缓慢增加），
+收到429/5xx、连接出错或耗时超过目标值时减半。
+429/503的Retry-After会让发往该主机的所有请求暂停到指定时间后再继续。
+可重试的失败（429、5xx、连接错误）由调度器按指数退避重试，不再依赖HTTPAdapter的盲目重试。
+
+每个主机保留最近请求首字节耗时（收到响应头的时间）的滑动窗口，样本足够后按其p95设置等待响应头的超时
+（p95的若干倍，不超过调用方给的超时，连续超时后逐次加倍，最后一次尝试使用调用方给的超时），
+超时和被取消的请求以已经等待的时间作为样本（实际耗时至少这么长），上游整体变慢时窗口随之增大。
+响应头超过p90仍未到达时再发一个对冲请求，先完成的一个作为结果，另一个被取消（正在下载的响应体立即中止）。
+已经收到响应头的请求下载响应体不受自适应超时限制。
+对冲请求计入并发上限和令牌桶，总数不超过请求数的一定比例。
+
+解析器每个任务是一个新进程，同时运行的多个进程通过状态文件（FETCH_STATE）共享每个主机的令牌桶、并发上限、
+Retry-After暂停时间和各进程正在进行的请求数：每次占用和归还空位都在文件锁内读出、修改并写回。
+耗时窗口也保存在其中，下一个进程启动时读取。不支持文件锁的系统（Windows）上这些状态只在进程内共享。
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from instrumentation import NULL_INSTRUMENTATION, SECONDS_BUCKETS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 表示上游限流的状态码，除减小并发外还会降低请求速率并遵守Retry-After
+THROTTLE_STATUS = (429, 503)
+# 可以重试的状态码
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# 并发数和速率直方图的桶上界
+CONCURRENCY_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+RATE_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100)
+# 每个主机保留的耗时样本数
+LATENCY_WINDOW = 64
+# 读取响应体的块大小，被取消的请求最多再读一块就停止
+BODY_CHUNK_SIZE = 65536
+# 在进程间共享的主机状态字段，时间均为 time.time()
+SHARED_FIELDS = ('rate', 'tokens', 'refilled', 'limit', 'blocked_until', 'decreased')
+# 等待其他进程归还并发空位时重新读取状态文件的间隔(秒)
+SHARED_POLL_INTERVAL = 0.1
+
+
+def _alive(pid):
+    """进程是否仍在运行，用于清理被终止的解析进程留下的并发计数"""
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, ValueError):
+        pass
+    return True
+
+
+def parse_retry_after(value):
+    """解析Retry-After头（秒数或HTTP日期），返回需要等待的秒数，无法解析时返回None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class _Host:
+    """单个主机的限速状态"""
+
+    __slots__ = ('host', 'rate', 'tokens', 'refilled', 'limit', 'in_flight', 'others', 'blocked_until', 'decreased',
+                 'latencies', 'new_latencies', 'timeouts')
+
+    def __init__(self, host, rate, burst, limit):
+        self.host = host
+        self.rate = rate  # 令牌生成速率(请求/秒)
+        self.tokens = burst
+        self.refilled = time.time()
+        self.limit = limit  # 并发上限，取整后使用
+        self.in_flight = 0  # 本进程正在进行的请求数
+        self.others = 0  # 其他进程正在进行的请求数，从状态文件读出
+        self.blocked_until = 0.0  # Retry-After要求的暂停截止时间
+        self.decreased = 0.0  # 上次减小的时间
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # 最近请求的首字节耗时(秒)
+        self.new_latencies = []  # 本进程中新增的耗时，写回状态文件时合并
+        self.timeouts = 0  # 连续超时的次数，每次超时后超时时间加倍
+
+    def load(self, record):
+        """读入状态文件中的主机记录（可能已被其他进程更新）"""
+        for key in SHARED_FIELDS:
+            if key in record:
+                setattr(self, key, record[key])
+        pid = str(os.getpid())
+        self.others = sum(n for p, n in record.get("in_flight", {}).items() if p != pid and _alive(p))
+
+    def dump(self, record):
+        """返回写回状态文件的主机记录：本进程的限速状态和并发数，合并新增的耗时样本"""
+        if isinstance(record, dict):
+            record = dict(record)
+        else:
+            # 旧格式只保存耗时样本列表
+            record = {"latencies": record if isinstance(record, list) else []}
+        record.update({key: getattr(self, key) for key in SHARED_FIELDS})
+        pid = str(os.getpid())
+        in_flight = {p: n for p, n in record.get("in_flight", {}).items() if p != pid and _alive(p)}
+        if self.in_flight:
+            in_flight[pid] = self.in_flight
+        record["in_flight"] = in_flight
+        if self.new_latencies:
+            latencies = record.get("latencies", []) + [round(latency, 4) for latency in self.new_latencies]
+            record["latencies"] = latencies[-LATENCY_WINDOW:]
+            self.new_latencies.clear()
+        return record
+
+
+class FetchResponse:
+    """完整读出响应体后的请求结果"""
+
+    __slots__ = ('status_code', 'headers', 'url', 'content')
+
+    def __init__(self, response, content):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = response.url
+        self.content = content
+
+
+class _Cancelled(Exception):
+    """请求已被取消"""
+
+
+class _Attempt:
+    """一次HTTP请求（原始请求或对冲请求），在单独的线程中执行"""
+
+    __slots__ = ('state', 'hedge', 'start', 'first_byte', 'cancelled', 'released', 'stream', 'response', 'error',
+                 'retry_after')
+
+    def __init__(self, state, hedge):
+        self.state = state
+        self.hedge = hedge
+        self.start = time.monotonic()
+        self.first_byte = None  # 收到响应头的耗时(秒)
+        self.cancelled = None  # 取消原因："lost"（另一个请求先完成）或 "timeout"
+        self.released = False  # 是否已归还并发空位
+        self.stream = None  # 正在读取响应体的响应，取消时关闭
+        self.response = None  # 完整读出响应体后的 FetchResponse
+        self.error = None
+        self.retry_after = None
+
+
+class FetchScheduler:
+    """按主机限速、自适应并发并遵守Retry-After的HTTP GET调度器，线程安全"""
+
+    def __init__(self, session, rate=2.0, max_rate=10.0, min_rate=0.2, burst=2, concurrency=2,
+                 max_concurrency=4, max_attempts=4, latency_target=10.0, backoff=0.5, max_backoff=30.0,
+                 max_retry_after=120.0, hedge=True, hedge_quantile=0.9, hedge_budget=0.15, min_samples=10, timeout_multiplier=4.0,
+                 min_timeout=2.0, state_file=None, instrumentation=None):
+        """
+        Args:
+            session: requests.Session
+            rate: 每个主机的初始请求速率(请求/秒)，在 [min_rate, max_rate] 之间调整
+            burst: 令牌桶容量，空闲后最多可以连续发出的请求数
+            concurrency: 每个主机的初始并发上限，在 [1, max_concurrency] 之间调整
+            max_attempts: 单个请求最多尝试的次数（含第一次）
+            latency_target: 请求耗时超过该值(秒)时视为上游过载
+            backoff: 没有Retry-After时第一次重试前等待的秒数，之后每次翻倍，并加入随机抖动
+            max_backoff: 单次退避的上限(秒)
+            max_retry_after: Retry-After超过该值(秒)时不再等待，直接返回限流响应
+            hedge: 请求耗时超过hedge_quantile分位数时是否发出对冲请求
+            hedge_quantile: 发出对冲请求的耗时分位数；慢响应较多时p95本身就落在慢响应上，因此默认用p90
+            hedge_budget: 对冲请求数最多占请求数的比例；此外总能发出一个，单页任务的进程只发一个请求
+            min_samples: 耗时样本少于该数量时不对冲，超时使用调用方给的值
+            timeout_multiplier: 超时为p95的倍数
+            min_timeout: 超时的下限(秒)
+            state_file: 在进程间共享主机状态和耗时窗口的状态文件路径，为None时只在进程内共享
+            instrumentation: instrumentation.Instrumentation 实例，为None时不记录
+        """
+        self.session = session
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.min_samples = min_samples
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.state_file = state_file
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self._hosts = {}
+        self._requests = 0  # 发出的原始请求数，用于限制对冲请求的比例
+        self._hedges = 0
+        # 保护所有主机状态和指标记录（插桩本身不是线程安全的）
+        self._cond = threading.Condition()
+        if state_file:
+            self._load_latencies()
+
+    @classmethod
+    def from_env(cls, session, instrumentation=None):
+        """
+        按环境变量创建调度器:
+            FETCH_RATE             每个主机的初始请求速率，默认2
+            FETCH_MAX_RATE         请求速率上限，默认10
+            FETCH_MAX_CONCURRENCY  每个主机的并发上限，默认4
+            HTTP_MAX_RETRIES       单个请求失败后最多重试的次数，默认3
+            FETCH_HEDGE            设为0时不发对冲请求
+            FETCH_MIN_TIMEOUT      自适应超时的下限(秒)，默认2
+            FETCH_STATE            在解析进程间共享限速状态和耗时窗口的状态文件，默认不共享
+        """
+        return cls(
+            session,
+            rate=float(os.environ.get("FETCH_RATE", 2.0)),
+            max_rate=float(os.environ.get("FETCH_MAX_RATE", 10.0)),
+            max_concurrency=int(os.environ.get("FETCH_MAX_CONCURRENCY", 4)),
+            max_attempts=int(os.environ.get("HTTP_MAX_RETRIES", 3)) + 1,
+            hedge=os.environ.get("FETCH_HEDGE") != "0",
+            min_timeout=float(os.environ.get("FETCH_MIN_TIMEOUT", 2.0)),
+            state_file=os.environ.get("FETCH_STATE") or None,
+            instrumentation=instrumentation,
+        )
+
+    def get(self, url, timeout=None, **kwargs):
+        """
+        发送GET请求，等待主机的并发空位和令牌，可重试的失败按退避或Retry-After重试
+
+        Args:
+            timeout: 单次尝试的超时上限(秒)，有足够的耗时样本时等待响应头的超时按p95自适应缩短，
+                     最后一次尝试和响应体的下载使用该值
+
+        Returns:
+            最后一次请求的 FetchResponse（可能仍是429/5xx）；所有尝试都出现连接错误或超时时抛出最后一个异常
+        """
+        host = urlsplit(url).netloc
+        start = time.monotonic()
+        try:
+            for attempt in range(self.max_attempts):
+                if attempt:
+                    with self._cond:
+                        self.instrumentation.count("fetch.retries")
+                try:
+                    response, retry_after = self._send(host, url, timeout, kwargs,
+                                                       final=attempt + 1 >= self.max_attempts)
+                except OSError as e:
+                    # requests的连接和超时异常都是IOError的子类；URL格式错误同时是ValueError，重试也没有用
+                    if isinstance(e, ValueError) or attempt + 1 >= self.max_attempts:
+                        raise
+                    self._sleep_backoff(attempt)
+                    continue
+
+                if response.status_code not in RETRY_STATUS or attempt + 1 >= self.max_attempts:
+                    return response
+                if retry_after is None:
+                    self._sleep_backoff(attempt)
+                elif retry_after > self.max_retry_after:
+                    return response
+                # 有Retry-After时主机已暂停到指定时间，下一次 _acquire 会等待
+            return response
+        finally:
+            with self._cond:
+                self.instrumentation.record_span("fetch.total", time.monotonic() - start)
+
+    def _send(self, host, url, max_timeout, kwargs, final=False):
+        """
+        发出一次请求，超过对冲等待时间仍未收到响应头时再发一个对冲请求，返回先完成的一个
+
+        Args:
+            final: 是否为最后一次尝试，最后一次等待响应头的超时使用max_timeout
+
+        Returns:
+            (响应, Retry-After要求等待的秒数或None)；超时抛出TimeoutError，请求出错时抛出其异常
+        """
+        max_timeout = max_timeout or self.latency_target * 3
+        timeout, hedge_delay = self._deadlines(host, max_timeout, final)
+        results = queue.Queue()
+        primary = self._start(self._acquire(host), url, max_timeout, kwargs, results)
+        attempts = [primary]
+        deadline = primary.start + timeout
+        winner = None
+        pending = 1
+        try:
+            while winner is None:
+                now = time.monotonic()
+                if now >= deadline:
+                    if deadline < primary.start + max_timeout and any(a.first_byte is not None for a in attempts):
+                        # 已经收到响应头，正在下载响应体，只受调用方给的超时限制
+                        deadline = primary.start + max_timeout
+                        continue
+                    break
+                wait = deadline - now
+                if hedge_delay is not None:
+                    wait = min(wait, max(0.0, primary.start + hedge_delay - now))
+                try:
+                    attempt = results.get(timeout=wait)
+                except queue.Empty:
+                    if hedge_delay is not None and time.monotonic() >= primary.start + hedge_delay:
+                        # 只对冲一次；已收到响应头（正在下载响应体）、没有空位或超出比例时放弃对冲，继续等原始请求
+                        hedge_delay = None
+                        state = self._try_acquire_hedge(host) if primary.first_byte is None else None
+                        if state is not None:
+                            attempts.append(self._start(state, url, max_timeout, kwargs, results, hedge=True))
+                            pending += 1
+                    continue
+                pending -= 1
+                # 一个请求出错时，如果另一个还在进行，等它的结果
+                if attempt.error is None or pending == 0:
+                    winner = attempt
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    self._cancel(attempt, "lost" if winner is not None else "timeout")
+
+        if winner is None:
+            with self._cond:
+                self._host(host).timeouts += 1
+                self.instrumentation.count("fetch.timeouts")
+            raise TimeoutError(f"请求超过 {timeout:.1f} 秒未完成: {url}")
+        if winner.hedge:
+            with self._cond:
+                self.instrumentation.count("fetch.hedge_wins")
+        if winner.error is not None:
+            raise winner.error
+        return winner.response, winner.retry_after
+
+    def _start(self, state, url, timeout, kwargs, results, hedge=False):
+        """
+        在新线程中发出请求（已占用主机的并发空位和令牌），结束时把 _Attempt 放入results
+
+        timeout为requests的连接和单次读取超时（调用方给的上限），等待响应头的自适应超时由 _send 控制
+        """
+        attempt = _Attempt(state, hedge)
+
+        def run():
+            try:
+                response = attempt.stream = self.session.get(url, stream=True, timeout=timeout, **kwargs)
+                attempt.first_byte = time.monotonic() - attempt.start
+                try:
+                    body = []
+                    for chunk in response.iter_content(BODY_CHUNK_SIZE):
+                        if attempt.cancelled:
+                            raise _Cancelled()
+                        body.append(chunk)
+                    if attempt.cancelled:
+                        raise _Cancelled()
+                finally:
+                    # 读完后归还连接；被取消时关闭连接，中止正在下载的响应体
+                    response.close()
+                attempt.response = FetchResponse(response, b"".join(body))
+            except _Cancelled:
+                pass
+            except Exception as e:
+                attempt.error = e
+            attempt.retry_after = self._release(attempt)
+            results.put(attempt)
+
+        threading.Thread(target=run, daemon=True).start()
+        return attempt
+
+    def _cancel(self, attempt, reason):
+        """
+        取消未完成的请求：立即归还并发空位，关闭正在读取的响应体
+
+        还在等待响应头的请求无法中断，线程会在超时后自行结束，但不再占用主机的并发空位。
+        """
+        attempt.cancelled = reason
+        self._release(attempt)
+        stream = attempt.stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def _host(self, host):
+        """主机状态，调用方需持有 _cond"""
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host(host, self.rate, self.burst, self.concurrency)
+        return state
+
+    def _lock_state(self):
+        """锁住状态文件（独占锁），返回需要关闭的锁文件；不共享状态或无法加锁时返回None"""
+        if not self.state_file or fcntl is None:
+            return None
+        try:
+            lock = open(self.state_file + ".lock", "a")
+        except OSError:
+            return None
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _read_state(self):
+        """读出状态文件 {主机: 记录}，文件不存在或损坏时返回空字典"""
+        try:
+            with open(self.state_file, encoding="utf-8") as f:
+                hosts = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return hosts if isinstance(hosts, dict) else {}
+
+    def _write_state(self, hosts):
+        """先写临时文件再整体替换，读取方不会看到写了一半的文件"""
+        tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(hosts, f)
+        os.replace(tmp_path, self.state_file)
+
+    @contextmanager
+    def _shared(self, state):
+        """
+        在状态文件的锁内读入其他进程更新后的主机状态，正常结束时写回，调用方需持有 _cond
+
+        不共享状态时只使用本进程的状态；状态文件写入失败时也只影响其他进程看到的状态
+        """
+        lock = self._lock_state()
+        if lock is None:
+            yield
+            return
+        try:
+            hosts = self._read_state()
+            record = hosts.get(state.host)
+            if isinstance(record, dict):
+                state.load(record)
+            yield
+            hosts[state.host] = state.dump(record)
+            try:
+                self._write_state(hosts)
+            except OSError:
+                pass
+        finally:
+            lock.close()
+
+    def _deadlines(self, host, max_timeout, final=False):
+        """
+        按主机最近的首字节耗时计算 (等待响应头的超时, 对冲等待时间)
+
+        样本不足时不对冲，超时为max_timeout；最后一次尝试的超时也为max_timeout
+        """
+        with self._cond:
+            state = self._host(host)
+            samples = sorted(state.latencies)
+            self._requests += 1
+            if len(samples) < self.min_samples:
+                return max_timeout, None
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            if final:
+                timeout = max_timeout
+            else:
+                # 连续超时说明上游整体变慢，超时逐次加倍，不必等窗口中的样本全部更新
+                timeout = max(self.min_timeout, p95 * self.timeout_multiplier) * 2 ** min(state.timeouts, 10)
+                timeout = min(max_timeout, timeout)
+            hedge_delay = samples[min(len(samples) - 1, int(len(samples) * self.hedge_quantile))]
+            self.instrumentation.observe("fetch.timeout", timeout, SECONDS_BUCKETS)
+            self.instrumentation.observe("fetch.hedge_delay", hedge_delay, SECONDS_BUCKETS)
+        return timeout, (hedge_delay if self.hedge else None)
+
+    def _acquire(self, host):
+        """等待主机的并发空位和令牌，返回主机状态"""
+        start = time.monotonic()
+        with self._cond:
+            state = self._host(host)
+            while True:
+                with self._shared(state):
+                    now = time.time()
+                    state.tokens = min(self.burst, state.tokens + (now - state.refilled) * state.rate)
+                    state.refilled = now
+                    if state.blocked_until > now:
+                        timeout = state.blocked_until - now
+                    elif state.in_flight + state.others >= int(state.limit):
+                        # 本进程的请求结束时会唤醒；其他进程的请求只能定期重新读取状态文件
+                        timeout = SHARED_POLL_INTERVAL if state.others else None
+                    elif state.tokens < 1:
+                        timeout = (1 - state.tokens) / state.rate
+                    else:
+                        self._take(state)
+                        break
+                self._cond.wait(timeout)
+            self.instrumentation.record_span("fetch.wait", time.monotonic() - start)
+        return state
+
+    def _try_acquire_hedge(self, host):
+        """对冲请求不等待：主机有空位和令牌且没有超出对冲比例时占用并返回主机状态，否则返回None"""
+        with self._cond:
+            state = self._host(host)
+            with self._shared(state):
+                now = time.time()
+                state.tokens = min(self.burst, state.tokens + (now - state.refilled) * state.rate)
+                state.refilled = now
+                if (state.blocked_until > now or state.in_flight + state.others >= int(state.limit)
+                        or state.tokens < 1 or self._hedges >= self._requests * self.hedge_budget + 1):
+                    self.instrumentation.count("fetch.hedge_skipped")
+                    return None
+                self._hedges += 1
+                self._take(state)
+                self.instrumentation.count("fetch.hedged")
+        return state
+
+    def _take(self, state):
+        """占用一个令牌和一个并发空位，调用方需持有 _cond"""
+        state.tokens -= 1
+        state.in_flight += 1
+        self.instrumentation.observe("fetch.in_flight", state.in_flight, CONCURRENCY_BUCKETS)
+
+    def _release(self, attempt):
+        """请求结束：按结果调整并发上限和速率，返回Retry-After要求等待的秒数（没有时为None）"""
+        state = attempt.state
+        response = attempt.response
+        latency = time.monotonic() - attempt.start
+        status = response.status_code if response is not None else None
+        retry_after = None
+        with self._cond:
+            if attempt.released:
+                return attempt.retry_after
+            attempt.released = True
+            with self._shared(state):
+                now = time.time()
+                state.in_flight -= 1
+                self._cond.notify_all()
+                if attempt.first_byte is not None:
+                    if response is not None and status not in RETRY_STATUS:
+                        self._add_latency(state, attempt.first_byte)
+                    state.timeouts = 0
+                elif attempt.cancelled:
+                    # 超时或被对冲请求抢先的请求没有首字节耗时，以已经等待的时间作为样本（实际至少这么长），
+                    # 否则窗口只会越来越小，上游整体变慢后每个请求都会超时
+                    self._add_latency(state, latency)
+                if attempt.cancelled == "lost":
+                    # 另一个请求已经先完成，这次的耗时和结果不能反映上游状态
+                    self.instrumentation.count("fetch.hedge_cancelled")
+                    return None
+                if status is None or status in RETRY_STATUS or latency > self.latency_target:
+                    # 乘性减小；同一批并发请求的失败只减小一次（距上次减小超过一个请求的耗时）
+                    if now - state.decreased > latency:
+                        state.limit = max(1.0, state.limit / 2)
+                        if status in THROTTLE_STATUS:
+                            state.rate = max(self.min_rate, state.rate / 2)
+                        state.decreased = now
+                        self.instrumentation.count("fetch.decreases")
+                    if status in THROTTLE_STATUS:
+                        self.instrumentation.count("fetch.throttled")
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        if retry_after is not None:
+                            self.instrumentation.count("fetch.retry_after")
+                            state.blocked_until = max(state.blocked_until,
+                                                      now + min(retry_after, self.max_retry_after))
+                elif not state.decreased:
+                    # 慢启动：第一次减小之前每个成功的请求都加1，尽快接近上游能承受的速率
+                    state.limit = min(self.max_concurrency, state.limit + 1)
+                    state.rate = min(self.max_rate, state.rate + 1)
+                else:
+                    # 加性增加：大约每完成一轮（上限个）请求，并发上限加1；速率同理
+                    state.limit = min(self.max_concurrency, state.limit + 1 / state.limit)
+                    state.rate = min(self.max_rate, state.rate + 1 / state.rate)
+
+                self.instrumentation.record_span("fetch.request", latency)
+                if response is None:
+                    self.instrumentation.count("fetch.request_errors")
+                else:
+                    self.instrumentation.count(f"fetch.status.{status}")
+                    if status == 200:
+                        self.instrumentation.observe("fetch.bytes", len(response.content))
+                self.instrumentation.observe("fetch.concurrency_limit", int(state.limit), CONCURRENCY_BUCKETS)
+                self.instrumentation.observe("fetch.rate", state.rate, RATE_BUCKETS)
+        return retry_after
+
+    def _add_latency(self, state, latency):
+        """记录一个首字节耗时样本，调用方需持有 _cond"""
+        state.latencies.append(latency)
+        state.new_latencies.append(latency)
+
+    def _load_latencies(self):
+        """从状态文件读取各主机最近的耗时样本，其余共享状态在每次占用和归还空位时读取"""
+        with self._cond:
+            for host, record in self._read_state().items():
+                latencies = record.get("latencies", []) if isinstance(record, dict) else record
+                if isinstance(latencies, list):
+                    self._host(host).latencies.extend(latencies)
+
+    def save_state(self):
+        """
+        把本进程尚未写回的耗时样本合并进状态文件，解析进程结束前调用
+
+        支持文件锁时每个请求结束都已写回，这里只清理本进程的并发计数；否则在这里一次写入耗时样本。
+        """
+        if not self.state_file:
+            return
+        with self._cond:
+            lock = self._lock_state()
+            try:
+                hosts = self._read_state()
+                for host, state in self._hosts.items():
+                    record = hosts.get(host)
+                    if isinstance(record, dict):
+                        state.load(record)
+                    hosts[host] = state.dump(record)
+                self._write_state(hosts)
+            finally:
+                if lock is not None:
+                    lock.close()
+
+    def _sleep_backoff(self, attempt):
+        time.sleep(min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1))
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+解析器插桩 - 分阶段计时、计数器和直方图
+
+用法:
+    instrumentation = Instrumentation()
+    parser = DeepWikiParser(instrumentation=instrumentation)
+    ...
+    instrumentation.to_dict()
+
+未启用插桩时解析器使用 NULL_INSTRUMENTATION，所有操作都是空操作，
+逐节点的计时包装也不会安装，因此关闭时没有额外开销。
+"""
+
+import time
+from bisect import bisect_left
+
+# 计时直方图的桶上界(秒)
+SECONDS_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+# 大小直方图的桶上界(字节/字符)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class _Histogram:
+    """固定桶的直方图，最后一个桶对应 +Inf"""
+
+    __slots__ = ('bounds', 'buckets', 'count', 'sum', 'max')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, data):
+        """合并另一个直方图 to_dict() 的结果"""
+        for i, value in enumerate(data['buckets']):
+            self.buckets[i] += value
+        self.count += data['count']
+        self.sum += data['sum']
+        if data['max'] > self.max:
+            self.max = data['max']
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'max': round(self.max, 6),
+            'bounds': list(self.bounds),
+            'buckets': list(self.buckets),
+        }
+
+
+class _Span:
+    """计时上下文，退出时把耗时记录到对应的直方图"""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    """收集解析过程中的计时、计数和分布数据"""
+
+    enabled = True
+
+    def __init__(self):
+        self.spans = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def span(self, name):
+        """返回名为name的计时上下文，同名span的耗时累计到同一个直方图"""
+        histogram = self.spans.get(name)
+        if histogram is None:
+            histogram = self.spans[name] = _Histogram(SECONDS_BUCKETS)
+        return _Span(histogram)
+
+    def record_span(self, name, seconds):
+        """记录一段已经测得的耗时，与同名span累计到同一个直方图"""
+        histogram = self.spans.get(name)
+        if histogram is None:
+            histogram = self.spans[name] = _Histogram(SECONDS_BUCKETS)
+        histogram.observe(seconds)
+
+    def count(self, name, value=1):
+        """累加计数器"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, bounds=SIZE_BUCKETS):
+        """记录一个观测值到直方图"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = _Histogram(bounds)
+        histogram.observe(value)
+
+    def merge(self, data):
+        """合并另一个实例 to_dict() 的结果，用于汇总多个进程的记录"""
+        for target, histograms in ((self.spans, data.get('spans', {})),
+                                   (self.histograms, data.get('histograms', {}))):
+            for name, histogram in histograms.items():
+                if name not in target:
+                    target[name] = _Histogram(tuple(histogram['bounds']))
+                target[name].merge(histogram)
+        for name, value in data.get('counters', {}).items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        """导出为可JSON序列化的dict"""
+        return {
+            'spans': {name: h.to_dict() for name, h in self.spans.items()},
+            'counters': dict(self.counters),
+            'histograms': {name: h.to_dict() for name, h in self.histograms.items()},
+        }
+
+
+class _NullSpan:
+    """空计时上下文"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+class _NullInstrumentation:
+    """关闭插桩时使用的空实现"""
+
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, name):
+        return self._span
+
+    def record_span(self, name, seconds):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def observe(self, name, value, bounds=SIZE_BUCKETS):
+        pass
+
+    def merge(self, data):
+        pass
+
+    def to_dict(self):
+        return {}
+
+
+NULL_INSTRUMENTATION = _NullInstrumentation()
@@ -3,36 +3,199 @@
 
 """
 DeepWiki Parser - 解析GitHub仓库的DeepWiki内容
-用法: python parse_deepwiki.py <github_url|deepwiki_url>
+用法: python parse_deepwiki.py [--convert-url] [--metrics] [--profile cprofile|sample] [--stream-sections]
+                             [--checkpoint DIR [--max-attempts N]] <github_url|deepwiki_url>
+                             [--chunk-store FILE [--manifest FILE]]
+      python parse_deepwiki.py --replay SOURCE --output DIR [--jobs N] [--chunk-store FILE] [--metrics]
 """
 
 import sys
 import os
-import time
-import requests
-import urllib3
-import urllib.parse
-from bs4 import BeautifulSoup
-from bs4.element import NavigableString, Tag
-import re
-import json
-from requests.adapters import HTTPAdapter
-import traceback
 import io
+import re
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import traceback
+
+from instrumentation import NULL_INSTRUMENTATION
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# requests/urllib3/bs4/json 导入较慢，只在真正抓取或解析页面时才导入，
+# 这样只做URL转换等轻量操作时进程可以快速启动（见 benchmarks/bench_startup.py）
 logger = logging.getLogger("DeepWikiParser")
 
-# 禁用不安全HTTPS警告
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# 以下名称由 _load_bs4() 在第一次解析HTML时填充
+BeautifulSoup = None
+NavigableString = None
+Tag = None
+PreformattedString = None
+_InternedSoup = None
+
+# 按章节输出时，在这些标题处切分章节
+SECTION_HEADINGS = ('h1', 'h2')
+# 只有这些通用容器可以逐个处理子元素而不改变转换结果
+SECTION_CONTAINERS = ('div', 'section', 'article', 'main', 'body')
+
+# 脚本中常见的mermaid图表定义
+MERMAID_SCRIPT_PATTERNS = tuple(re.compile(pattern, re.DOTALL) for pattern in (
+    r'graph\s+[TBLR][TBLRD]\s*[\r\n]{.*?}',
+    r'flowchart\s+[TBLR][TBLRD]\s*[\r\n]{.*?}',
+    r'sequenceDiagram[\r\n]{.*?}',
+    r'classDiagram[\r\n]{.*?}',
+    r'gantt[\r\n]{.*?}',
+    r'pie[\r\n]{.*?}',
+))
+
+
+def _load_bs4():
+    """按需导入bs4"""
+    global BeautifulSoup, NavigableString, Tag, PreformattedString, _InternedSoup
+    if BeautifulSoup is not None:
+        return
+    
+    from bs4 import BeautifulSoup as bs4_soup
+    from bs4.element import NavigableString as bs4_string, Tag as bs4_tag
+    from bs4.element import PreformattedString as bs4_preformatted
+    
+    class InternedSoup(bs4_soup):
+        """驻留标签名的BeautifulSoup，同名标签共享同一个名称字符串"""
+        
+        def handle_starttag(self, name, *args, **kwargs):
+            return super().handle_starttag(sys.intern(name), *args, **kwargs)
+        
+        def handle_endtag(self, name, *args, **kwargs):
+            return super().handle_endtag(sys.intern(name), *args, **kwargs)
+    
+    BeautifulSoup, NavigableString, Tag, PreformattedString, _InternedSoup = (
+        bs4_soup, bs4_string, bs4_tag, bs4_preformatted, InternedSoup)
+
+
+def _code_text(code_element):
+    """
+    拼接<code>元素下的所有文本节点，保留原有的缩进和空白
+    
+    注释、CDATA等特殊节点(PreformattedString)不属于代码内容，与去掉HTML标签后的结果一致；
+    文本节点中的实体在建树时已经解码，不需要再序列化和反转义。
+    """
+    return ''.join([
+        node for node in code_element.descendants
+        if isinstance(node, NavigableString) and not isinstance(node, PreformattedString)
+    ])
+
+
+class _TextTable:
+    """
+    文档的文本偏移表：整篇文档的文本，以及每个标签的文本在其中的起止位置
+    
+    一次遍历建立，之后任意标签的 get_text() 结果都是整篇文本的一个切片，不需要再遍历子树。
+    只记录 get_text() 取普通文本节点的标签；script、style、template 等使用特殊文本类型的标签
+    不在表中，查询时回退到 get_text()。
+    同一次遍历顺便按标签名收集所有标签(文档顺序)，代替对整棵树的多次 find_all()。
+    """
+    
+    __slots__ = ('root', 'text', 'lower', 'offsets', 'tags')
+    
+    def __init__(self, root):
+        from bs4.element import CData
+        main_types = {NavigableString, CData}
+        parts = []
+        offsets = {}
+        tags = {}
+        pos = 0
+        # 用显式栈代替递归，嵌套很深的页面也不会超出递归深度
+        stack = [(root, pos, iter(root.contents))]
+        while stack:
+            tag, start, children = stack[-1]
+            for child in children:
+                child_type = type(child)
+                # 与 get_text() 一致，只取类型恰好是NavigableString或CData的文本节点
+                if child_type is NavigableString or child_type is CData:
+                    parts.append(child)
+                    pos += len(child)
+                elif isinstance(child, Tag):
+                    tags.setdefault(child.name, []).append(child)
+                    stack.append((child, pos, iter(child.contents)))
+                    break
+            else:
+                stack.pop()
+                if getattr(tag, 'interesting_string_types', main_types) == main_types:
+                    # 起止位置合并成一个整数保存，比元组省内存
+                    offsets[id(tag)] = start << 32 | pos
+        self.root = root
+        self.text = ''.join(parts)
+        self.offsets = offsets
+        self.tags = tags
+        # 个别字符转小写后长度会变化，这时小写文本与偏移对不上，不使用
+        lower = self.text.lower()
+        self.lower = lower if len(lower) == len(self.text) else None
+
+
+class _SourceSpans:
+    """
+    主要内容在HTML源码中的位置，用于按片段源码的哈希缓存转换结果（见 chunk_store.py）
+
+    html.parser 记录了每个标签开始的行号和列号；解析是流式的，相邻两个片段起始标签之间的源码
+    恰好包含前一个片段的所有节点，相同的源码（在相同的祖先标签中）总是得到相同的子树。
+    """
+    
+    __slots__ = ('source', 'line_starts', 'context', 'start', 'end')
+    
+    def __init__(self, source, main_content):
+        self.source = source
+        self.line_starts = [0]
+        self.line_starts.extend(match.end() for match in re.finditer('\n', source))
+        # 片段中不匹配的结束标签会关闭哪些元素取决于祖先标签，一并计入键
+        self.context = '/'.join(parent.name for parent in reversed(list(main_content.parents)))
+        self.start = self.offset(main_content)
+        # 最后一个片段到主要内容之后的第一个标签为止，多包含几个结束标签不影响结果
+        self.end = len(source)
+        for node in (main_content, *main_content.parents):
+            sibling = node.find_next_sibling()
+            if sibling is not None:
+                end = self.offset(sibling)
+                if end is not None:
+                    self.end = end
+                break
+    
+    def offset(self, tag):
+        """标签在源码中的起始位置，位置与标签对不上（如源码解码方式不同）时返回None"""
+        line = getattr(tag, 'sourceline', None)
+        if line is None or tag.sourcepos is None or line > len(self.line_starts):
+            return None
+        offset = self.line_starts[line - 1] + tag.sourcepos
+        if self.source[offset:offset + len(tag.name) + 1].lower() != '<' + tag.name:
+            return None
+        return offset
+
+
+class CodeBlock:
+    """提取出的代码块，使用__slots__代替dict以减少大页面上的内存占用"""
+    
+    __slots__ = ('type', 'content', 'description')
+    
+    def __init__(self, type, content, description=None):
+        # 类型和描述只有少数几种取值，驻留后所有代码块共享同一个字符串对象
+        self.type = sys.intern(type)
+        self.content = content
+        self.description = sys.intern(description) if description else None
+
+
+_CONVERTER_DIGEST = None
+
+
+def _converter_digest():
+    """本文件源码的哈希，转换器修改后片段缓存自动失效"""
+    global _CONVERTER_DIGEST
+    if _CONVERTER_DIGEST is None:
+        import hashlib
+        with open(__file__, 'rb') as f:
+            _CONVERTER_DIGEST = hashlib.sha256(f.read()).hexdigest()
+    return _CONVERTER_DIGEST
+
 
 class DeepWikiParser:
     """DeepWiki解析器类"""
     
-    def __init__(self, progress_callback=None):
+    def __init__(self, progress_callback=None, instrumentation=None, profiler=None, section_callback=None,
+                 chunk_store=None):
         """
         初始化解析器
         
@@ -41,20 +204,61 @@ class DeepWikiParser:
                 stage: 当前阶段 ("fetch", "parse", "convert")
                 percentage: 0-100的进度百分比
                 message: 状态消息
+            instrumentation: instrumentation.Instrumentation 实例，记录各阶段和各标签处理的耗时与计数，
+                为None时不做任何记录
+            profiler: profiling.ConversionProfiler 实例，剖析每次 parse_html_to_markdown 并保存结果，
+                为None时不剖析
+            section_callback: 章节回调函数，接受参数 (index, markdown)，转换过程中每完成一个章节
+                （以一级/二级标题分隔）调用一次，所有章节按顺序拼接即为完整的Markdown
+            chunk_store: chunk_store.ChunkStore 实例，作为片段的转换缓存：主要内容按一级/二级标题分为片段，
+                源码相同的片段（包括其他页面中的）只转换一次，为None时不缓存
         """
-        self.session = requests.Session()
-        self.session.mount('https://', HTTPAdapter(max_retries=3))
+        self._session = None
+        self._fetcher = None
         self.progress_callback = progress_callback
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.profiler = profiler
+        self.section_callback = section_callback
+        self.chunk_store = chunk_store
+        if self.instrumentation.enabled:
+            # 只在启用插桩时才安装逐节点的计时包装，关闭时递归调用路径与原来完全相同
+            self._process_element = self._process_element_instrumented
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        self.code_blocks = {}  # 存储所有提取的代码块
+        self.code_blocks = {}  # 存储所有提取的代码块，值为CodeBlock
+        self._string_pool = {}  # 单个文档内的字符串驻留池，相同的代码块内容只保存一份
+        self._text_table = None  # 当前文档的文本偏移表，见 _TextTable
+        self._fragments = None  # 当前文档主要内容的片段 [(子元素列表, 缓存键, 已缓存的Markdown)]
+        self.last_fetch_status = None  # 最近一次抓取的HTTP状态码，请求出错时为None
         
     def _report_progress(self, stage, percentage, message):
         """报告进度"""
         if self.progress_callback:
             self.progress_callback(stage, percentage, message)
         logger.info(f"{stage} - {percentage}% - {message}")
+    
+    @property
+    def session(self):
+        """HTTP会话，第一次发起请求时才导入requests并创建"""
+        if self._session is None:
+            import requests
+            import urllib3
+            
+            # 禁用不安全HTTPS警告
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            
+            # 重试由抓取调度器负责
+            self._session = requests.Session()
+        return self._session
+    
+    @property
+    def fetcher(self):
+        """按主机限速的抓取调度器（见 fetch_scheduler.py），第一次抓取时创建"""
+        if self._fetcher is None:
+            from fetch_scheduler import FetchScheduler
+            self._fetcher = FetchScheduler.from_env(self.session, instrumentation=self.instrumentation)
+        return self._fetcher
         
     def github_to_deepwiki_url(self, github_url):
         """将GitHub URL转换为DeepWiki URL"""
@@ -69,20 +273,37 @@ class DeepWikiParser:
         # 替换domain
         return github_url.replace("github.com", "deepwiki.com")
     
+    def fetch_page(self, url):
+        """
+        通过抓取调度器获取页面，不报告进度，可在多个线程中并发调用
+        
+        30秒是单次尝试的超时上限，调度器按主机最近的耗时p95缩短超时，慢请求会发出对冲请求
+        
+        Returns:
+            (内容, 状态码)，状态码不是200时内容为None；请求出错时抛出异常
+        """
+        response = self.fetcher.get(url, headers=self.headers, verify=False, timeout=30)
+        if response.status_code != 200:
+            return None, response.status_code
+        return response.content, response.status_code
+    
     def fetch_deepwiki_content(self, url):
         """获取DeepWiki页面内容"""
+        self.last_fetch_status = None
         try:
             self._report_progress("fetch", 10, f"正在获取页面: {url}")
-            response = self.session.get(url, headers=self.headers, verify=False, timeout=30)
+            with self.instrumentation.span("fetch"):
+                content, self.last_fetch_status = self.fetch_page(url)
             
-            if response.status_code != 200:
-                self._report_progress("fetch", 0, f"获取页面失败，状态码: {response.status_code}")
+            if content is None:
+                self._report_progress("fetch", 0, f"获取页面失败，状态码: {self.last_fetch_status}")
                 return None
                 
             self._report_progress("fetch", 100, "成功获取页面内容")
-            return response.content
+            return content
             
         except Exception as e:
+            self.instrumentation.count("fetch.errors")
             self._report_progress("fetch", 0, f"获取页面时发生错误: {str(e)}")
             logger.error(f"获取页面失败: {str(e)}")
             logger.error(traceback.format_exc())
@@ -92,22 +313,49 @@ class DeepWikiParser:
         """将HTML内容解析为Markdown"""
         if not html_content:
             return None
-            
+        
+        if self.profiler:
+            with self.profiler, self.instrumentation.span("parse"):
+                return self._parse_html_to_markdown(html_content)
+        
+        with self.instrumentation.span("parse"):
+            return self._parse_html_to_markdown(html_content)
+    
+    def _parse_html_to_markdown(self, html_content):
+        """parse_html_to_markdown的实现"""
         self._report_progress("parse", 10, "开始解析HTML内容")
         
+        soup = None
+        main_content = None
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            soup = self._make_soup(html_content)
             self._report_progress("parse", 30, "HTML解析完成，开始提取内容")
             
-            # 提取代码块内容供后续使用
-            self.code_blocks = self.extract_code_blocks_from_html(html_content)
-            
             # 查找主要内容区域
             main_content = soup.select_one('.prose-custom-md')
+            if main_content is not None and self.chunk_store is not None:
+                self._fragments = self._lookup_fragments(html_content, soup, main_content)
+            
+            if self._fragments is not None and all(cached is not None for _, _, cached in self._fragments):
+                # 所有片段都已缓存，不需要转换；代码块列表只在转换中使用，也不必提取
+                self.instrumentation.count("extract.skipped")
+            else:
+                # 代码块提取和转换都会多次取同一批节点的文本，整个文档共用一张文本偏移表
+                with self.instrumentation.span("text_table"):
+                    self._text_table = _TextTable(soup)
+                # 提取代码块内容供后续使用，复用同一棵树，避免再解析一次HTML
+                self.code_blocks = self.extract_code_blocks_from_html(soup)
+                # 标签索引只在提取代码块时使用，释放对整棵树所有标签的引用，摘除的部分才能尽早回收
+                self._text_table.tags = None
             
             if not main_content:
                 self._report_progress("parse", 0, "找不到主要内容区域")
                 return None
+            
+            # 将主要内容从文档中摘出，尽早释放文档树的其余部分
+            main_content.extract()
+            soup.decompose()
+            soup = None
                 
             self._report_progress("parse", 50, "找到主要内容，开始转换为Markdown")
             
@@ -122,17 +370,194 @@ class DeepWikiParser:
             logger.error(f"解析页面失败: {str(e)}")
             logger.error(traceback.format_exc())
             return None
+        
+        finally:
+            # 转换结束后立即拆除节点之间的引用，不必等待垃圾回收处理循环引用
+            if main_content is not None:
+                main_content.decompose()
+            if soup is not None:
+                soup.decompose()
+            self._string_pool.clear()
+            self._text_table = None
+            self._fragments = None
+    
+    def _make_soup(self, html_content):
+        """构建文档树"""
+        _load_bs4()
+        with self.instrumentation.span("soup"):
+            return _InternedSoup(html_content, 'html.parser')
+    
+    def _intern_text(self, text):
+        """在当前文档内驻留字符串，重复出现的内容只保留一份"""
+        return self._string_pool.setdefault(text, text)
+    
+    def _find_tags(self, soup, names):
+        """
+        等价于 soup.find_all(names)，使用文本偏移表中按标签名收集的标签
+        
+        结果按标签名分组，同名标签之间保持文档顺序。
+        """
+        table = self._text_table
+        if table is None or table.root is not soup or table.tags is None:
+            return soup.find_all(names)
+        found = []
+        for name in names:
+            found.extend(table.tags.get(name, ()))
+        return found
+    
+    def _text_span(self, node):
+        """节点文本在文本偏移表中的起止位置(start, end)，不在表中时返回None"""
+        if self._text_table is None:
+            return None
+        span = self._text_table.offsets.get(id(node))
+        if span is None:
+            return None
+        return span >> 32, span & 0xFFFFFFFF
+    
+    def _text(self, node):
+        """等价于 node.get_text()，节点在文本偏移表中时直接切片"""
+        span = self._text_span(node)
+        if span is None:
+            return node.get_text()
+        return self._text_table.text[span[0]:span[1]]
+    
+    def _lower_text(self, node):
+        """等价于 node.get_text().lower()"""
+        span = self._text_span(node)
+        if span is None or self._text_table.lower is None:
+            return self._text(node).lower()
+        return self._text_table.lower[span[0]:span[1]]
+    
+    def _text_contains(self, node, needles, lower=False):
+        """
+        节点文本(lower为True时为小写文本)是否包含needles中的任意一个
+        
+        节点在文本偏移表中时直接在整篇文本的对应区间内查找，不生成子串。
+        """
+        span = self._text_span(node)
+        text = None
+        if span is not None:
+            text = self._text_table.lower if lower else self._text_table.text
+        if text is None:
+            text = node.get_text()
+            if lower:
+                text = text.lower()
+            return any(needle in text for needle in needles)
+        start, end = span
+        return any(text.find(needle, start, end) != -1 for needle in needles)
     
     def _convert_to_markdown(self, element):
         """将HTML元素转换为Markdown格式"""
         self._report_progress("convert", 0, "开始HTML转Markdown转换")
-        result = io.StringIO()
+        with self.instrumentation.span("convert"):
+            if (self.section_callback or self._fragments is not None) and element.name in SECTION_CONTAINERS:
+                markdown = self._convert_in_sections(element)
+            else:
+                result = io.StringIO()
+                
+                # 处理元素
+                self._process_element(element, result)
+                markdown = result.getvalue()
+                if self.section_callback and markdown:
+                    # 主要内容不是容器元素（如<ul>）时无法按标题切分，整体作为一个章节发出，
+                    # 否则按章节输出的调用方收不到任何内容
+                    self._emit_section([], markdown)
+
+        self._report_progress("convert", 100, "Markdown转换完成")
+        return markdown
+    
+    def _convert_in_sections(self, element):
+        """
+        按标题把容器的子元素分为片段逐个转换，在标题处切分章节并立即通过section_callback发出
+        
+        有转换缓存时已缓存的片段直接使用缓存的结果，新转换的片段在最后一起写入缓存
+        """
+        fragments = self._fragments
+        if fragments is None:
+            fragments = [(children, None, None) for children in self._split_fragments(element)]
+        sections = []
+        converted = []
+        buffer = io.StringIO()
         
-        # 处理元素
-        self._process_element(element, result)
+        for children, key, markdown in fragments:
+            # 只在已有内容时切分章节，开头没有输出的子元素与第一个标题属于同一章节
+            if children[0].name in SECTION_HEADINGS and buffer.tell():
+                self._emit_section(sections, buffer.getvalue())
+                buffer = io.StringIO()
+            if markdown is None:
+                output = io.StringIO()
+                for child in children:
+                    self._process_element(child, output)
+                markdown = output.getvalue()
+                if key is not None:
+                    converted.append((key, markdown))
+                    self.instrumentation.count("convert.fragments.converted")
+            else:
+                self.instrumentation.count("convert.fragments.cached")
+            buffer.write(markdown)
         
-        self._report_progress("convert", 100, "Markdown转换完成")
-        return result.getvalue()
+        if buffer.tell():
+            self._emit_section(sections, buffer.getvalue())
+        if converted:
+            self.chunk_store.put_fragments(converted)
+        return ''.join(sections)
+    
+    def _split_fragments(self, element):
+        """在一级/二级标题处把容器的子元素分为片段，返回子元素列表的列表"""
+        fragments = [[]]
+        for child in element.children:
+            if child.name in SECTION_HEADINGS and fragments[-1]:
+                fragments.append([])
+            fragments[-1].append(child)
+        return fragments if fragments[0] else []
+    
+    def _lookup_fragments(self, html_content, soup, main_content):
+        """
+        计算主要内容各片段的缓存键并查找已缓存的转换结果
+        
+        键为转换器源码、祖先标签和片段HTML源码的哈希。转换只读取片段自身的子树（代码块列表只被
+        特殊标记分支中不会执行到的代码使用），所以相同的键总是得到相同的Markdown。
+        
+        Returns:
+            [(子元素列表, 缓存键, 已缓存的Markdown或None)]；主要内容不是容器或无法确定源码位置时返回None
+        """
+        from chunk_store import content_digest
+        
+        if main_content.name not in SECTION_CONTAINERS:
+            return None
+        source = html_content
+        if isinstance(source, bytes):
+            try:
+                source = source.decode(soup.original_encoding or 'utf-8')
+            except (LookupError, UnicodeDecodeError):
+                return None
+        spans = _SourceSpans(source, main_content)
+        fragments = self._split_fragments(main_content)
+        starts = [spans.start] + [spans.offset(children[0]) for children in fragments[1:]]
+        if any(start is None for start in starts):
+            self.instrumentation.count("convert.fragments.unmapped")
+            return None
+        ends = starts[1:] + [spans.end]
+        prefix = f"{_converter_digest()}\0{spans.context}\0"
+        keys = [content_digest(prefix + source[start:end]) for start, end in zip(starts, ends)]
+        cached = self.chunk_store.get_fragments(keys)
+        return [(children, key, cached.get(key)) for children, key in zip(fragments, keys)]
+    
+    def _emit_section(self, sections, markdown):
+        """记录并发出一个完成的章节"""
+        self.instrumentation.count("convert.sections")
+        sections.append(markdown)
+        if self.section_callback:
+            self.section_callback(len(sections) - 1, markdown)
+    
+    def _process_element_instrumented(self, element, output, level=0):
+        """带插桩的_process_element，按标签名统计处理耗时（包含子元素）"""
+        tag_name = element.name
+        if tag_name is None:
+            self.instrumentation.count("convert.text_nodes")
+            return DeepWikiParser._process_element(self, element, output, level)
+        with self.instrumentation.span(f"tag.{tag_name}"):
+            return DeepWikiParser._process_element(self, element, output, level)
     
     def _process_element(self, element, output, level=0):
         """递归处理HTML元素转换为Markdown"""
@@ -249,9 +674,6 @@ class DeepWikiParser:
         elif tag_name == 'pre':
             language = ''
             
-            # 调试信息
-            self._report_progress("convert", 50, f"处理代码块: {element}")
-            
             # 更精确地检测代码语言
             if element.get('class'):
                 classes = element.get('class')
@@ -280,13 +702,14 @@ class DeepWikiParser:
             has_special_marker = False
             
             # 检查元素内的文本是否包含 $!/$ 标记
-            element_text = element.get_text() if element else ""
+            element_text = self._text(element) if element else ""
             # 扩展检测逻辑，支持更多可能的变体格式
             special_markers = ['$!/$', '$!$', '$/$']
             
             # 新策略：如果检测到$!/$标记，则跳过这个元素，不进行处理
             if (placeholder_marker and any(marker in placeholder_marker for marker in special_markers)) or \
                (element_text and any(marker in element_text for marker in special_markers)):
+                self.instrumentation.count("convert.markers_skipped")
                 self._report_progress("convert", 60, "检测到DeepWiki特殊标记，根据新策略跳过处理")
                 # 直接返回，不对这种特殊标记内容进行处理
                 return
@@ -297,7 +720,7 @@ class DeepWikiParser:
                 
                 # 检查所有已提取的代码块，优先使用mermaid类型的代码块
                 for key, block in self.code_blocks.items():
-                    if ('mermaid' in key or block.get('type') == 'mermaid'):
+                    if ('mermaid' in key or block.type == 'mermaid'):
                         matched_code_block = block
                         self._report_progress("convert", 62, f"找到预先提取的mermaid图表: {key}")
                         break
@@ -306,7 +729,7 @@ class DeepWikiParser:
                 mermaid_content = None
                 if not matched_code_block:
                     # 首先检查元素内部文本
-                    own_text = element.get_text().strip()
+                    own_text = self._text(element).strip()
                     if own_text:
                         # 检查是否包含mermaid关键词但非常短的文本，如果是则可能是需要替换的标记
                         if len(own_text) < 100 and ('$!/$' in own_text):
@@ -314,6 +737,7 @@ class DeepWikiParser:
                             # 优先检查父级元素的数据属性，许多框架使用这种方式存储数据
                             parent_element = element.parent if hasattr(element, 'parent') else None
                             if parent_element:
+                                import json
                                 for attr_name, attr_value in parent_element.attrs.items():
                                     if 'data-' in attr_name and isinstance(attr_value, str) and len(attr_value) > 50:
                                         try:
@@ -339,7 +763,7 @@ class DeepWikiParser:
                             prev_sibling = prev_sibling.previous_sibling
                         
                         if prev_sibling and isinstance(prev_sibling, Tag) and prev_sibling.name == 'p':
-                            text_content = prev_sibling.get_text()
+                            text_content = self._text(prev_sibling)
                             if text_content and any(keyword in text_content.lower() for keyword in ['graph ', 'flowchart ', 'sequencediagram']):
                                 mermaid_content = text_content
                                 self._report_progress("convert", 65, "从前一个元素提取到mermaid内容")
@@ -350,7 +774,7 @@ class DeepWikiParser:
                             next_sibling = next_sibling.next_sibling
                         
                         if next_sibling and isinstance(next_sibling, Tag):
-                            text_content = next_sibling.get_text()
+                            text_content = self._text(next_sibling)
                             if text_content and any(keyword in text_content.lower() for keyword in ['graph ', 'flowchart ', 'sequencediagram']):
                                 mermaid_content = text_content
                                 self._report_progress("convert", 65, "从后一个元素提取到mermaid内容")
@@ -364,7 +788,7 @@ class DeepWikiParser:
                     if parent_element:
                         for sibling in list(parent_element.children)[:10]:
                             if isinstance(sibling, Tag):
-                                text = sibling.get_text().lower()
+                                text = self._lower_text(sibling)
                                 surrounding_text += text + " "
                                 if "流程图" in text or "flowchart" in text:
                                     graph_type = "flowchart TD"
@@ -391,8 +815,8 @@ class DeepWikiParser:
                 # 输出代码块，按优先级使用：预提取代码块 > 周围提取内容 > 后备内容 > 提示信息
                 code_content = None
                 if matched_code_block:
-                    code_content = matched_code_block.get('content')
-                    language = matched_code_block.get('type', language or 'mermaid')
+                    code_content = matched_code_block.content
+                    language = matched_code_block.type or language or 'mermaid'
                 elif mermaid_content:
                     code_content = mermaid_content
                     language = language or 'mermaid'
@@ -411,8 +835,8 @@ class DeepWikiParser:
                     parent_element = element.parent if hasattr(element, 'parent') else None
                     if parent_element:
                         for sibling in parent_element.find_all(['p', 'div'], limit=3):
-                            if "diagram" in sibling.get_text().lower() or "图表" in sibling.get_text():
-                                description = sibling.get_text().strip()
+                            if self._text_contains(sibling, ("diagram",), lower=True) or self._text_contains(sibling, ("图表",)):
+                                description = self._text(sibling).strip()
                                 break
                     
                     if description:
@@ -428,31 +852,15 @@ class DeepWikiParser:
             
             # 处理代码内容
             if code_element:
-                try:
-                    # 尝试保留原始HTML，这样可以保留格式
-                    original_content = str(code_element)
-                    # 提取标签之间的内容
-                    import re
-                    clean_content = re.sub(r'<[^>]*>', '', original_content)
-                    # 处理HTML实体
-                    import html
-                    clean_content = html.unescape(clean_content)
-                    # 直接获取原始文本，保留缩进和空白
-                    if not clean_content.strip():
-                        # 如果上面的方法没有得到内容，尝试直接获取文本
-                        clean_content = code_element.get_text()
-                    
-                    # 删除开头和结尾多余的空行，但保留中间的空行和缩进
-                    code_content = clean_content.strip('\n')
-                    
-                    self._report_progress("convert", 70, f"提取到代码内容，长度：{len(code_content)} 字符")
-                    
-                    # 写入代码内容
-                    output.write(code_content)
-                except Exception as e:
-                    self._report_progress("convert", 30, f"处理代码内容时出错: {str(e)}")
-                    # 回退到基本的文本提取
-                    output.write(code_element.get_text().strip('\n'))
+                # 直接拼接文本节点，保留缩进和空白；删除开头和结尾多余的空行，但保留中间的空行
+                code_content = _code_text(code_element).strip('\n')
+                
+                self.instrumentation.count("convert.code_blocks")
+                self.instrumentation.observe("convert.code_block_chars", len(code_content))
+                self._report_progress("convert", 70, f"提取到代码内容，长度：{len(code_content)} 字符")
+                
+                # 写入代码内容
+                output.write(code_content)
             else:
                 # 如果没有code子元素，处理所有子元素
                 self._report_progress("convert", 40, "找不到code元素，处理所有子元素")
@@ -557,19 +965,40 @@ class DeepWikiParser:
                 self._process_element(child, output, level)
 
     def extract_code_blocks_from_html(self, html_content):
-        """从HTML中提取代码块内容"""
-        code_blocks = {}
+        """从HTML中提取代码块内容
+        
+        Args:
+            html_content: HTML内容，或已经解析好的BeautifulSoup文档
+        """
         if not html_content:
-            return code_blocks
-            
+            return {}
+        
+        with self.instrumentation.span("extract"):
+            code_blocks = self._extract_code_blocks(html_content)
+        self.instrumentation.count("extract.code_blocks", len(code_blocks))
+        return code_blocks
+    
+    def _extract_code_blocks(self, html_content):
+        """extract_code_blocks_from_html的实现"""
+        code_blocks = {}
+        owns_text_table = False
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            _load_bs4()
+            if isinstance(html_content, BeautifulSoup):
+                soup = html_content
+            else:
+                soup = self._make_soup(html_content)
+            if self._text_table is None:
+                # 单独提取代码块时，为这个文档建立文本偏移表
+                self._text_table = _TextTable(soup)
+                owns_text_table = True
             
             # 提取所有包含特殊标记的文本
             special_markers = []
             
             # 更全面地查找包含特殊标记的元素 - 不仅检查element.string，还检查完整的文本内容
-            all_elements = soup.find_all(['pre', 'code', 'div', 'p', 'span', 'script'])
+            all_elements = self._find_tags(soup, ['pre', 'code', 'div', 'p', 'span', 'script'])
+            self.instrumentation.count("extract.elements", len(all_elements))
             for element in all_elements:
                 # 根据新策略，不再收集带有$!/$标记的元素
                 # 以下代码被注释掉以实现新策略
@@ -582,14 +1011,16 @@ class DeepWikiParser:
                 #         break
                 
                 # 记录找到特殊标记但跳过处理
-                if '$!/$' in element.get_text() or any(isinstance(attr_value, str) and '$!/$' in attr_value for attr_name, attr_value in element.attrs.items()):
+                if self._text_contains(element, ('$!/$',)) or any(isinstance(attr_value, str) and '$!/$' in attr_value for attr_name, attr_value in element.attrs.items()):
+                    self.instrumentation.count("extract.markers")
                     self._report_progress("parse", 25, f"发现$!/$ 特殊标记，但根据新策略跳过处理")
             
             self._report_progress("parse", 25, f"找到 {len(special_markers)} 个特殊标记")
             
             # 优先搜索特殊标记附近的真实内容
             # 先检查script元素中是否包含mermaid数据，这些通常是图表的真实数据源
-            script_elements = soup.find_all('script')
+            script_elements = self._find_tags(soup, ['script'])
+            self.instrumentation.count("extract.scripts", len(script_elements))
             mermaid_in_script = []
             
             for script in script_elements:
@@ -603,17 +1034,8 @@ class DeepWikiParser:
                     # 尝试从脚本中提取包含的图表定义
                     try:
                         # 查找常见的图表定义模式
-                        patterns = [
-                            r'graph\s+[TBLR][TBLRD]\s*[\r\n]{.*?}',
-                            r'flowchart\s+[TBLR][TBLRD]\s*[\r\n]{.*?}',
-                            r'sequenceDiagram[\r\n]{.*?}',
-                            r'classDiagram[\r\n]{.*?}',
-                            r'gantt[\r\n]{.*?}',
-                            r'pie[\r\n]{.*?}'
-                        ]
-                        for pattern in patterns:
-                            import re
-                            matches = re.findall(pattern, script_content, re.DOTALL)
+                        for pattern in MERMAID_SCRIPT_PATTERNS:
+                            matches = pattern.findall(script_content)
                             for match in matches:
                                 self._report_progress("parse", 26, f"从脚本中提取到mermaid内容")
                                 mermaid_in_script.append(match)
@@ -628,7 +1050,7 @@ class DeepWikiParser:
                 code_text = ""
                 
                 # 先检查元素自身的完整文本内容
-                marker_text = marker.get_text()
+                marker_text = self._text(marker)
                 
                 # 特殊标记的内容往往是尖括号内包含的代码
                 # 寻找符合特定模式的mermaid内容
@@ -650,7 +1072,7 @@ class DeepWikiParser:
                         # 这可能是一个代码块
                         code_element = parent_element.find('code')
                         if code_element:
-                            code_text = code_element.get_text()
+                            code_text = self._text(code_element)
                             # 去除特殊标记
                             code_text = code_text.replace('$!/$', '').strip()
                 
@@ -682,10 +1104,7 @@ class DeepWikiParser:
                 # 只有找到有效内容才添加到代码块集合
                 if code_text and len(code_text) > 20:
                     key = f"special-code-{i}"
-                    code_blocks[key] = {
-                        'type': language,
-                        'content': code_text
-                    }
+                    code_blocks[key] = CodeBlock(language, self._intern_text(code_text))
                     self._report_progress("parse", 26, f"提取到特殊代码块: {key}")
                 
             # 尝试提取所有mermaid图表内容
@@ -693,45 +1112,43 @@ class DeepWikiParser:
             
             # 查找包含mermaid内容的元素
             for tag in ['pre', 'code', 'div', 'p']:
-                elements = soup.find_all(tag)
+                elements = self._find_tags(soup, [tag])
                 for element in elements:
-                    text = element.get_text()
-                    if text and any(keyword in text.lower() for keyword in ['graph ', 'flowchart ', 'sequencediagram', 'classdiagram', 'gantt']):
+                    if self._text_contains(element, ('graph ', 'flowchart ', 'sequencediagram', 'classdiagram', 'gantt'), lower=True):
                         potential_mermaid.append(element)
             
             self._report_progress("parse", 28, f"找到 {len(potential_mermaid)} 个潜在的mermaid图表")
             
             for i, element in enumerate(potential_mermaid):
-                text = element.get_text()
                 # 提取mermaid内容
-                mermaid_content = text
+                mermaid_content = self._text(element)
+                text_lower = self._lower_text(element)
                 
                 # 识别图表类型
                 graph_type = None
-                if 'graph ' in text.lower():
+                if 'graph ' in text_lower:
                     graph_type = "流程图"
-                elif 'flowchart ' in text.lower():
+                elif 'flowchart ' in text_lower:
                     graph_type = "流程图"
-                elif 'sequencediagram' in text.lower():
+                elif 'sequencediagram' in text_lower:
                     graph_type = "序列图"
-                elif 'classdiagram' in text.lower():
+                elif 'classdiagram' in text_lower:
                     graph_type = "类图"
-                elif 'gantt' in text.lower():
+                elif 'gantt' in text_lower:
                     graph_type = "甘特图"
                 
                 if graph_type:
                     key = f"mermaid-{i}-{hash(mermaid_content) % 10000}"
-                    code_blocks[key] = {
-                        'type': 'mermaid',
-                        'content': mermaid_content,
-                        'description': f"{graph_type}图表"
-                    }
+                    code_blocks[key] = CodeBlock('mermaid', self._intern_text(mermaid_content), f"{graph_type}图表")
                     self._report_progress("parse", 28, f"成功提取到特殊代码块: {graph_type}")
             
         except Exception as e:
             self._report_progress("parse", 20, f"提取代码块时出错: {str(e)}")
             logger.error(f"提取代码块时出错: {str(e)}")
             logger.error(traceback.format_exc())
+        finally:
+            if owns_text_table:
+                self._text_table = None
         
         self._report_progress("parse", 45, f"共提取到 {len(code_blocks)} 个代码块")
         return code_blocks
@@ -776,11 +1193,7 @@ class DeepWikiParser:
                             chart_desc = '用户旅程图'
                             
                         # 保存到代码块字典
-                        code_blocks[f"mermaid-json-{key}-{hash(value) % 10000}"] = {
-                            'type': chart_type,
-                            'content': value,
-                            'description': chart_desc
-                        }
+                        code_blocks[f"mermaid-json-{key}-{hash(value) % 10000}"] = CodeBlock(chart_type, value, chart_desc)
                         self._report_progress("parse", 38, f"从JSON字段'{key}'中提取到{chart_desc}")
                         
                 elif isinstance(value, (dict, list)):
@@ -823,11 +1236,7 @@ class DeepWikiParser:
                             chart_desc = '用户旅程图'
                             
                         # 保存到代码块字典
-                        code_blocks[f"mermaid-json-list-{hash(item) % 10000}"] = {
-                            'type': chart_type,
-                            'content': item,
-                            'description': chart_desc
-                        }
+                        code_blocks[f"mermaid-json-list-{hash(item) % 10000}"] = CodeBlock(chart_type, item, chart_desc)
                         self._report_progress("parse", 38, f"从JSON列表中提取到{chart_desc}")
 
     def _detect_mermaid_type(self, text):
@@ -955,7 +1364,7 @@ class DeepWikiParser:
             # 检查父元素的子元素中是否有code元素
             code_element = parent.find('code')
             if code_element and code_element != marker:
-                code_text = code_element.get_text()
+                code_text = self._text(code_element)
                 if len(code_text) > 20 and any(keyword in code_text.lower() for keyword in [
                     'graph ', 'flowchart ', 'sequencediagram', 'classdiagram', 
                     'gantt', 'pie ', 'mindmap', 'gitgraph', 'timeline', 
@@ -969,7 +1378,7 @@ class DeepWikiParser:
         
         # 检查前一个兄弟元素
         if prev_sibling and hasattr(prev_sibling, 'get_text'):
-            text = prev_sibling.get_text()
+            text = self._text(prev_sibling)
             if len(text) > 20 and any(keyword in text.lower() for keyword in [
                 'graph ', 'flowchart ', 'sequencediagram', 'classdiagram', 
                 'gantt', 'pie ', 'mindmap', 'gitgraph', 'timeline', 
@@ -979,7 +1388,7 @@ class DeepWikiParser:
         
         # 检查后一个兄弟元素
         if next_sibling and hasattr(next_sibling, 'get_text'):
-            text = next_sibling.get_text()
+            text = self._text(next_sibling)
             if len(text) > 20 and any(keyword in text.lower() for keyword in [
                 'graph ', 'flowchart ', 'sequencediagram', 'classdiagram', 
                 'gantt', 'pie ', 'mindmap', 'gitgraph', 'timeline', 
@@ -991,7 +1400,7 @@ class DeepWikiParser:
         if parent:
             hidden_elements = parent.find_all(['div', 'span', 'pre'], style=lambda s: s and 'display:none' in s)
             for hidden in hidden_elements:
-                text = hidden.get_text()
+                text = self._text(hidden)
                 if len(text) > 20 and any(keyword in text.lower() for keyword in [
                     'graph ', 'flowchart ', 'sequencediagram', 'classdiagram', 
                     'gantt', 'pie ', 'mindmap', 'gitgraph', 'timeline', 
@@ -1026,18 +1435,116 @@ class DeepWikiParser:
 
 def main():
     """命令行入口点"""
-    if len(sys.argv) < 2:
-        print("用法: python parse_deepwiki.py <github_url|deepwiki_url>")
-        return 1
-        
-    url = sys.argv[1]
+    import argparse
+    
+    arg_parser = argparse.ArgumentParser(description="解析GitHub仓库的DeepWiki内容")
+    arg_parser.add_argument("url", nargs="?", help="GitHub或DeepWiki仓库链接")
+    arg_parser.add_argument("--convert-url", action="store_true", help="只输出转换后的DeepWiki URL，不抓取页面")
+    arg_parser.add_argument("--metrics", action="store_true", help="记录各阶段耗时和计数，结束时以 [metrics] {json} 格式输出")
+    arg_parser.add_argument("--profile", choices=("cprofile", "sample"), help="剖析HTML转换过程：cprofile为确定性剖析，sample为统计采样")
+    arg_parser.add_argument("--profile-output", help="剖析结果文件路径，默认为当前目录下的 deepwiki.prof 或 deepwiki.folded")
+    arg_parser.add_argument("--stream-sections", action="store_true",
+                            help="每完成一个章节立即以 [section] {json} 格式输出，代替最后的整块Markdown输出")
+    arg_parser.add_argument("--checkpoint", metavar="DIR",
+                            help="抓取仓库Wiki的所有页面，每完成一页在DIR中保存检查点；用同一个DIR重新运行时只抓取缺失或失败的页面")
+    arg_parser.add_argument("--max-attempts", type=int, default=3, help="抓取所有页面时单个页面最多尝试的次数")
+    arg_parser.add_argument("--replay", metavar="SOURCE",
+                            help="不访问网络，转换本地HTML目录、tar包或WARC归档中的所有页面，结果写入 --output 目录")
+    arg_parser.add_argument("--output", metavar="DIR", help="离线重放的输出目录，每个页面一个 .md 文件")
+    arg_parser.add_argument("--jobs", type=int, help="离线重放的并行进程数，默认为CPU核数")
+    arg_parser.add_argument("--chunk-store", metavar="FILE",
+                            help="把结果按章节和代码块去重保存到FILE，并作为片段的转换缓存；离线重放时输出目录中每个页面只写清单 (.chunks.json)")
+    arg_parser.add_argument("--manifest", metavar="FILE",
+                            help="解析成功后把完整的Markdown保存到 --chunk-store，在FILE中写入指向它的清单")
+    args = arg_parser.parse_args()
+    
+    if args.replay:
+        if args.url or args.profile or args.checkpoint or args.stream_sections or args.convert_url or args.manifest:
+            arg_parser.error("--replay 不能与URL、--convert-url、--profile、--checkpoint、--stream-sections、--manifest 同时使用")
+        if not args.output:
+            arg_parser.error("--replay 需要指定 --output")
+    elif not args.url:
+        arg_parser.error("需要指定仓库链接或 --replay")
+    if args.manifest and not args.chunk_store:
+        arg_parser.error("--manifest 需要指定 --chunk-store")
+    
+    url = args.url
+    
+    if args.convert_url:
+        print(DeepWikiParser().github_to_deepwiki_url(url) if "github.com" in url else url)
+        return 0
+    
+    # 配置日志
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     
     # 进度回调函数
     def progress_callback(stage, percentage, message):
         print(f"[{stage}] {percentage}%: {message}")
     
-    parser = DeepWikiParser(progress_callback)
+    instrumentation = None
+    if args.metrics:
+        from instrumentation import Instrumentation
+        instrumentation = Instrumentation()
+    
+    profiler = None
+    if args.profile:
+        from profiling import ConversionProfiler, PROFILE_EXTENSIONS
+        profile_output = args.profile_output or f"deepwiki{PROFILE_EXTENSIONS[args.profile]}"
+        profiler = ConversionProfiler(args.profile, profile_output)
+    
+    section_callback = None
+    if args.stream_sections:
+        import json
+        
+        def section_callback(index, markdown):
+            # 立即刷新，让server.js尽快把章节转发给浏览器
+            print(f"[section] {json.dumps({'index': index, 'markdown': markdown}, ensure_ascii=False)}", flush=True)
+    
+    if args.replay:
+        try:
+            return _run_replay(args.replay, args.output, args.jobs, instrumentation, progress_callback,
+                               chunk_store=args.chunk_store)
+        finally:
+            if instrumentation:
+                import json
+                print(f"[metrics] {json.dumps(instrumentation.to_dict(), ensure_ascii=False)}")
+    
+    chunk_store = None
+    if args.chunk_store:
+        from chunk_store import ChunkStore
+        chunk_store = ChunkStore(args.chunk_store)
     
+    parser = DeepWikiParser(progress_callback, instrumentation=instrumentation, profiler=profiler,
+                            section_callback=section_callback, chunk_store=chunk_store)
+    
+    try:
+        if args.checkpoint:
+            return _run_crawl(parser, url, args.checkpoint, args.max_attempts,
+                              print_markdown=not args.stream_sections, manifest=args.manifest)
+        return _run_cli(parser, url, print_markdown=not args.stream_sections, manifest=args.manifest)
+    finally:
+        if chunk_store is not None:
+            chunk_store.close()
+        if parser._fetcher is not None:
+            # 保存本次的请求耗时，下一个解析进程从已有的p95开始自适应超时和对冲
+            try:
+                parser._fetcher.save_state()
+            except OSError as e:
+                logger.warning(f"保存抓取状态失败: {e}")
+        if instrumentation:
+            import json
+            # 无论成功与否都输出指标，由server.js汇总到 /metrics
+            print(f"[metrics] {json.dumps(instrumentation.to_dict(), ensure_ascii=False)}")
+        if profiler and os.path.exists(profiler.output_path):
+            print(f"[profile] {profiler.output_path}")
+
+
+def _run_cli(parser, url, print_markdown=True, manifest=None):
+    """
+    抓取并解析页面，把Markdown输出到标准输出（按章节输出时已经由section_callback输出）
+    
+    指定manifest时同时把Markdown保存到解析器的分块存储并写入清单
+    """
     # 将GitHub URL转换为DeepWiki URL
     if "github.com" in url:
         url = parser.github_to_deepwiki_url(url)
@@ -1061,7 +1568,85 @@ def main():
         logger.error(traceback.format_exc())
         return 1
         
-    # 输出结果
+    if manifest:
+        _write_manifest(parser, manifest, markdown)
+    if print_markdown:
+        _print_markdown(markdown)
+    return 0
+
+
+def _run_crawl(parser, url, checkpoint_dir, max_attempts, print_markdown=True, manifest=None):
+    """抓取仓库Wiki的所有页面，每完成一页保存检查点，输出拼接后的Markdown"""
+    from crawl import WikiCrawl
+    
+    if "github.com" in url:
+        url = parser.github_to_deepwiki_url(url)
+        print(f"转换为DeepWiki URL: {url}")
+    
+    try:
+        markdown, failed = WikiCrawl(parser, checkpoint_dir, max_attempts=max_attempts).run(url)
+    except Exception as e:
+        print(f"抓取页面时发生错误: {str(e)}")
+        logger.error(f"抓取页面时发生错误: {str(e)}")
+        logger.error(traceback.format_exc())
+        return 1
+    
+    if failed:
+        print(f"{len(failed)} 个页面抓取失败，已完成的页面保存在 {checkpoint_dir}，重新运行可继续:")
+        for page_url in failed:
+            print(f"  {page_url}")
+        return 1
+    
+    if manifest:
+        _write_manifest(parser, manifest, markdown)
+    if print_markdown:
+        _print_markdown(markdown)
+    return 0
+
+
+def _write_manifest(parser, manifest, markdown):
+    """
+    把完整的Markdown按Markdown本身的哈希保存到分块存储，并写入指向它的清单
+    
+    写入失败时只记录错误：server.js 找不到清单时改为把收到的Markdown写成完整的文件
+    """
+    from chunk_store import content_digest
+    
+    data = markdown.encode("utf-8")
+    try:
+        digest = parser.chunk_store.put_page(content_digest(data), markdown, parser.instrumentation)
+        parser.chunk_store.write_manifest(manifest, digest, len(data))
+    except Exception as e:
+        logger.error(f"保存到分块存储失败: {str(e)}")
+
+
+def _run_replay(source, output_dir, jobs, instrumentation, progress_callback, chunk_store=None):
+    """离线转换本地归档中的所有页面，结果写入输出目录"""
+    import time
+    from replay import replay
+    
+    start = time.perf_counter()
+    try:
+        done, failed = replay(source, output_dir, jobs=jobs, instrumentation=instrumentation,
+                              progress_callback=progress_callback, chunk_store=chunk_store)
+    except Exception as e:
+        print(f"离线重放时发生错误: {str(e)}")
+        logger.error(f"离线重放时发生错误: {str(e)}")
+        logger.error(traceback.format_exc())
+        return 1
+    
+    elapsed = time.perf_counter() - start
+    print(f"已转换 {done} 个页面到 {output_dir}，用时 {elapsed:.1f} 秒（{(done + len(failed)) / max(elapsed, 1e-9):.1f} 页/秒）")
+    if failed:
+        print(f"{len(failed)} 个页面转换失败:")
+        for name, error in failed:
+            print(f"  {name}: {error}")
+        return 1
+    return 0
+
+
+def _print_markdown(markdown):
+    """以分隔行包围输出完整的Markdown，供server.js收集"""
     print("--------- Markdown 内容 ---------")
     if markdown:
         # 使用明确的分隔符格式，确保每一行Markdown都能被完整捕获
@@ -1070,8 +1655,6 @@ def main():
     else:
         print("警告: Markdown内容为空")
     print("--------- Markdown 结束 ---------")
-    
-    return 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+转换过程性能剖析
+
+用法:
+    profiler = ConversionProfiler("cprofile", "/path/task.prof")
+    parser = DeepWikiParser(profiler=profiler)
+    parser.parse_html_to_markdown(html)   # 结束时自动保存
+
+同一个剖析器多次进入时（多页抓取中每页一次转换）结果累计，每次退出时保存到目前为止的全部结果。
+
+两种剖析方式:
+    cprofile  确定性剖析，保存为pstats文件，可用 snakeviz / flameprof 查看
+    sample    统计采样，后台线程定期采样解析线程的调用栈，保存为折叠栈格式
+              (每行 "帧1;帧2;...;帧N 次数")，可直接用 flamegraph.pl 或 speedscope 生成火焰图
+"""
+
+import os
+import sys
+import threading
+from collections import Counter
+
+PROFILE_KINDS = ("cprofile", "sample")
+
+# 各剖析方式默认的文件扩展名
+PROFILE_EXTENSIONS = {
+    "cprofile": ".prof",
+    "sample": ".folded",
+}
+
+
+class _StackSampler:
+    """在后台线程中定期采样目标线程的调用栈"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._target_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ConversionProfiler:
+    """剖析转换过程并把结果保存到文件，作为上下文管理器使用，可多次进入"""
+
+    def __init__(self, kind, output_path, interval=0.005):
+        """
+        Args:
+            kind: 剖析方式，"cprofile" 或 "sample"
+            output_path: 结果文件路径
+            interval: 采样间隔(秒)，只对 sample 有效
+        """
+        if kind not in PROFILE_KINDS:
+            raise ValueError(f"不支持的剖析方式: {kind}")
+        self.kind = kind
+        self.output_path = output_path
+        self.interval = interval
+        self._profiler = None
+
+    def __enter__(self):
+        # 保留之前的剖析器，继续累计
+        if self.kind == "cprofile":
+            if self._profiler is None:
+                import cProfile
+                self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            if self._profiler is None:
+                self._profiler = _StackSampler(self.interval)
+            self._profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.kind == "cprofile":
+            self._profiler.disable()
+            self._profiler.dump_stats(self.output_path)
+        else:
+            self._profiler.stop()
+            self._profiler.save(self.output_path)
+        return False
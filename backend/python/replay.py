@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+
+"""
+离线重放 - 从本地HTML目录、tar包或WARC归档读取页面，并行转换为Markdown
+
+用法:
+    python deepwiki_cli.py --replay pages.warc.gz --output out/ [--jobs 8] [--chunk-store chunks.db] [--metrics]
+
+支持的来源:
+    目录      递归读取其中的 *.html / *.htm 文件
+    tar包     .tar / .tar.gz / .tgz 等中的 *.html / *.htm 成员
+    WARC归档  .warc / .warc.gz 中状态码为200、类型为HTML的 response 记录
+
+未压缩的来源（目录中的文件、.tar、.warc）由主进程只建立 (文件, 偏移, 长度) 索引，
+工作进程各自内存映射同一个文件并直接切片读取，页面内容不经过进程间管道；
+压缩的归档只能顺序解压，由主进程读出页面内容后交给工作进程。
+每个工作进程有自己的 DeepWikiParser，转换结果直接写入输出目录，吞吐量只受CPU限制。
+指定 --chunk-store 时结果按章节和代码块去重保存（见 chunk_store.py），原始HTML相同的页面不再重新转换，
+不同页面中源码相同的片段也只转换一次。
+"""
+
+import gzip
+import logging
+import mmap
+import os
+import re
+import tarfile
+import threading
+import time
+import zlib
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("DeepWikiParser")
+
+HTML_SUFFIXES = (".html", ".htm")
+WARC_SUFFIXES = (".warc", ".warc.gz")
+# HTTP响应头最多读取的字节数
+MAX_HTTP_HEAD = 65536
+
+# 待转换的页面：data为None时从path的[offset, offset+length)读取；
+# transfer为WARC中HTTP响应体的 (是否分块, Content-Encoding)，普通HTML文件为None
+ReplayPage = namedtuple("ReplayPage", "name path offset length data transfer")
+
+
+def iter_pages(source):
+    """按顺序列出来源中的所有页面"""
+    if os.path.isdir(source):
+        return _iter_directory(source)
+    if source.endswith(".warc"):
+        return _iter_warc_mapped(source)
+    if source.endswith(".warc.gz"):
+        return _iter_warc_stream(source)
+    if tarfile.is_tarfile(source):
+        return _iter_tar(source)
+    raise ValueError(f"不支持的重放来源: {source}")
+
+
+def count_pages(source):
+    """统计页面数，压缩的归档需要完整解压一遍才能统计，返回None"""
+    if os.path.isdir(source) or source.endswith(".warc") or _is_plain_tar(source):
+        return sum(1 for _ in iter_pages(source))
+    return None
+
+
+def _iter_directory(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(HTML_SUFFIXES):
+                continue
+            path = os.path.join(dirpath, filename)
+            size = os.path.getsize(path)
+            if size:
+                name = os.path.splitext(os.path.relpath(path, root))[0]
+                yield ReplayPage(name, path, 0, size, None, None)
+
+
+def _is_plain_tar(path):
+    """是否为未压缩的tar包（成员可以按偏移直接读取）"""
+    try:
+        with tarfile.open(path, "r:"):
+            return True
+    except tarfile.TarError:
+        return False
+
+
+def _iter_tar(path):
+    if _is_plain_tar(path):
+        with tarfile.open(path, "r:") as tar:
+            for member in tar:
+                if member.isfile() and member.size and member.name.lower().endswith(HTML_SUFFIXES):
+                    yield ReplayPage(os.path.splitext(member.name)[0], path, member.offset_data,
+                                     member.size, None, None)
+        return
+    # 压缩的tar包只能按顺序读取
+    with tarfile.open(path, "r|*") as tar:
+        for member in tar:
+            if member.isfile() and member.size and member.name.lower().endswith(HTML_SUFFIXES):
+                yield ReplayPage(os.path.splitext(member.name)[0], None, 0, member.size,
+                                 tar.extractfile(member).read(), None)
+
+
+def _parse_headers(lines):
+    """解析 "名称: 值" 形式的头部行，名称转为小写"""
+    headers = {}
+    for line in lines:
+        name, sep, value = line.partition(b":")
+        if sep:
+            headers[name.strip().lower().decode("latin-1")] = value.strip().decode("latin-1")
+    return headers
+
+
+def _parse_http_head(block):
+    """
+    解析WARC response记录中的HTTP响应头
+
+    Returns:
+        (响应头长度, (是否分块, Content-Encoding))，不是状态码200的HTML响应时返回None
+    """
+    end = block.find(b"\r\n\r\n", 0, MAX_HTTP_HEAD)
+    if end < 0:
+        return None
+    lines = block[:end].split(b"\r\n")
+    status = lines[0].split(None, 2)
+    if len(status) < 2 or status[1] != b"200":
+        return None
+    headers = _parse_headers(lines[1:])
+    if "html" not in headers.get("content-type", ""):
+        return None
+    chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+    encoding = headers.get("content-encoding", "").lower() or None
+    return end + 4, (chunked, encoding)
+
+
+def _warc_page_name(uri):
+    """用目标URL作为页面名：主机名/路径，以/结尾时补上index"""
+    parts = urlsplit(uri)
+    path = parts.path if not parts.path.endswith("/") else parts.path + "index"
+    return parts.netloc + path
+
+
+def _is_html_response(headers):
+    return (headers.get("warc-type") == "response"
+            and headers.get("content-type", "").startswith("application/http"))
+
+
+def _iter_warc_mapped(path):
+    """内存映射未压缩的WARC文件，只读取各记录的头部，按Content-Length跳过记录内容"""
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        pos = 0
+        size = len(mapped)
+        while pos < size:
+            head_end = mapped.find(b"\r\n\r\n", pos)
+            if head_end < 0:
+                break
+            headers = _parse_headers(mapped[pos:head_end].split(b"\r\n")[1:])
+            block = head_end + 4
+            length = int(headers.get("content-length", 0))
+            if _is_html_response(headers):
+                http = _parse_http_head(mapped[block:block + min(length, MAX_HTTP_HEAD)])
+                if http:
+                    head_length, transfer = http
+                    yield ReplayPage(_warc_page_name(headers.get("warc-target-uri", "")), path,
+                                     block + head_length, length - head_length, None, transfer)
+            # 记录之间以空行分隔
+            pos = block + length
+            while mapped[pos:pos + 2] == b"\r\n":
+                pos += 2
+    finally:
+        mapped.close()
+
+
+def _iter_warc_stream(path):
+    """顺序解压 .warc.gz（每个记录一个gzip成员，gzip模块会连续读取）"""
+    with gzip.open(path, "rb") as f:
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            lines = []
+            while True:
+                line = f.readline()
+                if not line.strip():
+                    break
+                lines.append(line.rstrip(b"\r\n"))
+            headers = _parse_headers(lines)
+            block = f.read(int(headers.get("content-length", 0)))
+            if _is_html_response(headers):
+                http = _parse_http_head(block)
+                if http:
+                    head_length, transfer = http
+                    yield ReplayPage(_warc_page_name(headers.get("warc-target-uri", "")), None, 0,
+                                     len(block) - head_length, block[head_length:], transfer)
+
+
+def _decode_body(body, transfer):
+    """还原HTTP响应体的分块传输和内容压缩"""
+    chunked, encoding = transfer
+    if chunked:
+        chunks = []
+        pos = 0
+        while True:
+            line_end = body.index(b"\r\n", pos)
+            chunk_size = int(body[pos:line_end].split(b";")[0], 16)
+            if chunk_size == 0:
+                break
+            chunks.append(body[line_end + 2:line_end + 2 + chunk_size])
+            pos = line_end + 2 + chunk_size + 2
+        body = b"".join(chunks)
+    if encoding in ("gzip", "x-gzip"):
+        body = gzip.decompress(body)
+    elif encoding == "deflate":
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+    elif encoding not in (None, "identity"):
+        raise ValueError(f"不支持的内容编码: {encoding}")
+    return body
+
+
+def output_path(output_dir, name):
+    """页面名对应的输出文件，去掉 ".." 和不安全的字符，结果总在输出目录内"""
+    parts = [re.sub(r"[^\w.\-]", "_", part) for part in re.split(r"[\\/]+", name)
+             if part not in ("", ".", "..")]
+    return os.path.join(output_dir, *(parts or ["index"])) + ".md"
+
+
+# 工作进程的状态，由 _init_worker 设置
+_worker_parser = None
+_worker_output = None
+_worker_metrics = False
+_worker_store = None  # chunk_store.ChunkStore，为None时输出完整的 .md 文件
+_worker_mapped = (None, None)  # (文件路径, mmap)，归档中相邻的页面复用同一个映射
+
+
+def _init_worker(output_dir, metrics, chunk_store=None):
+    global _worker_parser, _worker_output, _worker_metrics, _worker_store
+    from parse_deepwiki import DeepWikiParser
+    from instrumentation import Instrumentation
+    from chunk_store import ChunkStore
+
+    # 每个页面都会输出多条进度日志，重放时只保留警告和错误
+    logger.setLevel(logging.WARNING)
+    _worker_store = ChunkStore(chunk_store) if chunk_store else None
+    # 分块存储同时作为片段的转换缓存，不同页面中相同的章节只转换一次
+    _worker_parser = DeepWikiParser(instrumentation=Instrumentation() if metrics else None, chunk_store=_worker_store)
+    _worker_output = output_dir
+    _worker_metrics = metrics
+
+
+def _read_page(page):
+    global _worker_mapped
+    if page.data is not None:
+        body = page.data
+    elif page.offset == 0 and page.transfer is None and page.length == os.path.getsize(page.path):
+        # 目录中的单个HTML文件，映射后读取一次即关闭
+        with open(page.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            body = mapped[:]
+    else:
+        path, mapped = _worker_mapped
+        if path != page.path:
+            if mapped is not None:
+                mapped.close()
+            with open(page.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _worker_mapped = (page.path, mapped)
+        body = mapped[page.offset:page.offset + page.length]
+    if page.transfer:
+        body = _decode_body(body, page.transfer)
+    return body
+
+
+def _convert_page(page):
+    """
+    在工作进程中转换一个页面并写入输出目录
+
+    Returns:
+        (页面名, 错误信息或None, 指标dict或None, 是否复用了相同页面的转换结果)
+    """
+    from instrumentation import Instrumentation
+
+    if _worker_metrics:
+        # 每个页面使用新的插桩实例，主进程合并各页面的记录
+        _worker_parser.instrumentation = Instrumentation()
+    reused = False
+    try:
+        if _worker_store:
+            reused = _convert_page_chunked(page)
+        else:
+            markdown = _worker_parser.parse_html_to_markdown(_read_page(page))
+            if not markdown:
+                raise ValueError("未能提取到有效内容")
+            path = output_path(_worker_output, page.name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(markdown)
+        error = None
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    metrics = _worker_parser.instrumentation.to_dict() if _worker_metrics else None
+    return page.name, error, metrics, reused
+
+
+def _convert_page_chunked(page):
+    """
+    转换页面，结果保存到分块存储，输出目录中写入指向它的清单；原始HTML与之前转换过的页面
+    完全相同时（同一页面被多次抓取、不同仓库共用的页面）直接引用已有的结果，不再解析
+
+    Returns:
+        是否复用了之前的转换结果
+    """
+    from chunk_store import MANIFEST_SUFFIX, content_digest
+
+    html_content = _read_page(page)
+    digest = content_digest(html_content)
+    reused = _worker_store.has_page(digest)
+    if reused:
+        _worker_parser.instrumentation.count("dedup.pages.reused")
+    else:
+        markdown = _worker_parser.parse_html_to_markdown(html_content)
+        if not markdown:
+            raise ValueError("未能提取到有效内容")
+        _worker_store.put_page(digest, markdown, _worker_parser.instrumentation)
+    path = os.path.splitext(output_path(_worker_output, page.name))[0] + MANIFEST_SUFFIX
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _worker_store.write_manifest(path, digest)
+    return reused
+
+
+def replay(source, output_dir, jobs=None, instrumentation=None, progress_callback=None, chunk_store=None):
+    """
+    转换来源中的所有页面
+
+    Args:
+        source: HTML目录、tar包或WARC归档路径
+        output_dir: 输出目录，每个页面一个 .md 文件（指定chunk_store时为 .chunks.json 分块清单）
+        jobs: 工作进程数，默认CPU核数；为1时在当前进程中转换
+        instrumentation: instrumentation.Instrumentation 实例，汇总所有页面的记录，为None时不记录
+        progress_callback: 进度回调函数，接受参数 (stage, percentage, message)
+        chunk_store: 分块存储文件（见 chunk_store.py），重复的章节、代码块和页面只保存、转换一次；
+            多次重放可以共用同一个存储
+
+    Returns:
+        (成功的页面数, 失败的页面 [(页面名, 错误信息)])
+    """
+    jobs = jobs or os.cpu_count() or 1
+    metrics = instrumentation is not None and instrumentation.enabled
+    total = count_pages(source)
+    pages = iter_pages(source)
+    os.makedirs(output_dir, exist_ok=True)
+
+    done = 0
+    reused = 0
+    failed = []
+    start = time.perf_counter()
+    last_report = start
+
+    def report(final=False):
+        rate = (done + len(failed)) / max(time.perf_counter() - start, 1e-9)
+        processed = done + len(failed)
+        percentage = 100 if final else (processed * 100 // total if total else 0)
+        counts = f"{processed}/{total}" if total else f"{processed}"
+        message = f"已转换 {counts} 页，失败 {len(failed)} 页，{rate:.1f} 页/秒"
+        if chunk_store:
+            message += f"，{reused} 页与之前的页面相同，未重新转换"
+        if progress_callback:
+            progress_callback("replay", percentage, message)
+
+    def collect(result):
+        nonlocal done, reused, last_report
+        name, error, page_metrics, page_reused = result
+        if error:
+            failed.append((name, error))
+        else:
+            done += 1
+            reused += page_reused
+        if page_metrics:
+            instrumentation.merge(page_metrics)
+        now = time.perf_counter()
+        if now - last_report >= 1:
+            last_report = now
+            report()
+
+    if jobs == 1:
+        _init_worker(output_dir, metrics, chunk_store)
+        for page in pages:
+            collect(_convert_page(page))
+    else:
+        import multiprocessing
+
+        # 限制已读出但还没转换的页面数，压缩归档中的页面内容不会在内存中无限堆积
+        window = threading.BoundedSemaphore(jobs * 16)
+
+        def bounded(pages):
+            for page in pages:
+                window.acquire()
+                yield page
+
+        with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(output_dir, metrics, chunk_store)) as pool:
+            for result in pool.imap_unordered(_convert_page, bounded(pages), chunksize=4):
+                window.release()
+                collect(result)
+
+    report(final=True)
+    return done, failed
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+
+"""
+转换结果的全文搜索索引（SQLite FTS5）
+
+用法:
+    python search_index.py index DB 文件或目录...       # 索引Markdown文件（目录中递归查找 *.md）
+    python search_index.py search DB 查询 [--repo owner/repo] [--limit 20]
+    python search_index.py serve DB [--chunk-store FILE]   # 从标准输入逐行读取JSON请求，供server.js调用
+
+每个Markdown文件按标题切分为章节，章节的标题、正文和代码块分别建立索引，
+搜索结果按BM25排序（标题权重最高，其次是代码块）。文件重新写入时只替换该文件的章节，
+索引是增量更新的，查询时不需要读取任何结果文件。
+中文等CJK文字按单字切分后建立索引，查询中连续的汉字按短语匹配。
+指定分块存储时，只有清单 (x.chunks.json) 的结果文件 x.md 从分块存储还原后索引。
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from chunk_store import ChunkStore, result_manifest_path
+
+# 章节三列的BM25权重：标题、正文、代码块
+RANK_WEIGHTS = (10.0, 1.0, 2.0)
+SNIPPET_TOKENS = 24
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+
+# CJK文字和全角标点
+_CJK_CHAR = re.compile("([\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af\uff00-\uffef])")
+# 切分CJK文字时插入的分隔符，分词器把控制字符当作分隔符，去掉后即为原文
+_SEGMENT_SEPARATOR = "\x1f"
+# 摘要中的高亮标记，最后替换为Markdown粗体
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    url TEXT,
+    repo TEXT,
+    mtime REAL,
+    size INTEGER
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS sections USING fts5(
+    heading, body, code, doc UNINDEXED, position UNINDEXED,
+    tokenize = "porter unicode61 remove_diacritics 2"
+);
+"""
+
+
+def _segment(text):
+    """在每个CJK字符两侧插入分隔符，让分词器按单字切分"""
+    return _CJK_CHAR.sub(_SEGMENT_SEPARATOR + r"\1" + _SEGMENT_SEPARATOR, text)
+
+
+def _desegment_snippet(snippet):
+    """去掉 _segment 插入的分隔符，合并相邻的高亮，高亮标记替换为Markdown粗体"""
+    snippet = snippet.replace(_SEGMENT_SEPARATOR, "").replace(_MARK_END + _MARK_START, "")
+    snippet = " ".join(snippet.split())
+    return snippet.replace(_MARK_START, "**").replace(_MARK_END, "**")
+
+
+def split_sections(markdown):
+    """
+    按标题把Markdown切分为章节
+
+    Returns:
+        [(标题, 正文, 代码块)]，第一个标题之前的内容为标题为空的章节
+    """
+    sections = []
+    heading = ""
+    body = []
+    code = []
+    fence = None
+    for line in markdown.split("\n"):
+        match = _FENCE.match(line)
+        if fence:
+            if match and match.group(1) == fence:
+                fence = None
+            else:
+                code.append(line)
+            continue
+        if match:
+            fence = match.group(1)
+            continue
+        match = _HEADING.match(line)
+        if match:
+            if heading or body or code:
+                sections.append((heading, "\n".join(body), "\n".join(code)))
+            heading = match.group(2)
+            body = []
+            code = []
+        elif line.strip():
+            body.append(line)
+    if heading or body or code:
+        sections.append((heading, "\n".join(body), "\n".join(code)))
+    return sections
+
+
+def build_query(text):
+    """
+    把用户输入转换为FTS5查询：每个词作为一个短语（多个词同时出现才匹配），
+    避免输入中的引号、括号、AND/OR等被当作查询语法
+    """
+    terms = []
+    for word in text.split():
+        word = _segment(word).replace('"', " ").strip(_SEGMENT_SEPARATOR + " ")
+        if word:
+            terms.append('"' + word + '"')
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """全文搜索索引，多个进程可以同时读写同一个数据库文件"""
+
+    def __init__(self, path, chunk_store=None):
+        self.path = path
+        self.chunk_store = chunk_store
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        # WAL模式下写入不阻塞其他进程的查询
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.executescript(_SCHEMA)
+            self.db.execute("INSERT INTO sections(sections, rank) VALUES('rank', ?)",
+                            ("bm25(%s, %s, %s)" % RANK_WEIGHTS,))
+
+    def close(self):
+        self.db.close()
+
+    def add_document(self, name, markdown, url=None, repo=None, mtime=None, size=None):
+        """添加或替换一个文档的所有章节，返回章节数"""
+        sections = split_sections(markdown)
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            doc = self._remove(name)
+            if doc is None:
+                doc = self.db.execute(
+                    "INSERT INTO documents(name, url, repo, mtime, size) VALUES(?, ?, ?, ?, ?)",
+                    (name, url, repo, mtime, size)).lastrowid
+            else:
+                self.db.execute("UPDATE documents SET url = ?, repo = ?, mtime = ?, size = ? WHERE id = ?",
+                                (url, repo, mtime, size, doc))
+            self.db.executemany(
+                "INSERT INTO sections(heading, body, code, doc, position) VALUES(?, ?, ?, ?, ?)",
+                ((_segment(heading), _segment(body), _segment(code), doc, position)
+                 for position, (heading, body, code) in enumerate(sections)))
+        return len(sections)
+
+    def add_file(self, path, name=None, url=None, repo=None):
+        """索引一个Markdown文件，文件名默认作为文档名"""
+        source, stats = self._stat(path)
+        if source != path:
+            markdown = self.chunk_store.read_manifest(source)
+        else:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                markdown = f.read()
+        return self.add_document(name or os.path.basename(path), markdown, url=url, repo=repo,
+                                 mtime=stats.st_mtime, size=stats.st_size)
+
+    def _stat(self, path):
+        """
+        返回 (实际读取的文件, stat)。文件不存在但有分块清单时返回清单，
+        清单的修改时间和大小用于判断文件是否修改过
+        """
+        try:
+            return path, os.stat(path)
+        except FileNotFoundError:
+            if self.chunk_store is None:
+                raise
+        manifest_path = result_manifest_path(path)
+        return manifest_path, os.stat(manifest_path)
+
+    def remove_document(self, name):
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self._remove(name)
+            self.db.execute("DELETE FROM documents WHERE name = ?", (name,))
+
+    def _remove(self, name):
+        """删除文档的章节，返回文档ID（不存在时为None）"""
+        row = self.db.execute("SELECT id FROM documents WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("DELETE FROM sections WHERE doc = ?", (row[0],))
+        return row[0]
+
+    def sync(self, directory, files):
+        """
+        让索引与结果目录一致：索引新增或修改过（修改时间或大小不同）的文件，删除已不存在的文件
+
+        Args:
+            directory: 结果目录
+            files: [{"name", "url", "repo"}]，目录中应当被索引的文件
+
+        Returns:
+            (索引的文件数, 删除的文件数)
+        """
+        indexed = {name: (mtime, size) for name, mtime, size
+                   in self.db.execute("SELECT name, mtime, size FROM documents")}
+        added = 0
+        for file in files:
+            path = os.path.join(directory, file["name"])
+            try:
+                stats = self._stat(path)[1]
+            except FileNotFoundError:
+                continue
+            if indexed.pop(file["name"], None) != (stats.st_mtime, stats.st_size):
+                self.add_file(path, name=file["name"], url=file.get("url"), repo=file.get("repo"))
+                added += 1
+        for name in indexed:
+            self.remove_document(name)
+        return added, len(indexed)
+
+    def search(self, query, repo=None, limit=DEFAULT_LIMIT):
+        """
+        搜索章节
+
+        Returns:
+            按相关度排序的章节 [{"name", "url", "repo", "position", "heading", "snippet", "score"}]
+        """
+        match = build_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT d.name, d.url, d.repo, s.position, s.heading, "
+            "snippet(sections, -1, ?, ?, '…', ?), s.rank "
+            "FROM sections s JOIN documents d ON d.id = s.doc "
+            "WHERE sections MATCH ?"
+        )
+        params = [_MARK_START, _MARK_END, SNIPPET_TOKENS, match]
+        if repo:
+            sql += " AND d.repo = ?"
+            params.append(repo)
+        sql += " ORDER BY s.rank LIMIT ?"
+        params.append(max(1, min(limit, MAX_LIMIT)))
+        return [{
+            "name": name,
+            "url": url,
+            "repo": repo,
+            "position": position,
+            "heading": _desegment_snippet(heading),
+            "snippet": _desegment_snippet(snippet),
+            # bm25越小越相关，取反后越大越相关
+            "score": float(f"{-rank:.4g}"),
+        } for name, url, repo, position, heading, snippet, rank in self.db.execute(sql, params)]
+
+    def stats(self):
+        documents = self.db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        sections = self.db.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+        return {"documents": documents, "sections": sections}
+
+
+def serve(index, input=sys.stdin, output=sys.stdout):
+    """
+    逐行处理JSON请求，每个请求输出一行JSON响应（带相同的id）:
+        {"id", "op": "search", "query", "repo", "limit"} -> {"id", "hits", "took"}
+        {"id", "op": "index", "path", "name", "url", "repo"} -> {"id", "sections"}
+        {"id", "op": "remove", "name"} -> {"id"}
+        {"id", "op": "sync", "dir", "files"} -> {"id", "added", "removed"}
+        {"id", "op": "stats"} -> {"id", "documents", "sections"}
+    出错时响应为 {"id", "error"}
+    """
+    for line in input:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            op = request.get("op")
+            start = time.perf_counter()
+            if op == "search":
+                hits = index.search(request.get("query", ""), repo=request.get("repo"),
+                                    limit=int(request.get("limit") or DEFAULT_LIMIT))
+                response = {"hits": hits, "took": round((time.perf_counter() - start) * 1000, 3)}
+            elif op == "index":
+                response = {"sections": index.add_file(request["path"], name=request.get("name"),
+                                                       url=request.get("url"), repo=request.get("repo"))}
+            elif op == "remove":
+                index.remove_document(request["name"])
+                response = {}
+            elif op == "sync":
+                added, removed = index.sync(request["dir"], request.get("files", []))
+                response = {"added": added, "removed": removed}
+            elif op == "stats":
+                response = index.stats()
+            else:
+                raise ValueError(f"未知操作: {op}")
+        except Exception as e:
+            response = {"error": str(e) or type(e).__name__}
+        response["id"] = request_id
+        output.write(json.dumps(response, ensure_ascii=False) + "\n")
+        output.flush()
+
+
+def _markdown_files(paths):
+    """展开命令行中的文件和目录，返回 [(路径, 文档名)]"""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, os.path.basename(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(".md"):
+                    file_path = os.path.join(dirpath, filename)
+                    yield file_path, os.path.relpath(file_path, path).replace(os.sep, "/")
+
+
+def main():
+    """命令行入口点"""
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="转换结果的全文搜索索引")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    index_command = commands.add_parser("index", help="索引Markdown文件")
+    index_command.add_argument("db", help="索引数据库文件")
+    index_command.add_argument("paths", nargs="+", help="Markdown文件或目录")
+    search_command = commands.add_parser("search", help="搜索章节")
+    search_command.add_argument("db", help="索引数据库文件")
+    search_command.add_argument("query", help="查询词")
+    search_command.add_argument("--repo", help="只搜索指定仓库(owner/repo)")
+    search_command.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="最多返回的结果数")
+    serve_command = commands.add_parser("serve", help="从标准输入逐行读取JSON请求")
+    serve_command.add_argument("db", help="索引数据库文件")
+    serve_command.add_argument("--chunk-store", metavar="FILE", help="分块存储，用于读取只有清单的结果文件")
+    args = arg_parser.parse_args()
+
+    chunk_store = ChunkStore(args.chunk_store) if getattr(args, "chunk_store", None) else None
+    index = SearchIndex(args.db, chunk_store=chunk_store)
+    try:
+        if args.command == "index":
+            start = time.perf_counter()
+            documents = sections = 0
+            for path, name in _markdown_files(args.paths):
+                sections += index.add_file(path, name=name)
+                documents += 1
+            print(f"已索引 {documents} 个文件，{sections} 个章节，用时 {time.perf_counter() - start:.1f} 秒")
+        elif args.command == "search":
+            for hit in index.search(args.query, repo=args.repo, limit=args.limit):
+                print(f"{hit['score']:8.2f}  {hit['name']} #{hit['position']}  {hit['heading']}")
+                print(f"          {hit['snippet']}")
+        else:
+            serve(index)
+    finally:
+        index.close()
+        if chunk_store is not None:
+            chunk_store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
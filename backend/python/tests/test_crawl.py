@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+多页Wiki抓取的行为测试：检查点和恢复、章节序号连续
+
+使用替身解析器，页面内容按URL预设，不访问网络。
+运行: python -m pytest backend/python/tests
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from crawl import MANIFEST_NAME, PAGE_SEPARATOR, WikiCrawl, discover_wiki_pages  # noqa: E402
+from instrumentation import Instrumentation  # noqa: E402
+
+BASE = "https://deepwiki.com/owner/repo"
+# 首页中的链接：两个Wiki页面、其他域名的同路径链接、图片和其他仓库
+HOME = (f'<a href="/owner/repo/1-overview">1</a><a href="{BASE}/2-setup#top">2</a>'
+        '<a href="https://github.com/owner/repo/blob">x</a><a href="/owner/repo/logo.png">x</a>'
+        '<a href="/owner/other/1-overview">x</a><a href="/owner/repo/1-overview">dup</a>').encode()
+
+
+class StubParser:
+    """DeepWikiParser 的替身，每个URL按顺序返回预设的 (内容, 状态码)，用完后重复最后一项"""
+
+    def __init__(self, pages):
+        self.pages = {url: list(responses) for url, responses in pages.items()}
+        self.fetched = []
+        self.section_callback = None
+        self.instrumentation = Instrumentation()
+        self.fetcher = None
+        self.lock = threading.Lock()
+
+    def fetch_page(self, url):
+        with self.lock:
+            self.fetched.append(url)
+            responses = self.pages[url]
+            return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    def parse_html_to_markdown(self, html_content):
+        # 每个页面的Markdown为内容中 "|" 之前的页面名
+        return "# " + html_content.decode().split("|")[0]
+
+    def _report_progress(self, stage, percent, message):
+        pass
+
+
+def page(name, html=b""):
+    return (name.encode() + b"|" + html, 200)
+
+
+class WikiCrawlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.directory.name, "task.crawl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def crawl(self, parser, prefetch=0):
+        sections = []
+        parser.section_callback = lambda index, markdown: sections.append((index, markdown))
+        crawl = WikiCrawl(parser, self.checkpoint, max_attempts=2, sleep=lambda delay: None, prefetch=prefetch)
+        markdown, failed = crawl.run(BASE)
+        return markdown, failed, sections
+
+    def pages(self, **overrides):
+        pages = {
+            BASE: [page("home", HOME)],
+            f"{BASE}/1-overview": [page("overview")],
+            f"{BASE}/2-setup": [page("setup")],
+        }
+        pages.update({f"{BASE}/{name.replace('_', '-')}": responses for name, responses in overrides.items()})
+        return pages
+
+    def test_discover_wiki_pages(self):
+        self.assertEqual(discover_wiki_pages(HOME, BASE), [f"{BASE}/1-overview", f"{BASE}/2-setup"])
+
+    def test_pages_joined_in_order(self):
+        for prefetch in (0, 2):
+            with self.subTest(prefetch=prefetch):
+                self.checkpoint = os.path.join(self.directory.name, f"prefetch{prefetch}.crawl")
+                markdown, failed, sections = self.crawl(StubParser(self.pages()), prefetch=prefetch)
+                self.assertEqual(failed, [])
+                self.assertEqual(markdown, PAGE_SEPARATOR.join(["# home", "# overview", "# setup"]))
+                self.assertEqual([index for index, _ in sections], [0, 1, 2])
+                # 按序号拼接章节即为完整的Markdown
+                self.assertEqual("".join(text for _, text in sections), markdown)
+
+    def test_missing_page_keeps_section_numbers_contiguous(self):
+        parser = StubParser(self.pages(**{"1_overview": [(None, 404)]}))
+        markdown, failed, sections = self.crawl(parser)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(markdown, PAGE_SEPARATOR.join(["# home", "# setup"]))
+        self.assertEqual([index for index, _ in sections], [0, 1])
+        self.assertEqual("".join(text for _, text in sections), markdown)
+        # 不存在的页面不重试
+        self.assertEqual(parser.fetched.count(f"{BASE}/1-overview"), 1)
+
+    def test_retry_then_success(self):
+        parser = StubParser(self.pages(**{"2_setup": [(None, 503), page("setup")]}))
+        markdown, failed, _ = self.crawl(parser)
+
+        self.assertEqual(failed, [])
+        self.assertTrue(markdown.endswith("# setup"))
+        self.assertEqual(parser.instrumentation.counters.get("crawl.retries"), 1)
+
+    def test_resume_from_checkpoint(self):
+        # 第一次运行时 2-setup 始终失败：没有完整结果，已完成的页面保存在检查点中
+        parser = StubParser(self.pages(**{"2_setup": [(None, 500)]}))
+        markdown, failed, sections = self.crawl(parser)
+
+        self.assertIsNone(markdown)
+        self.assertEqual(failed, [f"{BASE}/2-setup"])
+        self.assertEqual([index for index, _ in sections], [0, 1])
+        with open(os.path.join(self.checkpoint, MANIFEST_NAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.assertEqual([p["status"] for p in manifest["pages"]], ["done", "done", "failed"])
+        self.assertEqual(manifest["pages"][2]["attempts"], 2)
+
+        # 恢复时只抓取失败的页面，章节序号从头连续
+        parser = StubParser(self.pages())
+        markdown, failed, sections = self.crawl(parser)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(parser.fetched, [f"{BASE}/2-setup"])
+        self.assertEqual(markdown, PAGE_SEPARATOR.join(["# home", "# overview", "# setup"]))
+        self.assertEqual([index for index, _ in sections], [0, 1, 2])
+        self.assertEqual(parser.instrumentation.counters.get("crawl.pages.resumed"), 2)
+
+    def test_resume_refetches_lost_page(self):
+        self.crawl(StubParser(self.pages(**{"2_setup": [(None, 500)]})))
+        os.remove(os.path.join(self.checkpoint, "0001.md"))
+
+        parser = StubParser(self.pages())
+        markdown, failed, _ = self.crawl(parser)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(sorted(parser.fetched), [f"{BASE}/1-overview", f"{BASE}/2-setup"])
+
+    def test_corrupt_manifest_starts_over(self):
+        os.makedirs(self.checkpoint)
+        with open(os.path.join(self.checkpoint, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            f.write("{")
+
+        markdown, failed, _ = self.crawl(StubParser(self.pages()))
+
+        self.assertEqual(failed, [])
+        self.assertTrue(markdown.startswith("# home"))
+
+    def test_checkpoint_of_other_url(self):
+        self.crawl(StubParser(self.pages()))
+        crawl = WikiCrawl(StubParser(self.pages()), self.checkpoint, prefetch=0)
+        with self.assertRaises(ValueError):
+            crawl.run("https://deepwiki.com/owner/other")
+
+
+if __name__ == "__main__":
+    unittest.main()
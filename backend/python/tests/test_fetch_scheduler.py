@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+"""
+抓取调度器的行为测试：对冲请求和被取消的请求、Retry-After、按p95自适应的超时、进程间共享的状态
+
+使用按顺序返回预设响应的替身session，不访问网络。
+运行: python -m pytest backend/python/tests
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from email.utils import formatdate
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from fetch_scheduler import FetchScheduler, parse_retry_after  # noqa: E402
+from instrumentation import Instrumentation  # noqa: E402
+
+HOST = "stub.test"
+URL = f"http://{HOST}/page"
+
+
+class StubResponse:
+    """requests.Response 的替身，响应体分块读出，每块之前等待chunk_delay秒"""
+
+    def __init__(self, status=200, headers=None, chunks=(b"ok",), chunk_delay=0.0):
+        self.status_code = status
+        self.headers = headers or {}
+        self.url = None
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.chunks_read = 0
+        self.closed = threading.Event()
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            if self.closed.is_set():
+                return
+            time.sleep(self.chunk_delay)
+            self.chunks_read += 1
+            yield chunk
+
+    def close(self):
+        self.closed.set()
+
+
+class StubSession:
+    """按顺序返回预设的响应，每项为 (收到响应头前等待的秒数, StubResponse)；用完后重复最后一项"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, stream=False, timeout=None, **kwargs):
+        with self.lock:
+            delay, response = self.responses[min(self.calls, len(self.responses) - 1)]
+            self.calls += 1
+        time.sleep(delay)
+        response.url = url
+        return response
+
+
+def make_scheduler(session, **kwargs):
+    """速率和并发放宽到不影响测试的调度器，退避很短"""
+    options = dict(rate=1000, max_rate=1000, burst=10, concurrency=4, max_concurrency=4, backoff=0.01,
+                   min_samples=10, instrumentation=Instrumentation())
+    options.update(kwargs)
+    return FetchScheduler(session, **options)
+
+
+def add_samples(scheduler, latency, count=10):
+    """预先放入耗时样本，使调度器开始自适应超时和对冲"""
+    with scheduler._cond:
+        scheduler._host(HOST).latencies.extend([latency] * count)
+
+
+class HedgeTest(unittest.TestCase):
+
+    def test_hedge_wins_and_cancels_loser(self):
+        slow = StubResponse(chunks=(b"slow",) * 4, chunk_delay=0.2)
+        fast = StubResponse(chunks=(b"fast",))
+        session = StubSession((0.6, slow), (0, fast))
+        scheduler = make_scheduler(session, min_timeout=5)
+        add_samples(scheduler, 0.05)
+
+        start = time.monotonic()
+        response = scheduler.get(URL, timeout=10)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(response.content, b"fast")
+        self.assertLess(elapsed, 0.5)
+        counters = scheduler.instrumentation.counters
+        self.assertEqual(counters.get("fetch.hedged"), 1)
+        self.assertEqual(counters.get("fetch.hedge_wins"), 1)
+        self.assertEqual(counters.get("fetch.hedge_cancelled"), 1)
+        # 落后的请求立即归还并发空位，收到响应头后最多再读一块就关闭连接
+        self.assertEqual(scheduler._hosts[HOST].in_flight, 0)
+        self.assertTrue(slow.closed.wait(2))
+        time.sleep(0.3)
+        self.assertLessEqual(slow.chunks_read, 1)
+
+    def test_no_hedge_without_samples(self):
+        session = StubSession((0.3, StubResponse()))
+        scheduler = make_scheduler(session)
+
+        response = scheduler.get(URL, timeout=10)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.calls, 1)
+        self.assertNotIn("fetch.hedged", scheduler.instrumentation.counters)
+
+    def test_no_hedge_after_first_byte(self):
+        # 已收到响应头、正在下载响应体的请求不再对冲
+        slow_body = StubResponse(chunks=(b"a", b"b", b"c"), chunk_delay=0.15)
+        session = StubSession((0, slow_body), (0, StubResponse(chunks=(b"hedge",))))
+        scheduler = make_scheduler(session, min_timeout=5)
+        add_samples(scheduler, 0.05)
+
+        response = scheduler.get(URL, timeout=10)
+
+        self.assertEqual(response.content, b"abc")
+        self.assertEqual(session.calls, 1)
+
+    def test_hedge_budget(self):
+        # 对冲请求数不超过请求数的 hedge_budget 加一个
+        session = StubSession((0.3, StubResponse()))
+        scheduler = make_scheduler(session, min_timeout=5, hedge_budget=0)
+        # 样本足够多，慢请求的耗时不会把对冲等待时间推高
+        add_samples(scheduler, 0.05, 40)
+
+        for _ in range(3):
+            scheduler.get(URL, timeout=10)
+
+        counters = scheduler.instrumentation.counters
+        self.assertEqual(counters.get("fetch.hedged"), 1)
+        self.assertEqual(counters.get("fetch.hedge_skipped"), 2)
+
+
+class RetryAfterTest(unittest.TestCase):
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertAlmostEqual(parse_retry_after(formatdate(time.time() + 60, usegmt=True)), 60, delta=2)
+        self.assertEqual(parse_retry_after(formatdate(time.time() - 60, usegmt=True)), 0.0)
+
+    def test_retry_after_pauses_host(self):
+        session = StubSession((0, StubResponse(429, {"Retry-After": "1"})), (0, StubResponse()))
+        scheduler = make_scheduler(session)
+
+        start = time.monotonic()
+        response = scheduler.get(URL, timeout=10)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.calls, 2)
+        self.assertGreaterEqual(elapsed, 0.95)
+        counters = scheduler.instrumentation.counters
+        self.assertEqual(counters.get("fetch.retry_after"), 1)
+        self.assertEqual(counters.get("fetch.retries"), 1)
+        # 限流时速率和并发上限减半，之后的成功请求只加性增加
+        self.assertLess(scheduler._hosts[HOST].limit, 3)
+        self.assertLess(scheduler._hosts[HOST].rate, 501)
+
+    def test_retry_after_blocks_other_requests(self):
+        # 暂停期间发往同一主机的其他请求也要等待
+        session = StubSession((0, StubResponse(503, {"Retry-After": "1"})), (0, StubResponse()))
+        scheduler = make_scheduler(session, max_attempts=1)
+
+        self.assertEqual(scheduler.get(URL, timeout=10).status_code, 503)
+        start = time.monotonic()
+        self.assertEqual(scheduler.get(URL, timeout=10).status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+
+    def test_retry_after_over_limit_returns_response(self):
+        session = StubSession((0, StubResponse(429, {"Retry-After": "60"})), (0, StubResponse()))
+        scheduler = make_scheduler(session, max_retry_after=5)
+
+        start = time.monotonic()
+        response = scheduler.get(URL, timeout=10)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(session.calls, 1)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class AdaptiveTimeoutTest(unittest.TestCase):
+
+    def test_deadlines_follow_p95(self):
+        scheduler = make_scheduler(StubSession((0, StubResponse())), min_timeout=0.1, timeout_multiplier=4)
+        self.assertEqual(scheduler._deadlines(HOST, 30), (30, None))
+
+        add_samples(scheduler, 0.1, 9)
+        add_samples(scheduler, 1.0, 1)
+        timeout, hedge_delay = scheduler._deadlines(HOST, 30)
+        self.assertAlmostEqual(timeout, 4.0)
+        self.assertAlmostEqual(hedge_delay, 1.0)
+        # 不超过调用方给的超时，最后一次尝试使用调用方给的超时
+        self.assertEqual(scheduler._deadlines(HOST, 2)[0], 2)
+        self.assertEqual(scheduler._deadlines(HOST, 30, final=True)[0], 30)
+        # 连续超时后逐次加倍
+        scheduler._hosts[HOST].timeouts = 2
+        self.assertAlmostEqual(scheduler._deadlines(HOST, 30)[0], 16.0)
+
+    def test_timeout_then_retry(self):
+        session = StubSession((1.5, StubResponse(chunks=(b"late",))), (0, StubResponse(chunks=(b"retry",))))
+        scheduler = make_scheduler(session, hedge=False, min_timeout=0.2, max_attempts=2)
+        add_samples(scheduler, 0.05)
+
+        start = time.monotonic()
+        response = scheduler.get(URL, timeout=10)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(response.content, b"retry")
+        self.assertLess(elapsed, 1.2)
+        counters = scheduler.instrumentation.counters
+        self.assertEqual(counters.get("fetch.timeouts"), 1)
+        self.assertEqual(counters.get("fetch.retries"), 1)
+        # 超时的请求以已经等待的时间作为样本，成功的请求记录首字节耗时
+        latencies = list(scheduler._hosts[HOST].latencies)
+        self.assertGreaterEqual(latencies[-2], 0.2)
+        self.assertEqual(scheduler._hosts[HOST].timeouts, 0)
+
+    def test_all_attempts_time_out(self):
+        session = StubSession((0.8, StubResponse()))
+        scheduler = make_scheduler(session, hedge=False, min_timeout=0.1, max_attempts=2)
+        add_samples(scheduler, 0.01)
+
+        with self.assertRaises(TimeoutError):
+            scheduler.get(URL, timeout=0.3)
+        self.assertEqual(scheduler.instrumentation.counters.get("fetch.timeouts"), 2)
+
+    def test_body_download_not_limited_by_adaptive_timeout(self):
+        # 收到响应头后下载响应体只受调用方给的超时限制
+        body = StubResponse(chunks=(b"a", b"b", b"c"), chunk_delay=0.2)
+        session = StubSession((0, body))
+        scheduler = make_scheduler(session, hedge=False, min_timeout=0.1)
+        add_samples(scheduler, 0.01)
+
+        response = scheduler.get(URL, timeout=10)
+
+        self.assertEqual(response.content, b"abc")
+        self.assertNotIn("fetch.timeouts", scheduler.instrumentation.counters)
+
+
+@unittest.skipIf(os.name == "nt", "Windows 不支持文件锁，状态只在进程内共享")
+class SharedStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.directory.name, "fetch_state.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_state(self, record):
+        with open(self.state_file, "w", encoding="utf-8") as f:
+            json.dump({HOST: record}, f)
+
+    def read_state(self):
+        with open(self.state_file, encoding="utf-8") as f:
+            return json.load(f)[HOST]
+
+    def test_retry_after_shared_between_schedulers(self):
+        first = make_scheduler(StubSession((0, StubResponse(429, {"Retry-After": "1"}))), max_attempts=1,
+                               state_file=self.state_file)
+        self.assertEqual(first.get(URL, timeout=10).status_code, 429)
+        self.assertGreater(self.read_state()["blocked_until"], time.time())
+
+        second = make_scheduler(StubSession((0, StubResponse())), state_file=self.state_file)
+        start = time.monotonic()
+        self.assertEqual(second.get(URL, timeout=10).status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.8)
+
+    def test_other_process_in_flight_counts_against_limit(self):
+        # 另一个（仍在运行的）进程占满了并发上限，空位归还后才能发出请求
+        other = str(os.getppid())
+        self.write_state({"limit": 1, "in_flight": {other: 1}})
+        scheduler = make_scheduler(StubSession((0, StubResponse())), state_file=self.state_file)
+
+        def release():
+            # 模拟另一个进程在文件锁内归还空位
+            import fcntl
+            time.sleep(0.5)
+            with open(self.state_file + ".lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                record = self.read_state()
+                record["in_flight"] = {}
+                self.write_state(record)
+
+        thread = threading.Thread(target=release)
+        thread.start()
+        start = time.monotonic()
+        self.assertEqual(scheduler.get(URL, timeout=10).status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+        thread.join()
+        self.assertEqual(self.read_state()["in_flight"], {})
+
+    def test_dead_process_in_flight_ignored(self):
+        # 被终止的进程留下的并发数不再占用空位
+        self.write_state({"limit": 1, "in_flight": {"999999999": 1}})
+        scheduler = make_scheduler(StubSession((0, StubResponse())), state_file=self.state_file)
+
+        start = time.monotonic()
+        self.assertEqual(scheduler.get(URL, timeout=10).status_code, 200)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_latencies_saved_for_next_process(self):
+        scheduler = make_scheduler(StubSession((0, StubResponse())), state_file=self.state_file)
+        for _ in range(3):
+            scheduler.get(URL, timeout=10)
+        scheduler.save_state()
+
+        following = make_scheduler(StubSession((0, StubResponse())), state_file=self.state_file)
+        self.assertEqual(len(following._hosts[HOST].latencies), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
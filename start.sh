@@ -23,6 +23,9 @@ PYTHON_ENV="$PROJECT_ROOT/.conda"
 FRONTEND_PORT=8000
 BACKEND_PORT=3000
 
+# 后端工作进程数，大于1时以集群模式启动（见 backend/nodejs/cluster.js）
+BACKEND_WORKERS=${BACKEND_WORKERS:-1}
+
 # 检查端口是否被占用并释放
 check_and_free_port() {
     local port=$1
@@ -143,10 +146,14 @@ start_backend() {
     export CONDA_PYTHON_PATH="$PYTHON_ENV/bin/python"
     
     # 启动Node.js服务
-    PORT="$BACKEND_PORT" nohup npm start > "$PROJECT_ROOT/backend.log" 2>&1 &
+    if [ "$BACKEND_WORKERS" -gt 1 ]; then
+        PORT="$BACKEND_PORT" CLUSTER_WORKERS="$BACKEND_WORKERS" nohup npm run start:cluster > "$PROJECT_ROOT/backend.log" 2>&1 &
+    else
+        PORT="$BACKEND_PORT" nohup npm start > "$PROJECT_ROOT/backend.log" 2>&1 &
+    fi
     BACKEND_PID=$!
     
-    echo -e "${GREEN}后端服务已在端口 $BACKEND_PORT 启动，PID: $BACKEND_PID${NC}"
+    echo -e "${GREEN}后端服务已在端口 $BACKEND_PORT 启动（$BACKEND_WORKERS 个工作进程），PID: $BACKEND_PID${NC}"
     echo "后端日志: $PROJECT_ROOT/backend.log"
 }
 
@@ -276,6 +283,9 @@ case "$1" in
         echo "  status   - 显示服务状态"
         echo "  build    - 构建前端项目"
         echo ""
+        echo "环境变量:"
+        echo "  BACKEND_WORKERS=4   后端以集群模式启动4个工作进程（默认1）"
+        echo ""
         echo "示例:"
         echo "  $0 start    # 启动所有服务"
         ;;